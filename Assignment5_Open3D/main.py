@@ -1,8 +1,65 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
 import numpy as np
 import open3d as o3d
 
-def show(obj_list, title="View", width=960, height=720, background="White"):
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MESH_PATH = "IronMan/IronMan.obj"
+SAMPLE_POINTS = 50000
+NORMAL_RADIUS = 0.1
+NORMAL_MAX_NN = 30
+POISSON_DEPTH = 9
+VOXEL_SIZE = 0.05
+CLIP_AXIS = 1          # keep points below the plane (Y < CLIP_BELOW)
+CLIP_BELOW = 0.0
+ANIMATION_FRAMES = 12
+BENCHMARK_POINTS = [10000, 100000, 1000000]
+
+# Point cloud cache: the sampled points, normals and colors are stored as .npy
+# files under CLOUD_CACHE_DIR/<key>/, keyed by a hash of the mesh file and the
+# sampling/normal parameters, and opened memory-mapped on the next run. A hit
+# skips parsing the mesh (in headless runs), sampling and normal estimation.
+CLOUD_CACHE_DIR = os.path.join("cache", "clouds")
+CLOUD_ARRAYS = ["points", "normals", "colors"]
+
+# PointIndex grid resolution (average points per cell of the bounding box)
+INDEX_POINTS_PER_CELL = 8
+
+# Tiled mode: the bounding box is split into a grid of tiles processed in a
+# process pool. A Poisson tile also reads TILE_OVERLAP (fraction of the tile
+# size) of its neighbours' points on every side, so seams are reconstructed
+# with context, and its mesh is clipped exactly at the tile faces; the tile
+# solves differ slightly, so the seams are then zipped closed. Voxel tiles are
+# aligned to the global voxel grid and need no overlap: the stitched grid has
+# exactly the voxels of the single-shot one. Tiles are made small enough that
+# the estimated worker memory fits in the memory cap.
+TILE_OVERLAP = 0.15
+TILE_MEMORY_CAP_MB = 1024
+# Worker memory per input point: Poisson at depth 9 (measured on the 1M point
+# benchmark) and voxelization
+POISSON_MB_PER_POINT = 0.0006
+VOXEL_MB_PER_POINT = 0.0001
+# Tile seams: boundary chains of neighbouring tiles on a shared face are zipped
+# together if they are within this many Poisson octree cells of each other
+SEAM_TOLERANCE_CELLS = 4.0
+
+
+def show(obj_list, title="View", width=960, height=720, background="White", headless=False):
+    if headless:
+        return
     if not isinstance(obj_list, list):
         obj_list = [obj_list]
     vis = o3d.visualization.Visualizer()
@@ -28,116 +85,632 @@ def show(obj_list, title="View", width=960, height=720, background="White"):
         vis.destroy_window()
         time.sleep(0.12)
 
-# --- Header ---
-print("Data Visualization Assignment #5 — Open3D Project")
-print("Author: Ziaulhaq Parsa")
-print("Model: IronMan.obj\n")
-
-# ===== Step 1: Load and visualize the model =====
-mesh = o3d.io.read_triangle_mesh("IronMan/IronMan.obj")
-show(mesh, "Step 1: Original Model")
-print("STEP 1: Loading and Visualization")
-print("Vertices:", len(mesh.vertices))
-print("Triangles:", len(mesh.triangles))
-print("Has colors:", mesh.has_vertex_colors())
-print("Has normals:", mesh.has_vertex_normals())
-
-# ===== Step 2: Convert to point cloud (with extra info) =====
-pcd = mesh.sample_points_uniformly(number_of_points=50000)
-# estimate normals for point cloud (needed later and useful to report)
-pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
-
-# bounding box and basic stats
-bbox_pcd = pcd.get_axis_aligned_bounding_box()
-min_bound = bbox_pcd.min_bound
-max_bound = bbox_pcd.max_bound
-extent = bbox_pcd.get_extent()
-
-show(pcd, "Step 2: Point Cloud (sampled)")
-print("\nSTEP 2: Conversion to Point Cloud")
-print("Points:", len(pcd.points))
-print("Has colors:", pcd.has_colors())
-print("Has normals:", pcd.has_normals())
-print("Normals count:", len(pcd.normals))
-print("Point cloud bounding box min:", min_bound)
-print("Point cloud bounding box max:", max_bound)
-print("Point cloud extent (x,y,z):", extent)
-
-# ===== Step 3: Surface reconstruction (Poisson) =====
-# ensure normals are available for Poisson
-if not pcd.has_normals():
-    pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
-mesh_recon, densities = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(pcd, depth=9)
-bbox = mesh_recon.get_axis_aligned_bounding_box()
-mesh_crop = mesh_recon.crop(bbox)
-show(mesh_crop, "Step 3: Surface Reconstruction")
-print("\nSTEP 3: Surface Reconstruction")
-print("Vertices:", len(mesh_crop.vertices))
-print("Triangles:", len(mesh_crop.triangles))
-print("Has colors:", mesh_crop.has_vertex_colors())
-
-# ===== Step 4: Voxelization (with extra info) =====
-voxel_size = 0.05
-voxel_grid = o3d.geometry.VoxelGrid.create_from_point_cloud(pcd, voxel_size=voxel_size)
-show(voxel_grid, "Step 4: Voxelization")
-voxels = voxel_grid.get_voxels()
-print("\nSTEP 4: Voxelization")
-print("Voxel size used:", voxel_size)
-print("Approx. voxels (occupied):", len(voxels))
-# show sample voxel grid indices (first 8) for quick verification
-sample_indices = [v.grid_index for v in voxels[:8]]
-print("Sample voxel grid indices (first 8):", sample_indices)
-# bounding box of voxel grid (constructed from the pcd bbox)
-bbox_vox = voxel_grid.get_axis_aligned_bounding_box()
-print("Voxel grid bounding box min:", bbox_vox.min_bound)
-print("Voxel grid bounding box max:", bbox_vox.max_bound)
-
-# ===== Step 5: Add a plane =====
-plane = o3d.geometry.TriangleMesh.create_box(width=2, height=0.01, depth=2)
-plane.translate((0, -0.5, 0))
-plane.paint_uniform_color([0.7, 0.7, 0.7])  # light gray plane (still visible on dark bg)
-bbox_mesh = mesh_crop.get_axis_aligned_bounding_box()
-bbox_mesh.color = (1, 0, 0)
-show([mesh_crop, plane, bbox_mesh], "Step 5: Plane Added")
-print("\nSTEP 5: Plane Added")
-
-# ===== Step 6: Surface Clipping =====
-points = np.asarray(pcd.points)
-mask = points[:, 1] < 0  # keep points below plane (Y < 0)
-clipped_pcd = o3d.geometry.PointCloud()
-clipped_pcd.points = o3d.utility.Vector3dVector(points[mask])
-# estimate normals for clipped cloud for better visualization later
-if len(clipped_pcd.points) > 0:
-    clipped_pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
-show(clipped_pcd, "Step 6: Clipped Point Cloud")
-print("\nSTEP 6: Surface Clipping")
-print("Remaining vertices:", len(clipped_pcd.points))
-
-# ===== Step 7: Color gradient + extremes =====
-z_vals = np.asarray(clipped_pcd.points)[:, 2] if len(clipped_pcd.points) > 0 else np.array([])
-if z_vals.size > 0:
-    colors = (z_vals - z_vals.min()) / (z_vals.ptp() if z_vals.ptp() != 0 else 1.0)
+
+# ===== Instrumentation =====
+
+def _rss_mb():
+    """Current resident set size in MB (Linux), else the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+    except (OSError, AttributeError):
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class StepTimer:
+    """Wall-clock seconds and memory (RSS after the step, process peak) per pipeline step."""
+
+    def __init__(self):
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start, _rss_mb(), _peak_rss_mb()))
+
+    def report(self):
+        print(f"{'step':<14} {'seconds':>9} {'rss MB':>9} {'peak MB':>9}")
+        for name, seconds, rss, peak in self.steps:
+            print(f"{name:<14} {seconds:9.3f} {rss:9.1f} {peak:9.1f}")
+        print(f"{'total':<14} {sum(s[1] for s in self.steps):9.3f}")
+
+
+# ===== Pipeline steps =====
+
+def sample_point_cloud(mesh, number_of_points=SAMPLE_POINTS):
+    return mesh.sample_points_uniformly(number_of_points=number_of_points)
+
+
+def estimate_normals(pcd, radius=NORMAL_RADIUS, max_nn=NORMAL_MAX_NN):
+    # Estimated once on the full cloud; Poisson and the clipped cloud reuse them
+    pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=radius, max_nn=max_nn))
+
+
+def cloud_cache_key(mesh_path, number_of_points, radius=NORMAL_RADIUS, max_nn=NORMAL_MAX_NN):
+    h = hashlib.sha256()
+    with open(mesh_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    params = {"points": number_of_points, "radius": radius, "max_nn": max_nn, "open3d": o3d.__version__}
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def load_cached_cloud(key):
+    """({name: memory-mapped array}, mesh stats) or None on a miss. The maps are
+    copy-on-write: Open3D needs writeable arrays, and the files stay unchanged."""
+    folder = os.path.join(CLOUD_CACHE_DIR, key)
+    try:
+        with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="c")
+                  for name in meta["arrays"]}
+    except (OSError, ValueError, KeyError):
+        return None
+    return arrays, meta["mesh"]
+
+
+def save_cached_cloud(key, pcd, mesh_stats):
+    """Write the cloud's arrays to a temporary folder, then rename it into place."""
+    folder = os.path.join(CLOUD_CACHE_DIR, key)
+    tmp_folder = f"{folder}.tmp{os.getpid()}"
+    os.makedirs(tmp_folder, exist_ok=True)
+    arrays = {"points": pcd.points, "normals": pcd.normals if pcd.has_normals() else None,
+              "colors": pcd.colors if pcd.has_colors() else None}
+    saved = []
+    for name in CLOUD_ARRAYS:
+        if arrays[name] is not None:
+            np.save(os.path.join(tmp_folder, f"{name}.npy"), np.asarray(arrays[name]))
+            saved.append(name)
+    with open(os.path.join(tmp_folder, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"arrays": saved, "mesh": mesh_stats}, f)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+
+
+def cloud_from_arrays(arrays):
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(arrays["points"]))
+    if "normals" in arrays:
+        pcd.normals = o3d.utility.Vector3dVector(arrays["normals"])
+    if "colors" in arrays:
+        pcd.colors = o3d.utility.Vector3dVector(arrays["colors"])
+    return pcd
+
+
+def mesh_stats(mesh):
+    return {"vertices": len(mesh.vertices), "triangles": len(mesh.triangles),
+            "has_colors": mesh.has_vertex_colors(), "has_normals": mesh.has_vertex_normals()}
+
+
+def reconstruct_surface(pcd, depth=POISSON_DEPTH):
+    mesh_recon, densities = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(pcd, depth=depth)
+    bbox = mesh_recon.get_axis_aligned_bounding_box()
+    return mesh_recon.crop(bbox)
+
+
+def voxelize(pcd, voxel_size=VOXEL_SIZE):
+    return o3d.geometry.VoxelGrid.create_from_point_cloud(pcd, voxel_size=voxel_size)
+
+
+def plan_tiles(points, memory_cap_mb=TILE_MEMORY_CAP_MB, workers=None, mb_per_point=POISSON_MB_PER_POINT,
+               overlap=TILE_OVERLAP):
+    """Split the bounding box into a grid of tiles whose estimated memory fits
+    the cap, halving the longest tile axis until the fullest tile (with its
+    overlap) fits, and run only as many workers as fit the cap together.
+    Returns (min bound, tile size, tiles per axis, workers)."""
+    min_bound, max_bound = points.min(axis=0), points.max(axis=0)
+    extent = np.maximum(max_bound - min_bound, 1e-9)
+    splits = np.ones(3, dtype=int)
+    while True:
+        size = extent / splits
+        cells = np.minimum(((points - min_bound) / size).astype(int), splits - 1)
+        counts = np.bincount(np.ravel_multi_index(cells.T, splits), minlength=int(splits.prod()))
+        tile_mb = counts.max() * (1 + 2 * overlap) ** 3 * mb_per_point
+        if tile_mb <= memory_cap_mb or counts.max() <= 1000:
+            break
+        splits[np.argmax(size)] *= 2
+    workers = workers or os.cpu_count() or 1
+    workers = int(max(1, min(workers, memory_cap_mb // max(tile_mb, 1e-9), (counts > 0).sum())))
+    return min_bound, size, splits, workers
+
+
+def _tiles(min_bound, size, splits):
+    for index in np.ndindex(*splits):
+        lo = min_bound + np.array(index) * size
+        yield index, lo, lo + size
+
+
+def clip_mesh(vertices, triangles, axis, value, keep_below):
+    """Clip a triangle mesh at the plane coordinate[axis] == value, keeping the
+    side below (or above) it. Triangles crossing the plane are split; the new
+    vertices lie exactly on the plane and are shared along each cut edge."""
+    side = vertices[:, axis] - value
+    inside = (side <= 0) if keep_below else (side >= 0)
+    count = inside[triangles].sum(axis=1)
+    kept = [triangles[count == 3]]
+    mixed = triangles[(count == 1) | (count == 2)]
+    if not len(mixed):
+        return _drop_unused(vertices, kept[0])
+    mixed_in = inside[mixed]
+    mixed_count = mixed_in.sum(axis=1)
+    # Rotate (keeps orientation) so the lone vertex comes first: the inside one
+    # for one-in triangles, the outside one for two-in triangles
+    lone = np.where(mixed_count == 1, np.argmax(mixed_in, axis=1), np.argmin(mixed_in, axis=1))
+    rolled = mixed[np.arange(len(mixed))[:, None], (lone[:, None] + np.arange(3)) % 3]
+    a, b, c = rolled.T
+
+    # One new vertex per cut edge, shared by the triangles on both sides of it
+    edges = np.sort(np.concatenate([np.stack([a, b], axis=1), np.stack([a, c], axis=1)]), axis=1)
+    unique, inverse = np.unique(edges, axis=0, return_inverse=True)
+    p, q = vertices[unique[:, 0]], vertices[unique[:, 1]]
+    t = (value - p[:, axis]) / (q[:, axis] - p[:, axis])
+    cut = p + t[:, None] * (q - p)
+    cut[:, axis] = value
+    ab, ac = len(vertices) + inverse.reshape(2, -1)
+    vertices = np.concatenate([vertices, cut])
+
+    one_in = mixed_count == 1
+    kept.append(np.stack([a, ab, ac], axis=1)[one_in])
+    two_in = ~one_in  # a is outside: keep the quad (b, c, ac, ab)
+    kept.append(np.stack([b, c, ac], axis=1)[two_in])
+    kept.append(np.stack([b, ac, ab], axis=1)[two_in])
+    return _drop_unused(vertices, np.concatenate(kept))
+
+
+def _drop_unused(vertices, triangles):
+    used, triangles = np.unique(triangles, return_inverse=True)
+    return vertices[used], triangles.reshape(-1, 3)
+
+
+def _poisson_tile(points, normals, core_min, core_max, depth):
+    """Worker: Poisson over a tile plus its overlap, clipped exactly to the
+    tile [core_min, core_max] (infinite bounds are not clipped)."""
+    start_rss = _rss_mb()
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+    pcd.normals = o3d.utility.Vector3dVector(normals)
+    mesh, _ = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(pcd, depth=depth)
+    vertices, triangles = np.asarray(mesh.vertices), np.asarray(mesh.triangles)
+    for axis in range(3):
+        if np.isfinite(core_min[axis]):
+            vertices, triangles = clip_mesh(vertices, triangles, axis, core_min[axis], keep_below=False)
+        if np.isfinite(core_max[axis]):
+            vertices, triangles = clip_mesh(vertices, triangles, axis, core_max[axis], keep_below=True)
+    return vertices, triangles, _peak_rss_mb() - start_rss
+
+
+def boundary_edges(triangles, directed=False):
+    """Edges used by only one triangle: (n, 2) vertex index pairs. directed=True
+    keeps them in the direction their triangle runs them."""
+    edges = np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]])
+    unique, inverse, counts = np.unique(np.sort(edges, axis=1), axis=0, return_inverse=True, return_counts=True)
+    return edges[counts[inverse.ravel()] == 1] if directed else unique[counts == 1]
+
+
+def _boundary_chains(edges):
+    """Split directed boundary edges into vertex chains, breaking them where
+    the boundary branches; closed loops repeat their first vertex."""
+    following = {}
+    for u, v in edges.tolist():
+        following.setdefault(u, []).append(v)
+    out_degree = {u: len(vs) for u, vs in following.items()}
+    in_degree = {}
+    for v in edges[:, 1].tolist():
+        in_degree[v] = in_degree.get(v, 0) + 1
+    junctions = {v for v in set(out_degree) | set(in_degree)
+                 if out_degree.get(v, 0) != 1 or in_degree.get(v, 0) != 1}
+    chains = []
+    for start in [v for v in following if v in junctions] + list(following):
+        while following.get(start):
+            chain = [start, following[start].pop()]
+            while chain[-1] not in junctions and chain[-1] != start and following.get(chain[-1]):
+                chain.append(following[chain[-1]].pop())
+            chains.append(chain)
+    return chains
+
+
+def _zipper(a, b, vertices):
+    """Triangles closing the strip between chains a and b, which run side by
+    side from a[0]/b[0] to a[-1]/b[-1]. Greedy: always add the shorter rung."""
+    triangles, i, j = [], 0, 0
+    while i < len(a) - 1 or j < len(b) - 1:
+        advance_a = j == len(b) - 1 or (
+            i < len(a) - 1 and np.linalg.norm(vertices[a[i + 1]] - vertices[b[j]])
+            <= np.linalg.norm(vertices[a[i]] - vertices[b[j + 1]]))
+        if advance_a:
+            triangles.append((a[i + 1], a[i], b[j]))
+            i += 1
+        else:
+            triangles.append((a[i], b[j], b[j + 1]))
+            j += 1
+    return triangles
+
+
+def _seam_runs(chain, upper, vertices, tolerance, jump=4):
+    """Split a chain from below a seam into runs whose vertices follow one
+    upper chain: each vertex is within `tolerance` of that chain, and the
+    nearest upper vertices move along it without jumping. Yields (run, stretch
+    of the upper chain in the same direction as the run)."""
+    owners = [(c, p) for c, up in enumerate(upper) for p in range(len(up) - (up[0] == up[-1]))]
+    ids = np.array([upper[c][p] for c, p in owners])
+    distance = np.linalg.norm(vertices[chain][:, None] - vertices[ids][None], axis=2)
+    nearest = [owners[k] for k in distance.argmin(axis=1)]
+    near = distance.min(axis=1) < tolerance
+
+    def follows(previous, current):
+        (c0, p0), (c1, p1) = previous, current
+        step, up = p1 - p0, upper[c1]
+        if up[0] == up[-1]:
+            step = (step + (len(up) - 1) // 2) % (len(up) - 1) - (len(up) - 1) // 2
+        return c0 == c1 and abs(step) <= jump
+
+    runs, run = [], []
+    for i in range(len(chain)):
+        if near[i] and run and follows(nearest[run[-1]], nearest[i]):
+            run.append(i)
+        else:
+            runs.append(run)
+            run = [i] if near[i] else []
+    runs.append(run)
+    for run in runs:
+        if len(run) < 2:
+            continue
+        # The upper tile runs its boundary the other way along the seam
+        up = upper[nearest[run[0]][0]]
+        first, last = nearest[run[0]][1], nearest[run[-1]][1]
+        if up[0] == up[-1]:
+            n = len(up) - 1
+            stretch = [up[(last + s) % n] for s in range((first - last) % n + 1)]
+        elif first >= last:
+            stretch = up[last:first + 1]
+        else:
+            continue
+        yield [chain[i] for i in run], stretch[::-1]
+
+
+def _zip_seams(vertices, triangles, tile_of_vertex, tile_cells, faces, tolerance):
+    """Close the seams between tiles clipped at shared faces. faces: per axis,
+    the coordinates of the inner tile faces; tile_cells: the grid index of
+    each tile. On every face, the open boundary of the tiles below it is
+    zipped to the boundary of the tiles above it wherever the two run within
+    `tolerance` of each other."""
+    edges = boundary_edges(triangles, directed=True)
+    added = []
+    for axis, coords in enumerate(faces):
+        for face, value in enumerate(coords):
+            on_face = np.all(vertices[edges][:, :, axis] == value, axis=1)
+            lower, upper = [], []
+            for chain in _boundary_chains(edges[on_face]):
+                below = tile_cells[tile_of_vertex[chain[0]]][axis] == face
+                (lower if below else upper).append(chain)
+            if not upper:
+                continue
+            for chain in lower:
+                if chain[0] == chain[-1]:
+                    chain = chain[:-1]
+                for run, stretch in _seam_runs(chain, upper, vertices, tolerance):
+                    added += _zipper(run, stretch, vertices)
+    if added:
+        triangles = np.concatenate([triangles, np.array(added, dtype=triangles.dtype)])
+    return triangles
+
+
+def reconstruct_surface_tiled(pcd, depth=POISSON_DEPTH, memory_cap_mb=TILE_MEMORY_CAP_MB, workers=None,
+                              overlap=TILE_OVERLAP):
+    """Poisson reconstruction per overlapping tile in a process pool, stitched
+    into one mesh. Each tile's mesh is clipped exactly at its tile faces, and
+    the open boundaries that neighbouring tiles leave on a shared face are
+    zipped together with a strip of triangles. The octree depth is lowered by
+    log2 of the tiles per axis to keep the resolution of the single-shot
+    reconstruction. Returns (mesh, stats)."""
+    points, normals = np.asarray(pcd.points), np.asarray(pcd.normals)
+    min_bound, size, splits, workers = plan_tiles(points, memory_cap_mb, workers, overlap=overlap)
+    tile_depth = max(depth - int(math.ceil(math.log2(splits.max()))), 4)
+    margin = size * overlap
+    # Open3D's Poisson octree spans 1.1x the largest extent of its input
+    cell = 1.1 * float((size + 2 * margin).max()) / 2 ** tile_depth
+    faces = [min_bound[axis] + size[axis] * np.arange(1, splits[axis]) for axis in range(3)]
+    vertices, triangles, tile_of_vertex, tile_cells, peaks = [], [], [], [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for index, lo, hi in _tiles(min_bound, size, splits):
+            sel = np.all((points >= lo - margin) & (points <= hi + margin), axis=1)
+            if sel.sum() >= 10:  # Poisson needs a handful of points
+                # Clip only at inner faces, with the exact coordinates the seams use
+                index = np.array(index)
+                core_min = np.array([faces[axis][index[axis] - 1] if index[axis] else -np.inf for axis in range(3)])
+                core_max = np.array([faces[axis][index[axis]] if index[axis] < splits[axis] - 1 else np.inf
+                                     for axis in range(3)])
+                futures.append(pool.submit(_poisson_tile, points[sel], normals[sel], core_min, core_max,
+                                           tile_depth))
+                tile_cells.append(index)
+        offset = 0
+        for tile, future in enumerate(futures):
+            tile_vertices, tile_triangles, peak = future.result()
+            vertices.append(tile_vertices)
+            triangles.append(tile_triangles + offset)
+            tile_of_vertex.append(np.full(len(tile_vertices), tile))
+            offset += len(tile_vertices)
+            peaks.append(peak)
+    vertices, triangles = np.concatenate(vertices), np.concatenate(triangles)
+    open_before = len(boundary_edges(triangles))
+    triangles = _zip_seams(vertices, triangles, np.concatenate(tile_of_vertex), tile_cells, faces,
+                           cell * SEAM_TOLERANCE_CELLS)
+    mesh = o3d.geometry.TriangleMesh(o3d.utility.Vector3dVector(vertices), o3d.utility.Vector3iVector(triangles))
+    mesh.remove_degenerate_triangles()
+    mesh.remove_duplicated_triangles()
+    return mesh, {"tiles": len(peaks), "grid": tuple(int(n) for n in splits), "workers": workers,
+                  "depth": tile_depth, "worker_mb": max(peaks, default=0.0),
+                  "open_edges_before_stitch": open_before,
+                  "open_edges": len(boundary_edges(np.asarray(mesh.triangles)))}
+
+
+def _voxel_tile(points, colors, origin, voxel_size):
+    """Worker: global grid indices and colors of the voxels occupied by a tile's points."""
+    start_rss = _rss_mb()
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+    if colors is not None:
+        pcd.colors = o3d.utility.Vector3dVector(colors)
+    upper = origin + (np.floor((points.max(axis=0) - origin) / voxel_size) + 2) * voxel_size
+    grid = o3d.geometry.VoxelGrid.create_from_point_cloud_within_bounds(pcd, voxel_size, origin, upper)
+    voxels = grid.get_voxels()
+    indices = np.array([v.grid_index for v in voxels], dtype=np.int64).reshape(-1, 3)
+    voxel_colors = np.array([v.color for v in voxels], dtype=np.float64).reshape(-1, 3)
+    return indices, voxel_colors, _peak_rss_mb() - start_rss
+
+
+def voxelize_tiled(pcd, voxel_size=VOXEL_SIZE, memory_cap_mb=TILE_MEMORY_CAP_MB, workers=None):
+    """Voxelization per tile in a process pool, stitched into one VoxelGrid with
+    the same origin as VoxelGrid.create_from_point_cloud. Returns (grid, stats)."""
+    points = np.asarray(pcd.points)
+    colors = np.asarray(pcd.colors) if pcd.has_colors() else None
+    # Same origin as the single-shot grid: min bound minus half a voxel
+    origin = points.min(axis=0) - voxel_size * 0.5
+    upper = points.max(axis=0) + voxel_size * 0.5
+    _, size, splits, workers = plan_tiles(points, memory_cap_mb, workers, VOXEL_MB_PER_POINT, overlap=0)
+    # Snap tile edges to voxel boundaries so every voxel belongs to exactly one tile
+    cells = np.floor((points - origin) / voxel_size).astype(np.int64)
+    cells_per_tile = np.maximum(np.ceil(size / voxel_size).astype(np.int64), 1)
+    tile_of = np.minimum(cells // cells_per_tile, splits - 1)
+    tile_ids = np.ravel_multi_index(tile_of.T, splits)
+    order = np.argsort(tile_ids, kind="stable")
+    bounds = np.searchsorted(tile_ids[order], np.arange(int(splits.prod()) + 1))
+
+    indices, voxel_colors, peaks = [], [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_voxel_tile, points[order[a:b]], None if colors is None else colors[order[a:b]],
+                               origin, voxel_size)
+                   for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        for future in futures:
+            tile_indices, tile_colors, peak = future.result()
+            indices.append(tile_indices)
+            voxel_colors.append(tile_colors)
+            peaks.append(peak)
+
+    # One point per voxel center rebuilds the grid with the same origin
+    indices = np.concatenate(indices)
+    centers = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(origin + (indices + 0.5) * voxel_size))
+    if colors is not None:
+        centers.colors = o3d.utility.Vector3dVector(np.concatenate(voxel_colors))
+    grid = o3d.geometry.VoxelGrid.create_from_point_cloud_within_bounds(centers, voxel_size, origin, upper)
+    return grid, {"tiles": len(peaks), "grid": tuple(int(n) for n in splits), "workers": workers,
+                  "worker_mb": max(peaks, default=0.0)}
+
+
+def _single_shot(step, points, normals):
+    """Worker: single-shot Poisson or voxelization; (count, surface area, open edges, memory growth MB)."""
+    start_rss = _rss_mb()
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+    pcd.normals = o3d.utility.Vector3dVector(normals)
+    if step == "poisson":
+        mesh = reconstruct_surface(pcd)
+        return (len(mesh.triangles), mesh.get_surface_area(), len(boundary_edges(np.asarray(mesh.triangles))),
+                _peak_rss_mb() - start_rss)
+    return len(voxelize(pcd).get_voxels()), None, None, _peak_rss_mb() - start_rss
+
+
+def compare_tiling(pcd, memory_cap_mb=TILE_MEMORY_CAP_MB, workers=None):
+    """Single-shot vs tiled Poisson and voxelization: counts, surface area,
+    open (boundary) edges, time and worker memory. Tile seams that were not
+    closed show up as extra open edges. The single-shot runs also happen in a
+    worker process, so the memory columns measure the same thing (growth over
+    the worker's start)."""
+    points, normals = np.asarray(pcd.points), np.asarray(pcd.normals)
+    rows = []
+    for step, tiled_run in (("poisson", reconstruct_surface_tiled), ("voxelize", voxelize_tiled)):
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            count, area, open_edges, memory = pool.submit(_single_shot, step, points, normals).result()
+        rows.append((step, "single", time.perf_counter() - start, count, area, open_edges, memory, ""))
+
+        start = time.perf_counter()
+        result, stats = tiled_run(pcd, memory_cap_mb=memory_cap_mb, workers=workers)
+        count = len(result.triangles) if step == "poisson" else len(result.get_voxels())
+        area = result.get_surface_area() if step == "poisson" else None
+        note = f"{stats['tiles']} tiles {stats['grid']}"
+        if "depth" in stats:
+            note += (f", depth {stats['depth']}, {stats['open_edges_before_stitch']} open edges "
+                     f"before stitching")
+        rows.append((step, "tiled", time.perf_counter() - start, count, area, stats.get("open_edges"),
+                     stats["worker_mb"], f"{note}, {stats['workers']} workers"))
+
+    print("\n=== SINGLE-SHOT vs TILED ===")
+    print(f"{'step':<10} {'mode':<7} {'seconds':>9} {'count':>10} {'area':>9} {'open edges':>11} {'worker MB':>10}")
+    for step, mode, seconds, count, area, open_edges, memory, note in rows:
+        area_text = f"{area:9.3f}" if area is not None else f"{'-':>9}"
+        edges_text = f"{open_edges:11d}" if open_edges is not None else f"{'-':>11}"
+        print(f"{step:<10} {mode:<7} {seconds:9.3f} {count:10d} {area_text} {edges_text} {memory:10.1f}  {note}")
+    return rows
+
+
+def make_plane(mesh_crop):
+    plane = o3d.geometry.TriangleMesh.create_box(width=2, height=0.01, depth=2)
+    plane.translate((0, -0.5, 0))
+    plane.paint_uniform_color([0.7, 0.7, 0.7])  # light gray plane (still visible on dark bg)
+    bbox_mesh = mesh_crop.get_axis_aligned_bounding_box()
+    bbox_mesh.color = (1, 0, 0)
+    return plane, bbox_mesh
+
+
+class PointIndex:
+    """Spatial index over an (N, 3) point array, built once.
+
+    Two structures are kept: the sort order of each axis, and the points
+    bucketed into a uniform grid of about INDEX_POINTS_PER_CELL points per
+    cell (a counting sort by cell id). An axis-aligned half-space query is a
+    binary search and returns a slice of that axis's order (a view, nothing
+    is copied). Box and radius queries gather the grid cells overlapping the
+    box, or the thinnest axis slab when that is smaller, and only test those
+    points, so their cost follows the size of the query region rather than N.
+    """
+
+    def __init__(self, points, points_per_cell=None):
+        self.points = np.asarray(points)
+        self.order = [np.argsort(self.points[:, axis], kind="stable") for axis in range(3)]
+        self.sorted = [self.points[order, axis] for axis, order in enumerate(self.order)]
+
+        points_per_cell = points_per_cell or INDEX_POINTS_PER_CELL
+        self.min_bound = self.points.min(axis=0)
+        extent = np.maximum(self.points.max(axis=0) - self.min_bound, 1e-9)
+        # Cubic cells holding points_per_cell on average. Axes thinner than a
+        # cell (a flat or linear cloud) get a single cell and the size comes
+        # from the other axes, so the grid has about N / points_per_cell cells
+        spanned = np.ones(3, dtype=bool)
+        while True:
+            volume = extent[spanned].prod() * points_per_cell / max(len(self.points), 1)
+            self.cell_size = float(volume ** (1 / spanned.sum()))
+            thin = spanned & (extent < self.cell_size)
+            if not thin.any() or thin.sum() == spanned.sum():
+                break
+            spanned &= ~thin
+        self.cells = np.maximum(np.ceil(extent / self.cell_size).astype(np.int64), 1)
+        cell_ids = np.ravel_multi_index(self._cell_of(self.points).T, self.cells)
+        self.cell_order = np.argsort(cell_ids, kind="stable")
+        self.cell_start = np.concatenate(([0], np.cumsum(np.bincount(cell_ids, minlength=int(self.cells.prod())))))
+
+    def _cell_of(self, points):
+        return np.clip(((points - self.min_bound) / self.cell_size).astype(np.int64), 0, self.cells - 1)
+
+    def halfspace(self, axis, below=None, above=None):
+        """Indices with coordinate `axis` < below, or > above."""
+        if below is not None:
+            return self.order[axis][:np.searchsorted(self.sorted[axis], below, side="left")]
+        return self.order[axis][np.searchsorted(self.sorted[axis], above, side="right"):]
+
+    def _grid_candidates(self, first_cell, last_cell):
+        ranges = [np.arange(lo, hi + 1) for lo, hi in zip(first_cell, last_cell)]
+        ids = np.ravel_multi_index(np.meshgrid(*ranges, indexing="ij"), self.cells).ravel()
+        starts, lengths = self.cell_start[ids], self.cell_start[ids + 1] - self.cell_start[ids]
+        # Concatenate the cells' runs of cell_order without a Python loop
+        positions = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.cell_order[positions]
+
+    def box(self, min_bound, max_bound):
+        """Indices inside the closed box [min_bound, max_bound]."""
+        min_bound, max_bound = np.asarray(min_bound, dtype=float), np.asarray(max_bound, dtype=float)
+        slabs = [(np.searchsorted(self.sorted[axis], min_bound[axis], side="left"),
+                  np.searchsorted(self.sorted[axis], max_bound[axis], side="right")) for axis in range(3)]
+        axis = min(range(3), key=lambda ax: slabs[ax][1] - slabs[ax][0])
+        first_cell, last_cell = self._cell_of(min_bound[None])[0], self._cell_of(max_bound[None])[0]
+        if np.prod(last_cell - first_cell + 1) < slabs[axis][1] - slabs[axis][0]:
+            candidates = self._grid_candidates(first_cell, last_cell)
+        else:
+            candidates = self.order[axis][slabs[axis][0]:slabs[axis][1]]
+        points = self.points[candidates]
+        return candidates[np.all((points >= min_bound) & (points <= max_bound), axis=1)]
+
+    def radius(self, center, radius):
+        """Indices within `radius` of `center`."""
+        center = np.asarray(center, dtype=float)
+        candidates = self.box(center - radius, center + radius)
+        offsets = self.points[candidates] - center
+        return candidates[np.einsum("ij,ij->i", offsets, offsets) <= radius * radius]
+
+
+def clip_point_cloud(pcd, axis=CLIP_AXIS, below=CLIP_BELOW, index=None):
+    """Points with coordinate `axis` < `below`; select_by_index keeps their normals.
+    With a PointIndex the points are found by binary search instead of a mask."""
+    if index is not None:
+        return pcd.select_by_index(index.halfspace(axis, below=below))
+    points = np.asarray(pcd.points)
+    return pcd.select_by_index(np.flatnonzero(points[:, axis] < below))
+
+
+def benchmark_index(points, queries=200, seed=0):
+    """Time PointIndex queries against boolean masks on the same random queries."""
+    rng = np.random.default_rng(seed)
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    extent = hi - lo
+    start = time.perf_counter()
+    index = PointIndex(points)
+    build = time.perf_counter() - start
+
+    planes = [(int(axis), float(rng.uniform(lo[axis], hi[axis]))) for axis in rng.integers(3, size=queries)]
+    boxes = [(corner, corner + extent * 0.05) for corner in rng.uniform(lo, hi - extent * 0.05, (queries, 3))]
+    spheres = [(center, float(extent.min()) * 0.05) for center in points[rng.integers(len(points), size=queries)]]
+    cases = [
+        ("halfspace", planes,
+         lambda q: np.flatnonzero(points[:, q[0]] < q[1]), lambda q: index.halfspace(q[0], below=q[1])),
+        ("box", boxes,
+         lambda q: np.flatnonzero(np.all((points >= q[0]) & (points <= q[1]), axis=1)), lambda q: index.box(*q)),
+        ("radius", spheres,
+         lambda q: np.flatnonzero(((points - q[0]) ** 2).sum(axis=1) <= q[1] ** 2), lambda q: index.radius(*q)),
+    ]
+    print(f"\n=== SPATIAL INDEX: {len(points)} points, {queries} queries per type ===")
+    index_mb = sum(a.nbytes for a in index.order + index.sorted + [index.cell_order, index.cell_start]) / 1024 / 1024
+    print(f"Index build: {build:.3f}s ({index_mb:.0f} MB, grid {tuple(int(n) for n in index.cells)})")
+    print(f"{'query':<10} {'mask ms':>9} {'index ms':>9} {'speedup':>8} {'avg hits':>10}")
+    results = {}
+    for name, params, by_mask, by_index in cases:
+        timings = []
+        for query in (by_mask, by_index):
+            start = time.perf_counter()
+            hits = [query(q) for q in params]
+            timings.append((time.perf_counter() - start) / len(params) * 1000)
+        # Same points either way (the index returns them in axis order)
+        assert all(np.array_equal(np.sort(by_index(q)), by_mask(q)) for q in params[:5])
+        print(f"{name:<10} {timings[0]:9.3f} {timings[1]:9.3f} {timings[0] / timings[1]:7.0f}x "
+              f"{np.mean([len(h) for h in hits]):10.0f}")
+        results[name] = timings
+    return build, results
+
+
+def color_gradient(clipped_pcd):
+    """Color by Z and return (gradient in [0, 1], min point, max point)."""
+    z_vals = np.asarray(clipped_pcd.points)[:, 2]
+    span = np.ptp(z_vals)
+    colors = (z_vals - z_vals.min()) / (span if span != 0 else 1.0)
     clipped_pcd.colors = o3d.utility.Vector3dVector(np.c_[colors, 0.5 * colors, 1 - colors])
-    min_idx = np.argmin(z_vals)
-    max_idx = np.argmax(z_vals)
-    min_point = np.asarray(clipped_pcd.points)[min_idx]
-    max_point = np.asarray(clipped_pcd.points)[max_idx]
-    sphere_min = o3d.geometry.TriangleMesh.create_sphere(radius=0.05)
-    sphere_min.translate(min_point)
-    sphere_min.paint_uniform_color([1, 0, 0])
-    sphere_max = o3d.geometry.TriangleMesh.create_sphere(radius=0.05)
-    sphere_max.translate(max_point)
-    sphere_max.paint_uniform_color([0, 1, 0])
-    show([clipped_pcd, sphere_min, sphere_max], "Step 7: Gradient and Extremes")
-    print("\nSTEP 7: Color and Extremes")
-    print("Min point (Z):", min_point)
-    print("Max point (Z):", max_point)
-else:
-    print("\nSTEP 7: No points in clipped cloud to compute gradient/extrema.")
-
-# ===== Bonus: Animated color gradient (single window update, lighting off) =====
-print("\nBONUS: Animated gradient (visual effect)")
-if len(clipped_pcd.points) > 0:
+    points = np.asarray(clipped_pcd.points)
+    return colors, points[np.argmin(z_vals)].copy(), points[np.argmax(z_vals)].copy()
+
+
+def animate_gradient(clipped_pcd, colors, frames=ANIMATION_FRAMES, vis=None):
+    """Fade the gradient over `frames` frames, writing into the cloud's color
+    buffer in place (np.asarray on a Vector3dVector is a view). With vis=None
+    only the color updates run, which is what the headless benchmark times."""
+    color_view = np.asarray(clipped_pcd.colors)
+    for i in np.linspace(0, 1, frames):
+        np.multiply(colors, i, out=color_view[:, 0])
+        np.subtract(1, color_view[:, 0], out=color_view[:, 2])
+        if vis is not None:
+            vis.update_geometry(clipped_pcd)
+            vis.poll_events()
+            vis.update_renderer()
+            time.sleep(0.12)
+
+
+def show_animation(clipped_pcd, colors):
     vis = o3d.visualization.Visualizer()
     vis.create_window(window_name="Bonus Animation", width=960, height=720)
     try:
@@ -149,30 +722,221 @@ if len(clipped_pcd.points) > 0:
             opt.point_size = 2.0
         except Exception:
             pass
-        for i in np.linspace(0, 1, 12):
-            color_anim = np.c_[colors * i, 0.5 * colors, 1 - colors * i]
-            clipped_pcd.colors = o3d.utility.Vector3dVector(color_anim)
-            vis.update_geometry(clipped_pcd)
-            vis.poll_events()
-            vis.update_renderer()
-            time.sleep(0.12)
+        animate_gradient(clipped_pcd, colors, vis=vis)
     finally:
         vis.destroy_window()
         time.sleep(0.12)
-else:
-    print("BONUS: skipped animated gradient (no clipped points).")
-
-# ===== Save outputs and final summary =====
-o3d.io.write_triangle_mesh("output_step3_surface.ply", mesh_crop)
-o3d.io.write_point_cloud("output_step2_pointcloud.ply", pcd)
-o3d.io.write_voxel_grid("output_step4_voxels.ply", voxel_grid)
-
-print("\n=== SUMMARY REPORT ===")
-print(f"Original vertices: {len(mesh.vertices)}")
-print(f"Point cloud points: {len(pcd.points)}")
-print(f"Reconstructed triangles: {len(mesh_crop.triangles)}")
-print(f"Voxel count: {len(voxel_grid.get_voxels())}")
-print(f"Clipped vertices: {len(clipped_pcd.points)}")
-if z_vals.size > 0:
-    print(f"Z range: {min_point[2]:.2f} to {max_point[2]:.2f}")
 
+
+def run_pipeline(mesh_path=MESH_PATH, number_of_points=SAMPLE_POINTS, headless=False, save=True, verbose=True,
+                 timer=None, tiled=False, memory_cap_mb=TILE_MEMORY_CAP_MB, use_cache=True):
+    """Run steps 1-7 and the bonus animation; returns a dict of the results.
+
+    headless=True opens no windows (the animation still runs its color
+    updates). tiled=True runs Poisson and voxelization per tile in a process
+    pool within memory_cap_mb. use_cache=True reads/writes the sampled cloud
+    in CLOUD_CACHE_DIR. Every step is timed into `timer` (a StepTimer,
+    created if None), which is returned under "timer".
+    """
+    timer = timer or StepTimer()
+    log = print if verbose else (lambda *args: None)
+
+    cached = None
+    if use_cache:
+        with timer.step("cache_lookup"):
+            key = cloud_cache_key(mesh_path, number_of_points)
+            cached = load_cached_cloud(key)
+
+    # ===== Step 1: Load and visualize the model =====
+    mesh = None
+    if cached is None or not headless:
+        with timer.step("load"):
+            mesh = o3d.io.read_triangle_mesh(mesh_path)
+        show(mesh, "Step 1: Original Model", headless=headless)
+    stats = cached[1] if cached is not None else mesh_stats(mesh)
+    log("STEP 1: Loading and Visualization")
+    log("Vertices:", stats["vertices"])
+    log("Triangles:", stats["triangles"])
+    log("Has colors:", stats["has_colors"])
+    log("Has normals:", stats["has_normals"])
+
+    # ===== Step 2: Convert to point cloud (with extra info) =====
+    if cached is not None:
+        with timer.step("cache_load"):
+            pcd = cloud_from_arrays(cached[0])
+        log("\nPoint cloud loaded from cache", key)
+    else:
+        with timer.step("sample"):
+            pcd = sample_point_cloud(mesh, number_of_points)
+        with timer.step("normals"):
+            estimate_normals(pcd)
+        if use_cache:
+            with timer.step("cache_save"):
+                save_cached_cloud(key, pcd, stats)
+
+    # bounding box and basic stats
+    bbox_pcd = pcd.get_axis_aligned_bounding_box()
+    show(pcd, "Step 2: Point Cloud (sampled)", headless=headless)
+    log("\nSTEP 2: Conversion to Point Cloud")
+    log("Points:", len(pcd.points))
+    log("Has colors:", pcd.has_colors())
+    log("Has normals:", pcd.has_normals())
+    log("Normals count:", len(pcd.normals))
+    log("Point cloud bounding box min:", bbox_pcd.min_bound)
+    log("Point cloud bounding box max:", bbox_pcd.max_bound)
+    log("Point cloud extent (x,y,z):", bbox_pcd.get_extent())
+
+    # ===== Step 3: Surface reconstruction (Poisson) =====
+    with timer.step("poisson"):
+        if tiled:
+            mesh_crop, tile_stats = reconstruct_surface_tiled(pcd, memory_cap_mb=memory_cap_mb)
+        else:
+            mesh_crop = reconstruct_surface(pcd)
+    show(mesh_crop, "Step 3: Surface Reconstruction", headless=headless)
+    log("\nSTEP 3: Surface Reconstruction")
+    log("Vertices:", len(mesh_crop.vertices))
+    log("Triangles:", len(mesh_crop.triangles))
+    log("Has colors:", mesh_crop.has_vertex_colors())
+    if tiled:
+        log(f"Tiles: {tile_stats['tiles']} {tile_stats['grid']}, depth {tile_stats['depth']}, "
+            f"{tile_stats['worker_mb']:.0f} MB per worker")
+
+    # ===== Step 4: Voxelization (with extra info) =====
+    with timer.step("voxelize"):
+        voxel_grid = voxelize_tiled(pcd, memory_cap_mb=memory_cap_mb)[0] if tiled else voxelize(pcd)
+    show(voxel_grid, "Step 4: Voxelization", headless=headless)
+    voxels = voxel_grid.get_voxels()
+    log("\nSTEP 4: Voxelization")
+    log("Voxel size used:", VOXEL_SIZE)
+    log("Approx. voxels (occupied):", len(voxels))
+    # show sample voxel grid indices (first 8) for quick verification
+    log("Sample voxel grid indices (first 8):", [v.grid_index for v in voxels[:8]])
+    # bounding box of voxel grid (constructed from the pcd bbox)
+    bbox_vox = voxel_grid.get_axis_aligned_bounding_box()
+    log("Voxel grid bounding box min:", bbox_vox.min_bound)
+    log("Voxel grid bounding box max:", bbox_vox.max_bound)
+
+    # ===== Step 5: Add a plane =====
+    plane, bbox_mesh = make_plane(mesh_crop)
+    show([mesh_crop, plane, bbox_mesh], "Step 5: Plane Added", headless=headless)
+    log("\nSTEP 5: Plane Added")
+
+    # ===== Step 6: Surface Clipping =====
+    with timer.step("index"):
+        index = PointIndex(np.asarray(pcd.points))
+    with timer.step("clip"):
+        clipped_pcd = clip_point_cloud(pcd, index=index)
+    show(clipped_pcd, "Step 6: Clipped Point Cloud", headless=headless)
+    log("\nSTEP 6: Surface Clipping")
+    log("Remaining vertices:", len(clipped_pcd.points))
+
+    # ===== Step 7: Color gradient + extremes =====
+    colors = min_point = max_point = None
+    if len(clipped_pcd.points) > 0:
+        with timer.step("gradient"):
+            colors, min_point, max_point = color_gradient(clipped_pcd)
+        sphere_min = o3d.geometry.TriangleMesh.create_sphere(radius=0.05)
+        sphere_min.translate(min_point)
+        sphere_min.paint_uniform_color([1, 0, 0])
+        sphere_max = o3d.geometry.TriangleMesh.create_sphere(radius=0.05)
+        sphere_max.translate(max_point)
+        sphere_max.paint_uniform_color([0, 1, 0])
+        show([clipped_pcd, sphere_min, sphere_max], "Step 7: Gradient and Extremes", headless=headless)
+        log("\nSTEP 7: Color and Extremes")
+        log("Min point (Z):", min_point)
+        log("Max point (Z):", max_point)
+    else:
+        log("\nSTEP 7: No points in clipped cloud to compute gradient/extrema.")
+
+    # ===== Bonus: Animated color gradient (single window update, lighting off) =====
+    log("\nBONUS: Animated gradient (visual effect)")
+    if colors is not None:
+        with timer.step("animation"):
+            if headless:
+                animate_gradient(clipped_pcd, colors)
+            else:
+                show_animation(clipped_pcd, colors)
+    else:
+        log("BONUS: skipped animated gradient (no clipped points).")
+
+    # ===== Save outputs =====
+    if save:
+        with timer.step("save"):
+            o3d.io.write_triangle_mesh("output_step3_surface.ply", mesh_crop)
+            o3d.io.write_point_cloud("output_step2_pointcloud.ply", pcd)
+            o3d.io.write_voxel_grid("output_step4_voxels.ply", voxel_grid)
+
+    return {"mesh": mesh, "mesh_stats": stats, "pcd": pcd, "index": index, "mesh_crop": mesh_crop, "voxel_grid": voxel_grid,
+            "clipped_pcd": clipped_pcd, "min_point": min_point, "max_point": max_point, "timer": timer}
+
+
+def print_summary(result):
+    print("\n=== SUMMARY REPORT ===")
+    print(f"Original vertices: {result['mesh_stats']['vertices']}")
+    print(f"Point cloud points: {len(result['pcd'].points)}")
+    print(f"Reconstructed triangles: {len(result['mesh_crop'].triangles)}")
+    print(f"Voxel count: {len(result['voxel_grid'].get_voxels())}")
+    print(f"Clipped vertices: {len(result['clipped_pcd'].points)}")
+    if result["min_point"] is not None:
+        print(f"Z range: {result['min_point'][2]:.2f} to {result['max_point'][2]:.2f}")
+
+
+def benchmark(mesh_path=MESH_PATH, point_counts=BENCHMARK_POINTS):
+    """Run the headless pipeline per point count; prints seconds per step (rows) and count (columns)."""
+    runs = {}
+    for count in point_counts:
+        print(f"Running pipeline with {count} points...")
+        runs[count] = run_pipeline(mesh_path, count, headless=True, save=False, verbose=False,
+                                   use_cache=False)["timer"].steps
+    step_names = [name for name, *_ in runs[point_counts[0]]]
+    print("\n=== BENCHMARK (seconds) ===")
+    print(f"{'step':<14}" + "".join(f"{count:>12}" for count in point_counts))
+    for idx, name in enumerate(step_names):
+        print(f"{name:<14}" + "".join(f"{runs[count][idx][1]:12.3f}" for count in point_counts))
+    print(f"{'total':<14}" + "".join(f"{sum(s[1] for s in runs[count]):12.3f}" for count in point_counts))
+    print(f"{'peak MB':<14}" + "".join(f"{runs[count][-1][3]:12.1f}" for count in point_counts))
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assignment #5 Open3D pipeline.")
+    parser.add_argument("--mesh", default=MESH_PATH)
+    parser.add_argument("--points", type=int, default=SAMPLE_POINTS, help="points sampled from the mesh")
+    parser.add_argument("--headless", action="store_true", help="no windows; print timings only")
+    parser.add_argument("--no-save", action="store_true", help="do not write the output .ply files")
+    parser.add_argument("--benchmark", nargs="?", const=",".join(map(str, BENCHMARK_POINTS)), metavar="COUNTS",
+                        help="headless runs for comma-separated point counts (default 10k,100k,1M)")
+    parser.add_argument("--no-cache", action="store_true", help="sample and estimate normals even if cached")
+    parser.add_argument("--tiled", action="store_true", help="Poisson and voxelization per tile in a process pool")
+    parser.add_argument("--memory-cap", type=float, default=TILE_MEMORY_CAP_MB, metavar="MB",
+                        help=f"memory budget of the tile workers (default {TILE_MEMORY_CAP_MB})")
+    parser.add_argument("--compare-tiling", action="store_true",
+                        help="compare single-shot and tiled Poisson/voxel counts, then exit")
+    parser.add_argument("--benchmark-index", nargs="?", const="1000000,4000000", metavar="COUNTS",
+                        help="PointIndex vs boolean-mask queries for comma-separated point counts (default 1M,4M)")
+    args = parser.parse_args()
+
+    if args.benchmark_index:
+        source = o3d.io.read_triangle_mesh(args.mesh)
+        for count in args.benchmark_index.split(","):
+            benchmark_index(np.asarray(sample_point_cloud(source, int(count)).points))
+        sys.exit(0)
+    if args.compare_tiling:
+        cloud = sample_point_cloud(o3d.io.read_triangle_mesh(args.mesh), args.points)
+        estimate_normals(cloud)
+        compare_tiling(cloud, args.memory_cap)
+        sys.exit(0)
+    if args.benchmark:
+        benchmark(args.mesh, [int(count) for count in args.benchmark.split(",")])
+        sys.exit(0)
+
+    # --- Header ---
+    print("Data Visualization Assignment #5 — Open3D Project")
+    print("Author: Ziaulhaq Parsa")
+    print(f"Model: {args.mesh}\n")
+
+    result = run_pipeline(args.mesh, args.points, headless=args.headless, save=not args.no_save,
+                          tiled=args.tiled, memory_cap_mb=args.memory_cap, use_cache=not args.no_cache)
+    print_summary(result)
+    print("\n=== STEP TIMINGS ===")
+    result["timer"].report()
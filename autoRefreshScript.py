@@ -1,5 +1,8 @@
-
 import psycopg2
+from psycopg2.extras import execute_values
+import argparse
+import multiprocessing
+import queue
 import time
 import uuid
 from datetime import datetime, timedelta
@@ -20,6 +23,30 @@ EXISTING_PRODUCT_ID = "00066f42aeeb9f3007548bb9d3f33c38"   # Example existing Pr
 # --- INSERT INTERVAL ---
 INSERT_INTERVAL_SECONDS = 10  # Insert a new record every 10 seconds (between 5-20 seconds) [cite: 27]
 
+# --- LOAD GENERATOR DEFAULTS (--load mode) ---
+LOAD_BATCH_SIZE = 500         # orders (and order items) per INSERT batch / transaction
+LOAD_ID_SAMPLE_SIZE = 5000    # existing customer/product/seller IDs preloaded per worker
+LOAD_DURATION_SECONDS = 60
+LOAD_DRAIN_TIMEOUT_SECONDS = 10  # after Ctrl+C: wait this long for each worker's report and exit
+
+ORDER_SQL = """
+            INSERT INTO orders
+            (order_id, customer_id, order_status, order_purchase_timestamp, order_approved_at, order_estimated_delivery_date)
+            VALUES %s \
+            """
+
+ITEM_SQL = """
+           INSERT INTO order_items
+               (order_id, order_item_id, product_id, seller_id, price, freight_value)
+           VALUES %s \
+           """
+
+
+def connect():
+    return psycopg2.connect(
+        dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+    )
+
 def insert_new_order_data():
     """Generates and inserts a new order and order item into the database."""
     new_order_id = str(uuid.uuid4()).replace('-', '')  # Generate a unique Order ID
@@ -61,9 +88,7 @@ def insert_new_order_data():
     conn = None
     try:
         # Connect to the PostgreSQL database
-        conn = psycopg2.connect(
-            dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
+        conn = connect()
         cur = conn.cursor()
 
         # Execute the INSERTs
@@ -85,10 +110,167 @@ def insert_new_order_data():
         if conn:
             conn.close()
 
+
+# --- LOAD GENERATOR ---
+
+def load_id_sample(cur, sample_size=LOAD_ID_SAMPLE_SIZE):
+    """Preloads a random sample of existing IDs so generated rows respect FK constraints."""
+    fallback = {
+        "customer_id": EXISTING_CUSTOMER_ID,
+        "product_id": EXISTING_PRODUCT_ID,
+        "seller_id": EXISTING_SELLER_ID,
+    }
+    ids = {}
+    for table, column in (("customers", "customer_id"), ("products", "product_id"), ("sellers", "seller_id")):
+        cur.execute(f"SELECT {column} FROM {table} ORDER BY random() LIMIT %s", (sample_size,))
+        ids[column] = [row[0] for row in cur.fetchall()] or [fallback[column]]
+    return ids
+
+
+def build_order_batch(batch_size, ids):
+    """Generates batch_size synthetic orders with one order item each."""
+    current_timestamp = datetime.now()
+    orders = []
+    items = []
+    for _ in range(batch_size):
+        new_order_id = uuid.uuid4().hex
+        orders.append((
+            new_order_id,
+            random.choice(ids["customer_id"]),
+            'delivered',
+            current_timestamp,
+            current_timestamp + timedelta(hours=random.randint(1, 48)),
+            current_timestamp + timedelta(days=random.randint(1, 10)),
+        ))
+        items.append((
+            new_order_id,
+            1,
+            random.choice(ids["product_id"]),
+            random.choice(ids["seller_id"]),
+            random.uniform(10.00, 500.00),
+            random.uniform(5.00, 50.00),
+        ))
+    return orders, items
+
+
+def run_load_worker(worker_id, batch_size, rate, duration, results):
+    """Inserts batches over one persistent connection, paced to `rate` orders/sec
+    (0 = as fast as possible), and reports (orders inserted, batch latencies).
+    A batch latency covers both INSERTs and the commit."""
+    inserted = 0
+    latencies = []
+    conn = None
+    try:
+        conn = connect()
+        with conn.cursor() as cur:
+            ids = load_id_sample(cur)
+        conn.commit()
+
+        batch_interval = batch_size / rate if rate > 0 else 0
+        start = time.perf_counter()
+        deadline = start + duration
+        next_batch_at = start
+        while time.perf_counter() < deadline:
+            if batch_interval:
+                # Never sleep past the end of the run, nor insert a batch after it
+                delay = min(next_batch_at, deadline) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if time.perf_counter() >= deadline:
+                    break
+                next_batch_at += batch_interval
+
+            orders, items = build_order_batch(batch_size, ids)
+            t0 = time.perf_counter()
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, ORDER_SQL, orders, page_size=batch_size)
+                    execute_values(cur, ITEM_SQL, items, page_size=batch_size)
+                conn.commit()
+            except Exception as error:
+                print(f"[worker {worker_id}] Error during batch insert: {error}")
+                conn.rollback()
+                continue
+            latencies.append(time.perf_counter() - t0)
+            inserted += len(orders)
+    except KeyboardInterrupt:
+        pass
+    except Exception as error:
+        print(f"[worker {worker_id}] Error: {error}")
+    finally:
+        if conn:
+            conn.close()
+        # Always report, so the parent never waits on a worker that failed
+        results.put((inserted, latencies))
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_load_generator(batch_size=LOAD_BATCH_SIZE, rate=0, workers=1, duration=LOAD_DURATION_SECONDS):
+    """Runs `workers` insert processes and prints achieved throughput and latency."""
+    per_worker_rate = rate / workers if rate > 0 else 0
+    print("--- Starting Load Generator ---")
+    print(f"Workers: {workers}, batch size: {batch_size}, "
+          f"target rate: {rate if rate > 0 else 'unlimited'} orders/sec, duration: {duration}s")
+
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=run_load_worker,
+                                args=(i, batch_size, per_worker_rate, duration, results))
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+
+    reports = []
+    try:
+        while len(reports) < len(procs):
+            reports.append(results.get())
+    except KeyboardInterrupt:
+        # The workers got the Ctrl+C too and are reporting what they inserted;
+        # keep draining, or a worker blocks on its results.put() and join() hangs
+        try:
+            while len(reports) < len(procs):
+                reports.append(results.get(timeout=LOAD_DRAIN_TIMEOUT_SECONDS))
+        except queue.Empty:
+            pass
+    for p in procs:
+        p.join(timeout=LOAD_DRAIN_TIMEOUT_SECONDS)
+        if p.is_alive():
+            p.terminate()
+    elapsed = time.perf_counter() - start
+    total_inserted = sum(inserted for inserted, _ in reports)
+    latencies = [latency for _, worker_latencies in reports for latency in worker_latencies]
+
+    latencies.sort()
+    print(f"Inserted {total_inserted} orders in {elapsed:.1f}s "
+          f"-> {total_inserted / elapsed if elapsed else 0:.1f} orders/sec")
+    print(f"Batch latency (insert + commit): p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms over {len(latencies)} batches")
+
+
 if __name__ == "__main__":
-    print("--- Starting Auto Data Refresh Script ---")
-    print(f"Inserting new records every {INSERT_INTERVAL_SECONDS} seconds. Press Ctrl+C to stop.")
+    parser = argparse.ArgumentParser(description="Insert synthetic orders into the UrbanCart database.")
+    parser.add_argument("--load", action="store_true", help="run the batched load generator instead of the 10s trickle")
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE)
+    parser.add_argument("--rate", type=float, default=0, help="target orders/sec across all workers (0 = unlimited)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=LOAD_DURATION_SECONDS, help="seconds to run")
+    args = parser.parse_args()
+
+    if args.load:
+        run_load_generator(args.batch_size, args.rate, args.workers, args.duration)
+    else:
+        print("--- Starting Auto Data Refresh Script ---")
+        print(f"Inserting new records every {INSERT_INTERVAL_SECONDS} seconds. Press Ctrl+C to stop.")
 
-    while True:
-        insert_new_order_data()
-        time.sleep(INSERT_INTERVAL_SECONDS)
\ No newline at end of file
+        while True:
+            insert_new_order_data()
+            time.sleep(INSERT_INTERVAL_SECONDS)
\ No newline at end of file
@@ -0,0 +1,380 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import psycopg2
+
+from autoRefreshScript import percentile
+from db import DB_CONFIG, close_pool, normalize_sql, pooled_connection
+from main import load_assignment1_queries, load_assignment2_queries
+
+# Query benchmark suite for every query in queries.sql (Assignment 1 as A1.1 ..
+# A1.10, Assignment 2 as Q1 .. Q7). By default it runs against its own database,
+# seeded with a synthetic Olist-shaped dataset, so runs are repeatable and never
+# touch the real data. Scale 1 is about the size of the Olist dataset.
+
+BENCH_DBNAME = "urbancart_bench"
+BENCH_REPEATS = 10
+BENCH_WARMUP = 1
+BENCH_SEED = 0.42  # setseed() value for the synthetic data
+
+# compare: a query regresses when its p50 grows by more than the threshold
+# fraction and by at least REGRESSION_MIN_MS (ignores noise on tiny queries)
+REGRESSION_THRESHOLD = 0.20
+REGRESSION_MIN_MS = 1.0
+
+# Rows per table at scale 1 (Olist has ~99k orders, 96k customers, 33k products, 3k sellers)
+BASE_ROWS = {"orders": 100000, "customers": 96000, "products": 33000, "sellers": 3000}
+
+BENCH_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS customers (
+    customer_id text PRIMARY KEY, customer_unique_id text, customer_zip_code_prefix text,
+    customer_city text, customer_state text);
+CREATE TABLE IF NOT EXISTS sellers (
+    seller_id text PRIMARY KEY, seller_zip_code_prefix text, seller_city text, seller_state text);
+CREATE TABLE IF NOT EXISTS products (
+    product_id text PRIMARY KEY, product_category_name text);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id text PRIMARY KEY, customer_id text, order_status text,
+    order_purchase_timestamp timestamp, order_approved_at timestamp,
+    order_delivered_carrier_date timestamp, order_delivered_customer_date timestamp,
+    order_estimated_delivery_date timestamp);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id text, order_item_id int, product_id text, seller_id text,
+    shipping_limit_date timestamp, price numeric, freight_value numeric,
+    PRIMARY KEY (order_id, order_item_id));
+CREATE TABLE IF NOT EXISTS payments (
+    order_id text, payment_sequential int, payment_type text,
+    payment_installments int, payment_value numeric);
+CREATE TABLE IF NOT EXISTS reviews (
+    review_id text, order_id text, review_score int, review_comment_title text,
+    review_comment_message text, review_creation_date timestamp, review_answer_timestamp timestamp);
+"""
+
+BENCH_TABLES = ["reviews", "payments", "order_items", "orders", "products", "sellers", "customers"]
+
+# Skewed picks: random()^k concentrates on the first array entries, so the most
+# common states/categories/payment types come first. Orders are inserted in
+# purchase-time order, like the append-only inserts of autoRefreshScript.py.
+SEED_STEPS = [
+    ("customers", """
+        INSERT INTO customers
+        SELECT md5('c' || g), md5('u' || mod(g, %(unique_customers)s)), lpad(mod(g, 99999)::text, 5, '0'), 'city',
+               (ARRAY['SP','RJ','MG','RS','PR','SC','BA','DF','ES','GO','PE','CE','PA','MT','MA',
+                      'MS','PB','PI','RN','AL','SE','TO','RO','AM','AC','AP','RR'])[1 + floor(27 * random() ^ 2.5)::int]
+        FROM generate_series(1, %(customers)s) g;
+    """),
+    ("sellers", """
+        INSERT INTO sellers
+        SELECT md5('s' || g), lpad(mod(g, 99999)::text, 5, '0'), 'city',
+               (ARRAY['SP','PR','MG','SC','RJ','RS','GO','DF','ES','BA'])[1 + floor(10 * random() ^ 3)::int]
+        FROM generate_series(1, %(sellers)s) g;
+    """),
+    ("products", """
+        INSERT INTO products
+        SELECT md5('p' || g),
+               (ARRAY['cama_mesa_banho','beleza_saude','esporte_lazer','moveis_decoracao',
+                      'informatica_acessorios','utilidades_domesticas','relogios_presentes','telefonia',
+                      'ferramentas_jardim','automotivo','brinquedos','cool_stuff','perfumaria','bebes',
+                      'eletronicos','papelaria','fashion_bolsas_e_acessorios','pet_shop'])[1 + floor(18 * random() ^ 1.8)::int]
+        FROM generate_series(1, %(products)s) g;
+    """),
+    ("orders", """
+        INSERT INTO orders
+        SELECT md5('o' || g), md5('c' || (1 + floor(random() * %(customers)s)::int)),
+               CASE WHEN r_status < 0.97 THEN 'delivered' WHEN r_status < 0.98 THEN 'shipped'
+                    WHEN r_status < 0.99 THEN 'canceled' ELSE 'processing' END,
+               ts, ts + interval '10 hours', ts + interval '3 days',
+               CASE WHEN r_status < 0.97 THEN ts + delivery_days * interval '1 day' END,
+               ts + interval '24 days'
+        FROM (
+            SELECT g, random() AS r_status,
+                   timestamp '2016-09-04' + (g::float8 / %(orders)s) ^ 0.7 * interval '730 days'
+                       + random() * interval '2 hours' AS ts,
+                   2 + 40 * random() * random() AS delivery_days
+            FROM generate_series(1, %(orders)s) g
+        ) o;
+    """),
+    ("order_items", """
+        INSERT INTO order_items
+        SELECT order_id, i, md5('p' || (1 + floor(%(products)s * random() ^ 2)::int)),
+               md5('s' || (1 + floor(%(sellers)s * random() ^ 2)::int)),
+               order_purchase_timestamp + interval '6 days', price, round((price * 0.12 + 8 * random())::numeric, 2)
+        FROM (
+            SELECT o.order_id, o.order_purchase_timestamp, i, round(exp(2 + 4.5 * random())::numeric, 2) AS price
+            FROM (SELECT order_id, order_purchase_timestamp,
+                         CASE WHEN random() < 0.1 THEN 2 ELSE 1 END AS n_items
+                  FROM orders) o,
+                 generate_series(1, o.n_items) i
+        ) items;
+    """),
+    ("payments", """
+        INSERT INTO payments
+        SELECT order_id, 1,
+               (ARRAY['credit_card','boleto','voucher','debit_card'])[1 + floor(4 * random() ^ 4)::int],
+               1 + floor(10 * random() ^ 3)::int, SUM(price + freight_value)
+        FROM order_items
+        GROUP BY order_id;
+    """),
+    ("reviews", """
+        INSERT INTO reviews
+        SELECT md5('r' || order_id), order_id,
+               CASE WHEN order_delivered_customer_date > order_estimated_delivery_date
+                    THEN (ARRAY[1, 1, 1, 2, 3, 4])[1 + floor(6 * random())::int]
+                    ELSE (ARRAY[5, 5, 5, 5, 5, 5, 4, 4, 3, 1])[1 + floor(10 * random())::int] END,
+               NULL, NULL, order_purchase_timestamp + interval '12 days', order_purchase_timestamp + interval '14 days'
+        FROM orders
+        WHERE random() < 0.97;
+    """),
+]
+
+
+def use_database(dbname):
+    """Point the shared pool at ``dbname``, creating the database if it is missing."""
+    admin = psycopg2.connect(**{**DB_CONFIG, "dbname": "postgres"})
+    try:
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (dbname,))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{dbname}";')
+                print(f"Created database {dbname}")
+    finally:
+        admin.close()
+    close_pool()
+    DB_CONFIG["dbname"] = dbname
+
+
+def table_counts():
+    """Row counts of the benchmark tables that exist."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            counts = {}
+            for table in reversed(BENCH_TABLES):
+                cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+                if cur.fetchone()[0]:
+                    cur.execute(f"SELECT COUNT(*) FROM {table};")
+                    counts[table] = cur.fetchone()[0]
+            return counts
+
+
+def seed_synthetic_dataset(scale=1.0, seed=BENCH_SEED, reseed=False, other_db=False):
+    """Create the schema and fill it with the synthetic dataset when orders is empty.
+
+    The data is generated server side with generate_series after setseed(), so
+    the same scale and seed always produce the same rows. Only BENCH_DBNAME is
+    seeded unless other_db=True, and only BENCH_DBNAME is ever reseeded.
+    """
+    if reseed and DB_CONFIG["dbname"] != BENCH_DBNAME:
+        sys.exit(f"Refusing to reseed {DB_CONFIG['dbname']!r}; only {BENCH_DBNAME!r} is reseeded")
+    if not other_db and DB_CONFIG["dbname"] != BENCH_DBNAME:
+        sys.exit(f"Refusing to create the schema in or seed {DB_CONFIG['dbname']!r}; use --no-seed to "
+                 f"benchmark it as is, or --seed-other-db to seed it")
+    sizes = {name: max(int(rows * scale), 1) for name, rows in BASE_ROWS.items()}
+    sizes["unique_customers"] = max(int(sizes["customers"] * 0.97), 1)
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if reseed:
+                cur.execute(f"DROP TABLE IF EXISTS {', '.join(BENCH_TABLES)};")
+            cur.execute(BENCH_SCHEMA_SQL)
+            cur.execute("SELECT EXISTS (SELECT 1 FROM orders);")
+            if cur.fetchone()[0]:
+                return False
+            print(f"Seeding synthetic dataset (scale {scale}, {sizes['orders']} orders)...")
+            cur.execute("SELECT setseed(%s);", (seed,))
+            for table, sql in SEED_STEPS:
+                start = time.perf_counter()
+                cur.execute(sql, sizes)
+                print(f"  {table}: {cur.rowcount} rows in {time.perf_counter() - start:.1f}s")
+
+    with pooled_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE;")
+        conn.autocommit = False
+    return True
+
+
+def load_benchmark_queries(path="queries.sql"):
+    """All queries from queries.sql keyed A1.1 .. A1.10 and Q1 .. Q7."""
+    queries = load_assignment1_queries(path)
+    queries.update(load_assignment2_queries(path))
+    return queries
+
+
+def explain_query(cur, sql):
+    """EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) output for one statement."""
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {normalize_sql(sql)}")
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def benchmark_query(sql, repeats=BENCH_REPEATS, warmup=BENCH_WARMUP):
+    """Time ``repeats`` executions (after ``warmup`` untimed ones) and capture one plan.
+
+    Timings cover execute + fetchall on a pooled connection, so they include
+    transferring the result rows but not building a DataFrame.
+    """
+    samples = []
+    rows = 0
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            for i in range(warmup + repeats):
+                start = time.perf_counter()
+                cur.execute(sql)
+                rows = len(cur.fetchall())
+                if i >= warmup:
+                    samples.append((time.perf_counter() - start) * 1000)
+            plan = explain_query(cur, sql)
+        conn.rollback()
+
+    top = plan["Plan"]
+    ordered = sorted(samples)
+    return {
+        "sql": normalize_sql(sql),
+        "runs_ms": [round(s, 3) for s in samples],
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "rows": rows,
+        "shared_hit_blocks": top.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": top.get("Shared Read Blocks", 0),
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time"),
+        "plan": plan,
+    }
+
+
+def run_benchmark(queries, repeats=BENCH_REPEATS, warmup=BENCH_WARMUP):
+    """Benchmark every query and return the results document."""
+    with pooled_connection() as conn:
+        server_version = conn.server_version
+
+    results = {}
+    print(f"{'Query':<18}{'p50 ms':>10}{'p95 ms':>10}{'rows':>9}{'hit blks':>10}{'read blks':>11}")
+    for key, sql in queries.items():
+        try:
+            result = benchmark_query(sql, repeats, warmup)
+        except psycopg2.Error as e:
+            print(f"{key:<18} failed: {str(e).strip().splitlines()[0]}")
+            results[key] = {"sql": normalize_sql(sql), "error": str(e).strip()}
+            continue
+        results[key] = result
+        print(f"{key:<18}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['rows']:>9}"
+              f"{result['shared_hit_blocks']:>10}{result['shared_read_blocks']:>11}")
+
+    counts = table_counts()
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "dbname": DB_CONFIG["dbname"],
+            "scale": round(counts.get("orders", 0) / BASE_ROWS["orders"], 3),
+            "table_rows": counts,
+            "repeats": repeats,
+            "warmup": warmup,
+            "server_version": server_version,
+            "python": platform.python_version(),
+        },
+        "queries": results,
+    }
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD, min_ms=REGRESSION_MIN_MS):
+    """Print a per-query p50 comparison and return the keys that regressed."""
+    if baseline["meta"].get("table_rows") != current["meta"].get("table_rows"):
+        print("Warning: baseline and current runs used different table sizes")
+
+    regressions = []
+    print(f"{'Query':<18}{'base p50':>10}{'new p50':>10}{'change':>9}{'base p95':>10}{'new p95':>10}")
+    for key in current["queries"]:
+        base = baseline["queries"].get(key)
+        new = current["queries"][key]
+        if base is None or "error" in base or "error" in new:
+            print(f"{key:<18} skipped ({'not in baseline' if base is None else 'error in a run'})")
+            continue
+        change = (new["p50_ms"] - base["p50_ms"]) / base["p50_ms"] if base["p50_ms"] else 0.0
+        regressed = change > threshold and new["p50_ms"] - base["p50_ms"] >= min_ms
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<18}{base['p50_ms']:>10.2f}{new['p50_ms']:>10.2f}{change:>+9.0%}"
+              f"{base['p95_ms']:>10.2f}{new['p95_ms']:>10.2f}{'  REGRESSION' if regressed else ''}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {threshold:.0%}: {', '.join(regressions)}")
+    else:
+        print("No regressions.")
+    return regressions
+
+
+def _load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the queries in queries.sql.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="seed if needed, then benchmark every query")
+    run_p.add_argument("--dbname", default=BENCH_DBNAME, help=f"database to benchmark (default {BENCH_DBNAME})")
+    run_p.add_argument("--scale", type=float, default=1.0, help="synthetic dataset size (1.0 = ~100k orders)")
+    run_p.add_argument("--reseed", action="store_true", help="drop and regenerate the synthetic dataset")
+    run_p.add_argument("--no-seed", action="store_true", help="use the database as is")
+    run_p.add_argument("--seed-other-db", action="store_true",
+                       help=f"allow creating the schema and seeding a database other than {BENCH_DBNAME}")
+    run_p.add_argument("--repeats", type=int, default=BENCH_REPEATS)
+    run_p.add_argument("--warmup", type=int, default=BENCH_WARMUP)
+    run_p.add_argument("--only", nargs="+", help="query keys to run, e.g. Q3 A1.8")
+    run_p.add_argument("--output", default="benchmark_results.json")
+    run_p.add_argument("--baseline", help="results file to compare against after the run")
+    run_p.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    seed_p = sub.add_parser("seed", help="create and seed the benchmark database")
+    seed_p.add_argument("--scale", type=float, default=1.0)
+    seed_p.add_argument("--reseed", action="store_true")
+
+    cmp_p = sub.add_parser("compare", help="compare two results files")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    cmp_p.add_argument("--min-ms", type=float, default=REGRESSION_MIN_MS)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        regressed = compare_results(_load_results(args.baseline), _load_results(args.current),
+                                    args.threshold, args.min_ms)
+        sys.exit(1 if regressed else 0)
+
+    if args.command == "run" and args.dbname != BENCH_DBNAME and not (args.no_seed or args.seed_other_db):
+        # Checked before use_database(), which would create a missing database
+        parser.error(f"--dbname {args.dbname} needs --no-seed (benchmark it as is) or --seed-other-db")
+    use_database(args.dbname if args.command == "run" else BENCH_DBNAME)
+    if args.command == "seed":
+        if not seed_synthetic_dataset(args.scale, reseed=args.reseed):
+            print("orders already has rows; use --reseed to regenerate")
+        close_pool()
+        sys.exit(0)
+
+    if not args.no_seed:
+        seed_synthetic_dataset(args.scale, reseed=args.reseed, other_db=args.seed_other_db)
+    queries = load_benchmark_queries()
+    if args.only:
+        queries = {key: sql for key, sql in queries.items() if key in args.only}
+    report = run_benchmark(queries, args.repeats, args.warmup)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1, default=str)
+    print(f"Results written to {args.output}")
+
+    regressed = []
+    if args.baseline:
+        regressed = compare_results(_load_results(args.baseline), report, args.threshold)
+    close_pool()
+    sys.exit(1 if regressed else 0)
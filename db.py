@@ -0,0 +1,385 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+import pandas as pd
+
+from metrics import observe_connect
+
+# Database Config
+
+DB_CONFIG = {
+    "dbname": "Urbancart",
+    "user": "postgres",
+    "password": "0000",
+    "host": "localhost",
+
+    "port": 5432
+}
+
+# Connection Pool Config
+# The pool opens POOL_MIN_CONN connections up front and grows on demand up to
+# POOL_MAX_CONN. A connection that sat idle for longer than
+# POOL_PING_AFTER_SECONDS is pinged with SELECT 1 before it is handed out again.
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 8
+POOL_PING_AFTER_SECONDS = 30
+
+# opened: physical connections created, reused: checkouts served by an already
+# used connection, reconnects: dead connections dropped from the pool
+POOL_STATS = {"opened": 0, "reused": 0, "reconnects": 0}
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_last_used = {}  # id(conn) -> time.monotonic() of the last check-in
+
+
+class _CountingPool(pg_pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that counts (and times) every physical connection it opens."""
+
+    def _connect(self, key=None):
+        start = time.perf_counter()
+        conn = super()._connect(key)
+        observe_connect(time.perf_counter() - start)
+        with _stats_lock:
+            POOL_STATS["opened"] += 1
+        return conn
+
+
+def configure_pool(minconn=None, maxconn=None, ping_after=None):
+    """Change the pool sizing. Takes effect the next time the pool is created."""
+    global POOL_MIN_CONN, POOL_MAX_CONN, POOL_PING_AFTER_SECONDS
+    if minconn is not None:
+        POOL_MIN_CONN = minconn
+    if maxconn is not None:
+        POOL_MAX_CONN = maxconn
+    if ping_after is not None:
+        POOL_PING_AFTER_SECONDS = ping_after
+    close_pool()
+
+
+def get_pool():
+    """Return the module-level connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = _CountingPool(POOL_MIN_CONN, POOL_MAX_CONN, **DB_CONFIG)
+        return _pool
+
+
+def close_pool():
+    """Close every pooled connection (safe to call when no pool exists)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < POOL_PING_AFTER_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(pool, conn):
+    _last_used.pop(id(conn), None)
+    with _stats_lock:
+        POOL_STATS["reconnects"] += 1
+    pool.putconn(conn, close=True)
+
+
+@contextmanager
+def pooled_connection():
+    """Check a connection out of the shared pool.
+
+    Commits when the block succeeds and rolls back when it raises, like
+    ``with psycopg2.connect(...)`` does. Dead connections are replaced
+    transparently on checkout and dropped on check-in.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    while not _is_healthy(conn):
+        _discard(pool, conn)
+        conn = pool.getconn()
+
+    with _stats_lock:
+        if id(conn) in _last_used:
+            POOL_STATS["reused"] += 1
+
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        # BaseException so an abandoned streaming generator (GeneratorExit)
+        # does not hand a connection with an open transaction back to the pool
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        raise
+    finally:
+        if conn.closed:
+            _discard(pool, conn)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+
+
+def pool_summary():
+    """One-line summary of connection reuse for the console report."""
+    return (f"DB connections: {POOL_STATS['opened']} opened, {POOL_STATS['reused']} reused, "
+            f"{POOL_STATS['reconnects']} reconnects")
+
+
+# Utility: Query Runner
+
+def get_dataframe(query):
+    """Run a SQL query and return a pandas DataFrame.
+
+    A read that fails because the pooled connection dropped underneath it is
+    retried once on a fresh connection.
+    """
+    for attempt in range(2):
+        conn = None
+        try:
+            with pooled_connection() as conn:
+                return pd.read_sql(query, conn)
+        except Exception:
+            if attempt or conn is None or not conn.closed:
+                raise
+
+
+def execute_non_query(query, params=None):
+    """Run a SQL statement that does not return rows (INSERT/UPDATE/DELETE)."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params or ())
+
+
+STREAM_CHUNK_SIZE = 10000
+
+# Narrow dtypes for the large per-review / per-order result sets. Integer
+# columns that contain NULLs use the matching nullable type (Int8, ...).
+COMPACT_DTYPES = {
+    "review_score": "int8",
+    "delivery_days": "float32",
+    "customer_state": "category",
+    "seller_state": "category",
+    "product_category_name": "category",
+    "product_category": "category",
+}
+
+
+def apply_compact_dtypes(df, dtypes=COMPACT_DTYPES):
+    """Cast the columns named in ``dtypes`` in place and return the frame."""
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith("int") and df[col].isna().any():
+            dtype = dtype.capitalize()
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def iter_dataframe_chunks(query, chunk_size=STREAM_CHUNK_SIZE, dtypes=None):
+    """Run a SQL query on a server-side (named) cursor and yield DataFrames of
+    at most chunk_size rows, so the full result is never held in memory.
+
+    chunk_size is also the cursor's itersize (rows per network round trip).
+    NUMERIC values are coerced to float like pd.read_sql does, then the columns
+    in ``dtypes`` (e.g. COMPACT_DTYPES) are narrowed. An empty result yields a
+    single empty DataFrame that still carries the column names.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+            cur.itersize = chunk_size
+            cur.execute(query)
+            first = True
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows and not first:
+                    break
+                columns = [col[0] for col in cur.description]
+                chunk = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                yield apply_compact_dtypes(chunk, dtypes) if dtypes else chunk
+                first = False
+                if not rows:
+                    break
+
+
+def iter_record_batches(query, chunk_size=STREAM_CHUNK_SIZE, dtypes=COMPACT_DTYPES):
+    """Like iter_dataframe_chunks but yields pyarrow RecordBatches (needs pyarrow)."""
+    import pyarrow as pa
+
+    for chunk in iter_dataframe_chunks(query, chunk_size, dtypes):
+        yield pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+
+
+# Utility: Query Result Cache
+# Results are stored as Parquet files keyed on the normalized SQL text. An entry
+# is reused only while the insert/update/delete counters in pg_stat_user_tables
+# (plus relid and relfilenode, which catch DROP and TRUNCATE) of every table it
+# reads are unchanged. A partitioned table's own counters never move, so for it
+# the counters and filenodes of all its partitions are used. Backends publish
+# those counters lazily (at most every second, and within ~10 s once idle), so
+# a very recent write can still be served from cache until the writer's stats
+# are flushed.
+
+QUERY_CACHE_DIR = os.path.join("cache", "queries")
+QUERY_CACHE_TTL_SECONDS = 24 * 3600
+QUERY_CACHE_MAX_ENTRIES = 64
+
+QUERY_CACHE_STATS = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+_cache_lock = threading.Lock()
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][\w.]*)", re.IGNORECASE)
+
+
+def normalize_sql(query):
+    """Collapse whitespace outside string literals and drop the trailing semicolon."""
+    sql = re.sub(r"('(?:[^']|'')*')|\s+", lambda m: m.group(1) or " ", query)
+    return sql.strip().rstrip(";").strip()
+
+
+def referenced_tables(query):
+    """Table names that appear after FROM/JOIN, without schema prefix."""
+    return sorted({name.split(".")[-1].lower() for name in _TABLE_REF.findall(query)})
+
+
+def _table_fingerprint(tables):
+    if not tables:
+        return []
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT t.relname, t.relid::bigint,
+                       md5(string_agg(part.relid::bigint || ':' || COALESCE(pg_relation_filenode(part.relid), 0),
+                                      ',' ORDER BY part.relid::bigint)),
+                       SUM(COALESCE(s.n_tup_ins + s.n_tup_upd + s.n_tup_del, 0))::bigint
+                FROM pg_stat_user_tables t
+                CROSS JOIN LATERAL (SELECT t.relid UNION SELECT relid FROM pg_partition_tree(t.relid)) part
+                LEFT JOIN pg_stat_user_tables s ON s.relid = part.relid
+                WHERE t.relname = ANY(%s)
+                GROUP BY t.relname, t.relid
+                ORDER BY t.relname, t.relid;
+                """,
+                (list(tables),),
+            )
+            return [list(row) for row in cur.fetchall()]
+
+
+def _cache_index_path():
+    return os.path.join(QUERY_CACHE_DIR, "index.json")
+
+
+def _load_cache_index():
+    try:
+        with open(_cache_index_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache_index(index):
+    os.makedirs(QUERY_CACHE_DIR, exist_ok=True)
+    tmp_path = _cache_index_path() + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, _cache_index_path())
+
+
+def _drop_cache_entry(index, key):
+    index.pop(key, None)
+    try:
+        os.remove(os.path.join(QUERY_CACHE_DIR, f"{key}.parquet"))
+    except OSError:
+        pass
+
+
+def get_cached_dataframe(query, ttl=None):
+    """get_dataframe backed by the on-disk result cache.
+
+    Entries expire after ``ttl`` seconds (QUERY_CACHE_TTL_SECONDS by default) or
+    as soon as a table they read changes; the least recently used entries are
+    evicted beyond QUERY_CACHE_MAX_ENTRIES.
+    """
+    ttl = QUERY_CACHE_TTL_SECONDS if ttl is None else ttl
+    sql = normalize_sql(query)
+    key = hashlib.sha256(sql.encode("utf-8")).hexdigest()[:32]
+    tables = referenced_tables(sql)
+    fingerprint = _table_fingerprint(tables)
+    data_path = os.path.join(QUERY_CACHE_DIR, f"{key}.parquet")
+    now = time.time()
+
+    with _cache_lock:
+        index = _load_cache_index()
+        entry = index.get(key)
+        if entry is not None:
+            if entry["fingerprint"] == fingerprint and now - entry["created"] <= ttl:
+                try:
+                    df = pd.read_parquet(data_path)
+                except (OSError, ValueError):
+                    df = None
+                if df is not None:
+                    entry["last_access"] = now
+                    _save_cache_index(index)
+                    QUERY_CACHE_STATS["hits"] += 1
+                    return df
+            QUERY_CACHE_STATS["invalidations"] += 1
+            _drop_cache_entry(index, key)
+            _save_cache_index(index)
+        QUERY_CACHE_STATS["misses"] += 1
+
+    df = get_dataframe(query)
+
+    with _cache_lock:
+        os.makedirs(QUERY_CACHE_DIR, exist_ok=True)
+        try:
+            df.to_parquet(data_path, index=False)
+        except ImportError as e:
+            print(f"Query cache unavailable ({e}); returning uncached result.")
+            return df
+        index = _load_cache_index()
+        index[key] = {"sql": sql, "tables": tables, "fingerprint": fingerprint,
+                      "created": now, "last_access": now, "rows": len(df)}
+        excess = max(len(index) - QUERY_CACHE_MAX_ENTRIES, 0)
+        for stale_key in sorted(index, key=lambda k: index[k]["last_access"])[:excess]:
+            _drop_cache_entry(index, stale_key)
+            QUERY_CACHE_STATS["evictions"] += 1
+        _save_cache_index(index)
+    return df
+
+
+def clear_query_cache():
+    """Remove every cached result."""
+    with _cache_lock:
+        index = _load_cache_index()
+        for key in list(index):
+            _drop_cache_entry(index, key)
+        _save_cache_index(index)
+
+
+def cache_summary():
+    """One-line summary of query cache effectiveness for the console report."""
+    return (f"Query cache: {QUERY_CACHE_STATS['hits']} hits, {QUERY_CACHE_STATS['misses']} misses, "
+            f"{QUERY_CACHE_STATS['invalidations']} invalidated, {QUERY_CACHE_STATS['evictions']} evicted")
@@ -0,0 +1,194 @@
+import base64
+import hashlib
+import json
+import math
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+from db import pooled_connection
+
+# Incremental monthly aggregates for Q3 (monthly revenue) and Q7 (orders per
+# month). Per-month partials are persisted together with a high-water mark on
+# orders.order_purchase_timestamp, so a refresh only reads orders newer than the
+# mark. Orders committed late with a timestamp inside INCREMENTAL_LOOKBACK of the
+# mark are still picked up; the ids of orders in that window are kept to avoid
+# counting them twice. Orders with a NULL purchase timestamp are not tracked.
+# The delta scan relies on idx_orders_purchase_ts; create it once with
+# `python partitioning.py indexes` (this module runs no DDL).
+
+INCREMENTAL_STATE_PATH = os.path.join("cache", "monthly_aggregates.json")
+INCREMENTAL_LOOKBACK = timedelta(seconds=60)
+HLL_PRECISION = 12
+# Rows per round trip of the delta cursor; the first (cold) run reads every order
+DELTA_FETCH_SIZE = 10000
+
+# Keys that can be served from the incremental aggregates instead of a full scan
+INCREMENTAL_QUERIES = ("Q3", "Q7")
+
+# Orders newer than the given timestamp, one row per order
+DELTA_SQL = """
+    SELECT o.order_id, o.customer_id, o.order_purchase_timestamp,
+           DATE_TRUNC('month', o.order_purchase_timestamp) AS month,
+           SUM(oi.price) AS revenue, COUNT(oi.price) AS priced_items
+    FROM orders o
+        LEFT JOIN order_items oi ON o.order_id = oi.order_id
+    WHERE o.order_purchase_timestamp > %s
+    GROUP BY o.order_id, o.customer_id, o.order_purchase_timestamp;
+"""
+
+_refresh_lock = threading.Lock()
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch with 2**precision one-byte registers.
+
+    Standard error is about 1.04 / sqrt(2**precision) (1.6% at precision 12);
+    small cardinalities fall back to linear counting and are near exact.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+        idx = h >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (h & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_text(self):
+        return base64.b64encode(bytes(self.registers)).decode("ascii")
+
+    @classmethod
+    def from_text(cls, text, precision=HLL_PRECISION):
+        return cls(precision, base64.b64decode(text))
+
+
+def _empty_state():
+    return {"high_water_mark": None, "boundary_order_ids": [], "months": {}}
+
+
+def _load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return _empty_state()
+
+
+def _save_state(state, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def refresh_monthly_aggregates(path=INCREMENTAL_STATE_PATH):
+    """Fold orders newer than the stored high-water mark into the per-month
+    partials and persist them. Returns (state, number of orders folded in).
+
+    The delta is read from a server-side cursor, so the first run, which
+    scans the whole table, never holds every order in memory.
+    """
+    with _refresh_lock:
+        state = _load_state(path)
+        hwm = state["high_water_mark"]
+        seen = set(state["boundary_order_ids"])
+
+        since = datetime.fromisoformat(hwm) - INCREMENTAL_LOOKBACK if hwm else datetime.min
+
+        sketches = {}
+        folded = 0
+        new_hwm = datetime.fromisoformat(hwm) if hwm else None
+        # (purchased_at, order_id) of orders that may fall in the final lookback
+        # window, pruned to the window of the newest order seen so far
+        recent = []
+        prune_at = DELTA_FETCH_SIZE
+        with pooled_connection() as conn:
+            with conn.cursor(name=f"delta_{uuid.uuid4().hex}") as cur:
+                cur.itersize = DELTA_FETCH_SIZE
+                cur.execute(DELTA_SQL, (since,))
+                for order_id, customer_id, purchased_at, month, revenue, priced_items in cur:
+                    if new_hwm is None or purchased_at > new_hwm:
+                        new_hwm = purchased_at
+                    if purchased_at > new_hwm - INCREMENTAL_LOOKBACK:
+                        recent.append((purchased_at, order_id))
+                        if len(recent) > prune_at:
+                            recent = [r for r in recent if r[0] > new_hwm - INCREMENTAL_LOOKBACK]
+                            prune_at = max(DELTA_FETCH_SIZE, 2 * len(recent))
+                    if order_id in seen:
+                        continue
+                    folded += 1
+                    month_key = month.isoformat()
+                    part = state["months"].setdefault(
+                        month_key, {"orders": 0, "revenue": "0", "priced_items": 0, "customers": None})
+                    part["orders"] += 1
+                    part["priced_items"] += priced_items
+                    if revenue is not None:
+                        part["revenue"] = str(Decimal(part["revenue"]) + Decimal(revenue))
+                    if month_key not in sketches:
+                        sketches[month_key] = (HyperLogLog.from_text(part["customers"]) if part["customers"]
+                                               else HyperLogLog())
+                    sketches[month_key].add(customer_id)
+
+        for month_key, sketch in sketches.items():
+            state["months"][month_key]["customers"] = sketch.to_text()
+
+        if new_hwm is not None:
+            # The delta query re-reads the whole lookback window, so every order
+            # inside the new window is among the rows just read.
+            window_start = new_hwm - INCREMENTAL_LOOKBACK
+            state["boundary_order_ids"] = sorted(
+                order_id for purchased_at, order_id in recent if purchased_at > window_start)
+            state["high_water_mark"] = new_hwm.isoformat()
+        _save_state(state, path)
+        return state, folded
+
+
+def monthly_revenue_frame(state):
+    """Q3 shape: month, monthly_revenue (NULL for months with no priced items)."""
+    months = sorted(state["months"])
+    return pd.DataFrame({
+        "month": pd.to_datetime(months),
+        "monthly_revenue": [float(state["months"][m]["revenue"]) if state["months"][m]["priced_items"] else None
+                            for m in months],
+    })
+
+
+def orders_per_month_frame(state):
+    """Q7 shape: month, total_orders, unique_customers (HyperLogLog estimate)."""
+    months = sorted(state["months"])
+    return pd.DataFrame({
+        "month": pd.to_datetime(months),
+        "total_orders": [state["months"][m]["orders"] for m in months],
+        "unique_customers": [HyperLogLog.from_text(state["months"][m]["customers"]).count()
+                             if state["months"][m]["customers"] else 0 for m in months],
+    })
+
+
+def incremental_dataframe(key, path=INCREMENTAL_STATE_PATH):
+    """Refresh the aggregates and return the result for Q3 or Q7."""
+    state, folded = refresh_monthly_aggregates(path)
+    print(f"Incremental aggregates: folded {folded} new orders (high-water mark {state['high_water_mark']})")
+    if key == "Q3":
+        return monthly_revenue_frame(state)
+    if key == "Q7":
+        return orders_per_month_frame(state)
+    raise ValueError(f"No incremental aggregate for {key}")
@@ -0,0 +1,344 @@
+import argparse
+import json
+import re
+import sys
+from datetime import timedelta
+
+from benchmark import (BENCH_DBNAME, BENCH_REPEATS, compare_results, load_benchmark_queries,
+                       run_benchmark, seed_synthetic_dataset, use_database)
+from db import close_pool, pooled_connection
+from incremental import DELTA_SQL
+from seeding import REVIEW_SEED_PROBE_SQL, REVIEW_SEED_ORDERS_SQL
+
+# Index advisor for the report workload: every query in queries.sql, the two
+# lookups in seed_reviews_if_empty and the incremental delta scan. It reads the
+# EXPLAIN (ANALYZE, BUFFERS) plans captured by benchmark.py and proposes
+#   - btree indexes on join keys that are read with a sequential scan, and on
+#     columns compared by a selective filter of a sequential scan;
+#   - BRIN indexes for range filters on timestamp columns whose physical order
+#     follows their value (pg_stats.correlation), e.g. orders.order_purchase_timestamp,
+#     which only grows because new orders are appended by autoRefreshScript.py.
+# With --create it builds the proposals, re-runs the benchmark and drops the
+# ones no plan uses (unless --keep-unused).
+
+# A filter must remove at least this share of the rows it reads to justify an index
+FILTER_MIN_SELECTIVITY = 0.5
+# |pg_stats.correlation| needed before a timestamp range filter gets a BRIN index
+BRIN_MIN_CORRELATION = 0.9
+BRIN_PAGES_PER_RANGE = 32
+
+ADVISOR_INDEX_PREFIX = "adv_"
+SEED_ORDERS_LIMIT = 20
+DELTA_WINDOW = timedelta(days=1)
+
+_JOIN_COND = re.compile(r"\(?(\w+)\.(\w+)\)?(?:::\w+)?\s*=\s*\(?(\w+)\.(\w+)")
+_FILTER_PRED = re.compile(r"(?:\b(\w+)\.)?\b([a-z_]\w*)\)?(?:::[\w ]+)?\s*(=|<=|>=|<|>)\s*'")
+_RANGE_OPS = {"<", "<=", ">", ">="}
+
+
+def load_workload(path="queries.sql"):
+    """queries.sql plus the seeding and incremental queries, with parameters filled in."""
+    workload = load_benchmark_queries(path)
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(order_purchase_timestamp) FROM orders;")
+            latest = cur.fetchone()[0]
+            workload["seed.probe"] = REVIEW_SEED_PROBE_SQL
+            workload["seed.orders"] = cur.mogrify(REVIEW_SEED_ORDERS_SQL, (SEED_ORDERS_LIMIT,)).decode()
+            if latest is not None:
+                workload["incremental.delta"] = cur.mogrify(DELTA_SQL, (latest - DELTA_WINDOW,)).decode()
+    return workload
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def existing_indexes():
+    """{(table, leading column): set of access methods} for indexes in the public schema."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT t.relname, a.attname, am.amname
+                FROM pg_index i
+                         JOIN pg_class t ON t.oid = i.indrelid
+                         JOIN pg_class ic ON ic.oid = i.indexrelid
+                         JOIN pg_am am ON am.oid = ic.relam
+                         JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = i.indkey[0]
+                WHERE t.relnamespace = 'public'::regnamespace;
+            """)
+            indexes = {}
+            for table, column, method in cur.fetchall():
+                indexes.setdefault((table, column), set()).add(method)
+            return indexes
+
+
+def partition_roots():
+    """{table: root partitioned table} for partitioned tables and their partitions in the public schema."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, r.relname
+                FROM pg_class c
+                         JOIN pg_class r ON r.oid = pg_partition_root(c.oid)
+                WHERE c.relnamespace = 'public'::regnamespace AND (c.relkind = 'p' OR c.relispartition)
+                  AND c.relkind IN ('p', 'r');
+            """)
+            return dict(cur.fetchall())
+
+
+def column_stats(columns):
+    """{(table, column): (data type, correlation)} for the given pairs."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.table_name, c.column_name, c.data_type, s.correlation
+                FROM information_schema.columns c
+                         LEFT JOIN pg_stats s ON s.schemaname = c.table_schema
+                    AND s.tablename = c.table_name AND s.attname = c.column_name
+                WHERE c.table_schema = 'public';
+            """)
+            return {(t, col): (dtype, corr) for t, col, dtype, corr in cur.fetchall() if (t, col) in columns}
+
+
+def _scan_aliases(plan):
+    aliases = {}
+    for node in _plan_nodes(plan):
+        if "Relation Name" in node:
+            aliases[node.get("Alias", node["Relation Name"])] = (node["Relation Name"], node["Node Type"])
+    return aliases
+
+
+def collect_predicates(results, roots=None):
+    """Walk the captured plans and return (join keys, filters).
+
+    join keys: [(query, table, column)] for join columns read by a Seq Scan
+    filters:   [(query, table, column, operator, selectivity)] from Seq Scan filters
+
+    roots maps partitions to their partitioned table; the scans of all
+    partitions of a table count as one scan of that table.
+    """
+    roots = roots or {}
+    join_keys, filter_rows = [], {}
+    for key, result in results.items():
+        if "plan" not in result:
+            continue
+        plan = result["plan"]["Plan"]
+        aliases = _scan_aliases(plan)
+        for node in _plan_nodes(plan):
+            for cond_name in ("Hash Cond", "Merge Cond", "Join Filter"):
+                for left_alias, left_col, right_alias, right_col in _JOIN_COND.findall(node.get(cond_name, "")):
+                    for alias, column in ((left_alias, left_col), (right_alias, right_col)):
+                        table, scan_type = aliases.get(alias, (None, None))
+                        if scan_type == "Seq Scan":
+                            join_keys.append((key, roots.get(table, table), column))
+
+            if node["Node Type"] != "Seq Scan" or "Filter" not in node:
+                continue
+            kept = node.get("Actual Rows", 0) * node.get("Actual Loops", 1)
+            removed = node.get("Rows Removed by Filter", 0)
+            table = roots.get(node["Relation Name"], node["Relation Name"])
+            for _, column, op in _FILTER_PRED.findall(node["Filter"]):
+                rows = filter_rows.setdefault((key, table, column, op), [0, 0])
+                rows[0] += kept
+                rows[1] += removed
+    filters = [(key, table, column, op, removed / (kept + removed) if kept + removed else 0.0)
+               for (key, table, column, op), (kept, removed) in filter_rows.items()]
+    return join_keys, filters
+
+
+def propose_indexes(results):
+    """Turn the plans in a benchmark result into index proposals.
+
+    Returns (proposals, skipped); each proposal is a dict with table, column,
+    method, name, ddl and the reasons (query key and why) behind it.
+    """
+    # Plans scan the partitions; propose indexes on their partitioned table
+    roots = partition_roots()
+    partitioned = set(roots.values())
+    join_keys, filters = collect_predicates(results, roots)
+    existing = existing_indexes()
+    stats = column_stats({(t, c) for _, t, c in join_keys} | {(t, c) for _, t, c, _, _ in filters})
+
+    proposals, skipped = {}, []
+
+    def propose(table, column, method, query, reason):
+        if (table, column) not in stats:
+            return  # expression output or column of another schema
+        methods = existing.get((table, column), set())
+        if "btree" in methods or method in methods:
+            skipped.append({"query": query, "table": table, "column": column,
+                            "reason": f"already indexed ({', '.join(sorted(methods))})"})
+            return
+        name = f"{ADVISOR_INDEX_PREFIX}{table}_{column}_{method}"
+        entry = proposals.setdefault(name, {"name": name, "table": table, "column": column,
+                                            "method": method, "reasons": []})
+        entry["reasons"].append({"query": query, "reason": reason})
+
+    for query, table, column in join_keys:
+        propose(table, column, "btree", query, "join key read by a sequential scan")
+
+    for query, table, column, op, selectivity in filters:
+        if selectivity < FILTER_MIN_SELECTIVITY:
+            skipped.append({"query": query, "table": table, "column": column,
+                            "reason": f"filter {column} {op} keeps {1 - selectivity:.0%} of rows"})
+            continue
+        data_type, correlation = stats.get((table, column), ("", None))
+        if op in _RANGE_OPS and data_type.startswith("timestamp") and correlation is not None \
+                and abs(correlation) >= BRIN_MIN_CORRELATION:
+            propose(table, column, "brin", query,
+                    f"range filter removes {selectivity:.0%} of rows, correlation {correlation:.2f}")
+        else:
+            propose(table, column, "btree", query, f"filter {column} {op} removes {selectivity:.0%} of rows")
+
+    for entry in proposals.values():
+        using = "USING brin " if entry["method"] == "brin" else ""
+        storage = f" WITH (pages_per_range = {BRIN_PAGES_PER_RANGE})" if entry["method"] == "brin" else ""
+        # Postgres cannot build an index CONCURRENTLY on a partitioned table; a
+        # plain CREATE INDEX on the parent builds it on every partition, but
+        # blocks writes to the table until it is done
+        entry["partitioned"] = entry["table"] in partitioned
+        concurrently = "" if entry["partitioned"] else "CONCURRENTLY "
+        entry["ddl"] = (f"CREATE INDEX {concurrently}IF NOT EXISTS {entry['name']} "
+                        f"ON {entry['table']} {using}({entry['column']}){storage};")
+    ordered = sorted(proposals.values(), key=lambda e: (-len(e["reasons"]), e["name"]))
+    return ordered, skipped
+
+
+def _run_autocommit(statements):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    with pooled_connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in statements:
+                    cur.execute(statement)
+        finally:
+            conn.autocommit = False
+
+
+def _drop_indexes(names):
+    # Indexes on partitioned tables (relkind 'I') cannot be dropped CONCURRENTLY either
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT relname FROM pg_class WHERE relkind = 'I' AND relname = ANY(%s);", (list(names),))
+            partitioned = {row[0] for row in cur.fetchall()}
+    _run_autocommit([f"DROP INDEX {'' if name in partitioned else 'CONCURRENTLY '}IF EXISTS {name};"
+                     for name in names])
+
+
+def invalid_indexes(names):
+    """Those of `names` that exist but are INVALID, e.g. left by a failed CREATE INDEX CONCURRENTLY."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname
+                FROM pg_index i
+                         JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE NOT i.indisvalid AND c.relname = ANY(%s);
+            """, (list(names),))
+            return sorted(row[0] for row in cur.fetchall())
+
+
+def used_indexes(results):
+    """Names of the indexes that appear in any captured plan. Plans on a
+    partitioned table name the partitions' indexes, so the index of the
+    partitioned table they belong to counts as used too."""
+    names = {node["Index Name"] for result in results.values() if "plan" in result
+             for node in _plan_nodes(result["plan"]["Plan"]) if "Index Name" in node}
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT r.relname
+                FROM pg_class c
+                         JOIN pg_class r ON r.oid = pg_partition_root(c.oid)
+                WHERE c.relispartition AND c.relname = ANY(%s);
+            """, (list(names),))
+            return names | {row[0] for row in cur.fetchall()}
+
+
+def print_proposals(proposals, skipped):
+    if not proposals:
+        print("No index proposals.")
+    for entry in proposals:
+        queries = ", ".join(sorted({r["query"] for r in entry["reasons"]}))
+        print(f"{entry['ddl']}\n    -- {entry['reasons'][0]['reason']}; queries: {queries}")
+        if entry["partitioned"]:
+            print(f"    -- {entry['table']} is partitioned: built without CONCURRENTLY, writes wait for the build")
+    for entry in skipped:
+        print(f"Skipped {entry['table']}.{entry['column']} ({entry['query']}): {entry['reason']}")
+
+
+def advise(create=False, keep_unused=False, repeats=BENCH_REPEATS):
+    """Benchmark the workload, print proposals and (optionally) apply and verify them."""
+    workload = load_workload()
+    print("--- Baseline ---")
+    before = run_benchmark(workload, repeats)
+    proposals, skipped = propose_indexes(before["queries"])
+    print("--- Proposed indexes ---")
+    print_proposals(proposals, skipped)
+    report = {"proposals": proposals, "skipped": skipped, "before": before}
+    if not create or not proposals:
+        return report
+
+    # IF NOT EXISTS would keep an invalid index from an earlier failed build
+    invalid = invalid_indexes([entry["name"] for entry in proposals])
+    if invalid:
+        print(f"Rebuilding invalid index(es): {', '.join(invalid)}")
+        _drop_indexes(invalid)
+    _run_autocommit([entry["ddl"] for entry in proposals])
+    _run_autocommit([f"ANALYZE {table};" for table in sorted({e["table"] for e in proposals})])
+    print("--- With proposed indexes ---")
+    after = run_benchmark(workload, repeats)
+    print("--- Before / after ---")
+    compare_results(before, after)
+
+    used = used_indexes(after["queries"])
+    for entry in proposals:
+        entry["used"] = entry["name"] in used
+        print(f"{entry['name']}: {'used' if entry['used'] else 'not used by any plan'}")
+    unused = [entry["name"] for entry in proposals if not entry["used"]]
+    if unused and not keep_unused:
+        _drop_indexes(unused)
+        print(f"Dropped {len(unused)} unused index(es)")
+    report["after"] = after
+    return report
+
+
+def drop_advisor_indexes():
+    """Drop every index created by the advisor (names starting with ADVISOR_INDEX_PREFIX)."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND indexname LIKE %s;",
+                        (ADVISOR_INDEX_PREFIX + "%",))
+            names = [row[0] for row in cur.fetchall()]
+    _drop_indexes(names)
+    print(f"Dropped {len(names)} advisor index(es)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Propose indexes for the queries in queries.sql.")
+    parser.add_argument("--dbname", default=BENCH_DBNAME, help=f"database to inspect (default {BENCH_DBNAME})")
+    parser.add_argument("--scale", type=float, default=1.0, help="synthetic dataset size when seeding")
+    parser.add_argument("--no-seed", action="store_true", help="use the database as is")
+    parser.add_argument("--create", action="store_true", help="create the proposals and re-benchmark")
+    parser.add_argument("--keep-unused", action="store_true", help="keep created indexes no plan uses")
+    parser.add_argument("--drop", action="store_true", help="drop all indexes created by the advisor and exit")
+    parser.add_argument("--repeats", type=int, default=BENCH_REPEATS)
+    parser.add_argument("--output", default="index_advice.json")
+    args = parser.parse_args()
+
+    use_database(args.dbname)
+    if args.drop:
+        drop_advisor_indexes()
+        close_pool()
+        sys.exit(0)
+    if not args.no_seed:
+        seed_synthetic_dataset(args.scale)
+    result = advise(args.create, args.keep_unused, args.repeats)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=1, default=str)
+    print(f"Advice written to {args.output}")
+    close_pool()
@@ -1,23 +1,30 @@
-import psycopg2
-import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
+import time
+_IMPORT_START = time.perf_counter()
+
+import argparse
 import os
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-from openpyxl.formatting.rule import ColorScaleRule
+import hashlib
+import inspect
+import json
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import re
+import sys
+import threading
+import tracemalloc
+from datetime import date, datetime
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
-# Database Config
-
-DB_CONFIG = {
-    "dbname": "Urbancart",
-    "user": "postgres",
-    "password": "0000",
-    "host": "localhost",
+import metrics
 
-    "port": 5432
-}
+# pandas, numpy, psycopg2 (via db) and the other helper modules, as well as
+# matplotlib, plotly and openpyxl, are imported by the functions that use them,
+# so e.g. `main.py export --help` loads none of them and an Excel-only run never
+# loads the plotting libraries.
+BASE_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 
 # Folders
 CHARTS_DIR = "charts"
@@ -26,40 +33,33 @@ os.makedirs(CHARTS_DIR, exist_ok=True)
 os.makedirs(EXPORTS_DIR, exist_ok=True)
 
 
-# Utility: Query Runner
-
-def get_dataframe(query):
-    """Run a SQL query and return a pandas DataFrame"""
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        return pd.read_sql(query, conn)
-
-def execute_non_query(query, params=None):
-    """Run a SQL statement that does not return rows (INSERT/UPDATE/DELETE)."""
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, params or ())
-        conn.commit()
-
+# Utility: Load Queries from queries.sql
 
-# Utility: Load Assignment 2 Queries from queries.sql
+# Comment headers that start a query; group 1 is the query number
+ASSIGNMENT1_HEADER = r"^--\s*(\d+)\.\s"             # -- 8. Orders per month
+# Allows a note between the number and the colon. The original pattern
+# (r"^--\s*Q(\d+)\s*:") did not match "-- Q7 (Optional, ...):", so Q7's SQL
+# was appended to Q6: the scatter chart ran the Q7 statement and "Q7" was
+# missing (the slider fell back to its built-in query). Q6 is now only the
+# delivery-vs-review query and Q7 is read from queries.sql.
+ASSIGNMENT2_HEADER = r"^--\s*Q(\d+)\b[^:\n]*:"        # -- Q3: ... / -- Q7 (Optional, ...): ...
 
-def load_assignment2_queries(path="queries.sql"):
-    """Parse Assignment 2 queries (Q1..Q7) from queries.sql and normalize schema names.
-
-    Returns a dict like {"Q1": sql, ..., "Q7": sql}
-    """
-    if not os.path.exists(path):
-        return {}
 
+def _read_query_sections(path):
+    """Return (assignment 1 text, assignment 2 text) from queries.sql."""
     with open(path, "r", encoding="utf-8") as f:
         text = f.read()
 
-    # Extract the section after ASSIGNMENT 2 header if present
+    # Split at the ASSIGNMENT 2 header if present
     assign2_split = re.split(r"-+\s*ASSIGNMENT\s*2\s*QUERIES.*?\n", text, flags=re.IGNORECASE | re.DOTALL)
-    text_to_parse = assign2_split[-1] if len(assign2_split) > 1 else text
+    if len(assign2_split) > 1:
+        return assign2_split[0], assign2_split[-1]
+    return text, text
 
-    # Split by lines that look like -- Qn:
-    parts = re.split(r"(^--\s*Q(\d+)\s*:[^\n]*$)", text_to_parse, flags=re.MULTILINE)
+
+def _parse_query_sections(text_to_parse, header_pattern, key_prefix):
+    """Split text on header comments and return {key_prefix + number: sql}."""
+    parts = re.split(rf"({header_pattern}[^\n]*$)", text_to_parse, flags=re.MULTILINE)
     queries = {}
     # parts structure with capturing groups: [pre, header1, num1, body1, header2, num2, body2, ...]
     for idx in range(1, len(parts), 3):
@@ -67,181 +67,686 @@ def load_assignment2_queries(path="queries.sql"):
         num = parts[idx + 1] if (idx + 1) < len(parts) else None
         body = parts[idx + 2] if (idx + 2) < len(parts) else ""
 
-        match = re.match(r"^--\s*Q(\d+)\s*:", header)
-        key = f"Q{match.group(1)}" if match else (f"Q{num}" if num else None)
+        match = re.match(header_pattern, header)
+        key = f"{key_prefix}{match.group(1)}" if match else (f"{key_prefix}{num}" if num else None)
         if not key:
             continue
 
         sql = body.strip()
         # Stop at next header if any remnants included
-        sql = re.split(r"^--\s*Q\d+\s*:", sql, flags=re.MULTILINE)[0].strip()
+        sql = re.split(header_pattern, sql, flags=re.MULTILINE)[0].strip()
 
         # Normalize schema differences
         sql = sql.replace("order_reviews", "reviews")
-        sql = sql.replace("p.product_category", "p.product_category_name")
+        sql = re.sub(r"\bp\.product_category\b", "p.product_category_name", sql)
 
         queries[key] = sql
 
     return queries
 
 
+def load_assignment1_queries(path="queries.sql"):
+    """Parse the numbered Assignment 1 queries (-- 1. ... -- 10.) from queries.sql.
+
+    Returns a dict like {"A1.1": sql, ..., "A1.10": sql}
+    """
+    if not os.path.exists(path):
+        return {}
+    assign1_text, _ = _read_query_sections(path)
+    return _parse_query_sections(assign1_text, ASSIGNMENT1_HEADER, "A1.")
+
+
+def load_assignment2_queries(path="queries.sql", use_rollups=False):
+    """Parse Assignment 2 queries (Q1..Q7) from queries.sql and normalize schema names.
+
+    With use_rollups=True the queries are rewritten to read from the
+    materialized views managed by rollups.py (create them first with
+    ``python rollups.py create``).
+
+    Returns a dict like {"Q1": sql, ..., "Q7": sql}
+    """
+    if not os.path.exists(path):
+        return {}
+
+    _, assign2_text = _read_query_sections(path)
+    queries = _parse_query_sections(assign2_text, ASSIGNMENT2_HEADER, "Q")
+
+    if use_rollups:
+        from rollups import ROLLUP_QUERIES
+        queries.update({key: ROLLUP_QUERIES[key] for key in queries if key in ROLLUP_QUERIES})
+
+    return queries
+
+
+# Utility: Date Range
+# A date range (since, until) limits every query to orders purchased in
+# [since, until): each `FROM/JOIN orders` becomes a subquery with a constant
+# range on order_purchase_timestamp. The planner flattens it, so on a
+# partitioned orders table (partitioning.py) only the months in the range are
+# scanned, and otherwise the predicate uses idx_orders_purchase_ts. The tables
+# in DATED_TABLE_KEYS are limited to the rows belonging to those orders, so
+# every chart covers the range (e.g. Q4 only lists sellers who sold in it).
+
+_ORDERS_IN_RANGE = "SELECT order_id FROM orders WHERE {in_range}"
+
+# table -> (key column, query for the keys that belong to orders in the range)
+DATED_TABLE_KEYS = {
+    "order_items": ("order_id", _ORDERS_IN_RANGE),
+    "payments": ("order_id", _ORDERS_IN_RANGE),
+    "reviews": ("order_id", _ORDERS_IN_RANGE),
+    "customers": ("customer_id", "SELECT customer_id FROM orders WHERE {in_range}"),
+    "sellers": ("seller_id", f"SELECT seller_id FROM order_items WHERE order_id IN ({_ORDERS_IN_RANGE})"),
+}
+
+_DATED_TABLE_REF = re.compile(
+    r"\b(FROM|JOIN)\s+(orders|" + "|".join(DATED_TABLE_KEYS) + r")\b(?!\s*\()"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|GROUP|ORDER|LIMIT|JOIN|LEFT|RIGHT|INNER|FULL|CROSS|ON|USING|UNION|HAVING)\b)(\w+))?",
+    re.IGNORECASE)
+
+
+def date_range_from_args(since=None, until=None, last_months=None):
+    """(since, until) datetimes, either bound may be None; None if no range was given.
+
+    last_months=N starts the range at the first day of the month N-1 months
+    before the current one (N=1 is the current month so far); it replaces since.
+    """
+    if last_months:
+        from partitioning import add_months, month_start
+        since = add_months(month_start(date.today()), -(last_months - 1))
+    if since is None and until is None:
+        return None
+    as_datetime = lambda day: datetime.combine(day, datetime.min.time()) if day is not None else None
+    return as_datetime(since), as_datetime(until)
+
+
+def describe_date_range(date_range):
+    since, until = date_range
+    return (f"{since:%Y-%m-%d}" if since else "the first order",
+            f"{until:%Y-%m-%d}" if until else "the latest order")
+
+
+def restrict_to_date_range(sql, date_range):
+    """Rewrite `sql` so every table in DATED_TABLE_KEYS it reads only has the
+    rows of orders purchased in date_range."""
+    if not date_range:
+        return sql
+    from partitioning import PARTITION_KEY
+    since, until = date_range
+    bounds = []
+    if since is not None:
+        bounds.append(f"{PARTITION_KEY} >= '{since:%Y-%m-%d %H:%M:%S}'")
+    if until is not None:
+        bounds.append(f"{PARTITION_KEY} < '{until:%Y-%m-%d %H:%M:%S}'")
+    in_range = " AND ".join(bounds)
+
+    def subquery(table):
+        if table.lower() == "orders":
+            return f"(SELECT * FROM orders WHERE {in_range})"
+        key, keys_sql = DATED_TABLE_KEYS[table.lower()]
+        return f"(SELECT * FROM {table} WHERE {key} IN ({keys_sql.format(in_range=in_range)}))"
+
+    # One pass, so the orders subqueries inserted here are not rewritten again
+    return _DATED_TABLE_REF.sub(lambda m: f"{m.group(1)} {subquery(m.group(2))} {m.group(3) or m.group(2)}", sql)
+
+
 # Part 1: Charts
 
-def create_charts():
-    charts_info = []
-    queries = load_assignment2_queries()
+plt = None  # matplotlib.pyplot, set by use_pyplot()
+
 
+def use_pyplot():
+    """Import matplotlib.pyplot on first use, with the non-interactive Agg
+    backend: the charts are only saved to files, never shown."""
+    global plt
+    if plt is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot
+        plt = matplotlib.pyplot
+    return plt
+
+# Each renderer draws one chart from its query result, saves it and returns the
+# (rows, chart type, description) line for the console report, or None when the
+# data cannot be charted. They are module-level so worker processes can run them.
+
+def _render_customers_state_pie(df1):
     # 1. Pie Chart – Top states by number of customers (Q1)
-    q1 = queries.get("Q1")
-    if q1:
-        df1 = get_dataframe(q1)
-        value_col = "num_customers" if "num_customers" in df1.columns else df1.columns[-1]
-        label_col = "customer_state" if "customer_state" in df1.columns else df1.columns[0]
-        df1.set_index(label_col).plot.pie(y=value_col, autopct='%1.1f%%', legend=False, figsize=(7, 7))
-        plt.title("Distribution of Customers by State")
-        plt.ylabel("")
-        file1 = f"{CHARTS_DIR}/customers_state_pie.png"
-        plt.savefig(file1)
-        plt.close()
-        charts_info.append((len(df1), "Pie Chart", "Distribution of customers by state"))
+    value_col = "num_customers" if "num_customers" in df1.columns else df1.columns[-1]
+    label_col = "customer_state" if "customer_state" in df1.columns else df1.columns[0]
+    df1.set_index(label_col).plot.pie(y=value_col, autopct='%1.1f%%', legend=False, figsize=(7, 7))
+    plt.title("Distribution of Customers by State")
+    plt.ylabel("")
+    file1 = f"{CHARTS_DIR}/customers_state_pie.png"
+    plt.savefig(file1)
+    plt.close()
+    return (len(df1), "Pie Chart", "Distribution of customers by state")
+
 
+def _render_top_products_bar(df2):
     # 2. Bar Chart – Top product categories by revenue (Q2)
-    q2 = queries.get("Q2")
-    if q2:
-        df2 = get_dataframe(q2)
-        cat_col = "product_category_name" if "product_category_name" in df2.columns else ("product_category" if "product_category" in df2.columns else df2.columns[0])
-        ax2 = df2.plot.bar(x=cat_col, y="total_revenue", legend=False, figsize=(13, 7))
-        plt.title("Top Product Categories by Revenue")
-        plt.xlabel("Product Category")
-        plt.ylabel("Total Revenue")
-        plt.xticks(rotation=45, ha="right", fontsize=9)
-        plt.gcf().subplots_adjust(bottom=0.25)
-        plt.tight_layout()
-        file2 = f"{CHARTS_DIR}/top_products_bar.png"
-        plt.savefig(file2)
-        plt.close()
-        charts_info.append((len(df2), "Bar Chart", "Top product categories by revenue"))
+    cat_col = "product_category_name" if "product_category_name" in df2.columns else ("product_category" if "product_category" in df2.columns else df2.columns[0])
+    ax2 = df2.plot.bar(x=cat_col, y="total_revenue", legend=False, figsize=(13, 7))
+    plt.title("Top Product Categories by Revenue")
+    plt.xlabel("Product Category")
+    plt.ylabel("Total Revenue")
+    plt.xticks(rotation=45, ha="right", fontsize=9)
+    plt.gcf().subplots_adjust(bottom=0.25)
+    plt.tight_layout()
+    file2 = f"{CHARTS_DIR}/top_products_bar.png"
+    plt.savefig(file2)
+    plt.close()
+    return (len(df2), "Bar Chart", "Top product categories by revenue")
 
+
+def _render_monthly_revenue_line(df3):
     # 3. Line Chart – Monthly revenue trend (Q3)
-    q3 = queries.get("Q3")
-    if q3:
-        df3 = get_dataframe(q3)
-        time_col = "month" if "month" in df3.columns else df3.columns[0]
-        y_col = "monthly_revenue" if "monthly_revenue" in df3.columns else df3.columns[-1]
-        ax3 = df3.plot.line(x=time_col, y=y_col, marker="o", figsize=(13, 6))
-        plt.title("Monthly Revenue Trend")
-        plt.xlabel("Month")
-        plt.ylabel("Revenue")
-        plt.xticks(rotation=45, ha="right")
-        plt.gcf().subplots_adjust(bottom=0.25)
-        plt.tight_layout()
-        file3 = f"{CHARTS_DIR}/monthly_revenue_line.png"
-        plt.savefig(file3)
-        plt.close()
-        charts_info.append((len(df3), "Line Chart", "Monthly revenue trend"))
+    time_col = "month" if "month" in df3.columns else df3.columns[0]
+    y_col = "monthly_revenue" if "monthly_revenue" in df3.columns else df3.columns[-1]
+    ax3 = df3.plot.line(x=time_col, y=y_col, marker="o", figsize=(13, 6))
+    plt.title("Monthly Revenue Trend")
+    plt.xlabel("Month")
+    plt.ylabel("Revenue")
+    plt.xticks(rotation=45, ha="right")
+    plt.gcf().subplots_adjust(bottom=0.25)
+    plt.tight_layout()
+    file3 = f"{CHARTS_DIR}/monthly_revenue_line.png"
+    plt.savefig(file3)
+    plt.close()
+    return (len(df3), "Line Chart", "Monthly revenue trend")
+
 
+def _render_top_sellers_barh(df4):
     # 4. Horizontal Bar – Top sellers by revenue (Q4)
-    q4 = queries.get("Q4")
-    if q4:
-        df4 = get_dataframe(q4)
-        seller_col = "seller_id" if "seller_id" in df4.columns else df4.columns[0]
-        df4.plot.barh(x=seller_col, y="total_revenue", legend=False, figsize=(12, 7))
-        plt.title("Top Sellers by Revenue")
-        plt.xlabel("Total Revenue")
-        plt.ylabel("Seller")
-        plt.tight_layout()
-        file4 = f"{CHARTS_DIR}/top_sellers_barh.png"
-        plt.savefig(file4)
-        plt.close()
-        charts_info.append((len(df4), "Horizontal Bar Chart", "Top sellers by revenue"))
+    seller_col = "seller_id" if "seller_id" in df4.columns else df4.columns[0]
+    df4.plot.barh(x=seller_col, y="total_revenue", legend=False, figsize=(12, 7))
+    plt.title("Top Sellers by Revenue")
+    plt.xlabel("Total Revenue")
+    plt.ylabel("Seller")
+    plt.tight_layout()
+    file4 = f"{CHARTS_DIR}/top_sellers_barh.png"
+    plt.savefig(file4)
+    plt.close()
+    return (len(df4), "Horizontal Bar Chart", "Top sellers by revenue")
+
 
+def _render_review_scores_histogram(df5):
+    import pandas as pd
     # 5. Histogram – Distribution of review scores (Q5)
-    q5 = queries.get("Q5")
-    if q5:
-        df5 = get_dataframe(q5)
-        if "review_score" in df5.columns:
-            df5["review_score"] = pd.to_numeric(df5["review_score"], errors="coerce")
-            df5["review_score"].plot.hist(bins=5, rwidth=0.9, figsize=(10, 6))
-            plt.title("Distribution of Review Scores")
-            plt.xlabel("Review Score")
-            plt.ylabel("Frequency")
-            plt.tight_layout()
-            file5 = f"{CHARTS_DIR}/review_scores_histogram.png"
-            plt.savefig(file5)
-            plt.close()
-            charts_info.append((len(df5), "Histogram", "Distribution of review scores"))
+    if "review_score" not in df5.columns:
+        return None
+    df5["review_score"] = pd.to_numeric(df5["review_score"], errors="coerce")
+    df5["review_score"].plot.hist(bins=5, rwidth=0.9, figsize=(10, 6))
+    plt.title("Distribution of Review Scores")
+    plt.xlabel("Review Score")
+    plt.ylabel("Frequency")
+    plt.tight_layout()
+    file5 = f"{CHARTS_DIR}/review_scores_histogram.png"
+    plt.savefig(file5)
+    plt.close()
+    return (len(df5), "Histogram", "Distribution of review scores")
 
+
+def _render_delivery_vs_review_scatter(df6):
     # 6. Scatter Plot – Delivery time vs review score (Q6)
-    q6 = queries.get("Q6")
-    if q6:
-        df6 = get_dataframe(q6)
-        x_col = "delivery_days" if "delivery_days" in df6.columns else df6.columns[0]
-        y_col = "review_score" if "review_score" in df6.columns else df6.columns[-1]
-        df6.plot.scatter(x=x_col, y=y_col, alpha=0.4, figsize=(10, 6))
-        plt.title("Delivery Days vs Review Score")
-        plt.xlabel("Delivery Days")
-        plt.ylabel("Review Score")
-        plt.tight_layout()
-        file6 = f"{CHARTS_DIR}/delivery_vs_review_scatter.png"
-        plt.savefig(file6)
-        plt.close()
-        charts_info.append((len(df6), "Scatter Plot", "Delivery time vs review score"))
+    x_col = "delivery_days" if "delivery_days" in df6.columns else df6.columns[0]
+    y_col = "review_score" if "review_score" in df6.columns else df6.columns[-1]
+    df6.plot.scatter(x=x_col, y=y_col, alpha=0.4, figsize=(10, 6))
+    plt.title("Delivery Days vs Review Score")
+    plt.xlabel("Delivery Days")
+    plt.ylabel("Review Score")
+    plt.tight_layout()
+    file6 = f"{CHARTS_DIR}/delivery_vs_review_scatter.png"
+    plt.savefig(file6)
+    plt.close()
+    return (len(df6), "Scatter Plot", "Delivery time vs review score")
+
+
+# (query key, renderer) in report order
+CHART_RENDERERS = [
+    ("Q1", _render_customers_state_pie),
+    ("Q2", _render_top_products_bar),
+    ("Q3", _render_monthly_revenue_line),
+    ("Q4", _render_top_sellers_barh),
+    ("Q5", _render_review_scores_histogram),
+    ("Q6", _render_delivery_vs_review_scatter),
+]
+
+
+# Streamed variants for the per-review result sets (Q5/Q6): they take an
+# iterator of DataFrame chunks and never hold every row at once.
+
+def _render_review_scores_histogram_streamed(chunks):
+    import pandas as pd
+    counts = None
+    rows = 0
+    for chunk in chunks:
+        if "review_score" not in chunk.columns:
+            return None
+        scores = pd.to_numeric(chunk["review_score"], errors="coerce")
+        chunk_counts = scores.value_counts()
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+        rows += len(chunk)
+    if counts is None or counts.empty:
+        # No scores: draw the empty axes so the PNG does not keep an old histogram
+        plt.figure(figsize=(10, 6))
+    else:
+        # Weighting each distinct score by its count gives the same bins and bar
+        # heights as plotting every row
+        pd.Series(counts.index, dtype="float64").plot.hist(
+            weights=counts.values, bins=5, rwidth=0.9, figsize=(10, 6))
+    plt.title("Distribution of Review Scores")
+    plt.xlabel("Review Score")
+    plt.ylabel("Frequency")
+    plt.tight_layout()
+    file5 = f"{CHARTS_DIR}/review_scores_histogram.png"
+    plt.savefig(file5)
+    plt.close()
+    return (rows, "Histogram", "Distribution of review scores")
+
+
+def _render_delivery_vs_review_scatter_streamed(chunks):
+    # Each chunk is reduced to a count per distinct (x, y) point, so memory is
+    # bounded by the number of distinct points, not rows; they are drawn like
+    # the aggregated variant
+    import pandas as pd
+    counts = None
+    rows = 0
+    for chunk in chunks:
+        x_col = "delivery_days" if "delivery_days" in chunk.columns else chunk.columns[0]
+        y_col = "review_score" if "review_score" in chunk.columns else chunk.columns[-1]
+        chunk_counts = chunk.astype({x_col: "float32", y_col: "float32"}).groupby([x_col, y_col]).size()
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+        rows += len(chunk)
+    if counts is None:
+        counts = pd.Series([], dtype="float64", index=pd.MultiIndex.from_arrays([[], []]))
+    _draw_delivery_vs_review_counts(counts.index.get_level_values(0), counts.index.get_level_values(1),
+                                    counts.to_numpy(dtype="float64"))
+    return (rows, "Scatter Plot", "Delivery time vs review score")
+
+
+STREAMED_RENDERERS = {
+    "Q5": _render_review_scores_histogram_streamed,
+    "Q6": _render_delivery_vs_review_scatter_streamed,
+}
+
+
+# Aggregated variants for Q5/Q6: the binning happens in Postgres and only one
+# row per distinct value (or value pair) with its count "n" is transferred.
+
+def _aggregate_review_scores_sql(q5):
+    from db import normalize_sql
+    return (f"SELECT review_score, COUNT(*) AS n FROM ({normalize_sql(q5)}) AS q5 "
+            f"GROUP BY review_score ORDER BY review_score;")
+
+
+def _aggregate_delivery_vs_review_sql(q6):
+    from db import normalize_sql
+    return (f"SELECT delivery_days, review_score, COUNT(*) AS n FROM ({normalize_sql(q6)}) AS q6 "
+            f"GROUP BY delivery_days, review_score ORDER BY delivery_days, review_score;")
+
+
+def _render_review_scores_histogram_aggregated(df5):
+    import pandas as pd
+    if "review_score" not in df5.columns:
+        return None
+    scores = pd.to_numeric(df5["review_score"], errors="coerce")
+    present = scores.notna()
+    scores[present].astype("float64").plot.hist(
+        weights=df5.loc[present, "n"].to_numpy(), bins=5, rwidth=0.9, figsize=(10, 6))
+    plt.title("Distribution of Review Scores")
+    plt.xlabel("Review Score")
+    plt.ylabel("Frequency")
+    plt.tight_layout()
+    file5 = f"{CHARTS_DIR}/review_scores_histogram.png"
+    plt.savefig(file5)
+    plt.close()
+    return (int(df5["n"].sum()), "Histogram", "Distribution of review scores", len(df5))
+
+
+def _draw_delivery_vs_review_counts(x, y, n):
+    """Scatter of the distinct (x, y) points, each seen n times."""
+    # n overlapping markers drawn at alpha 0.4 blend to one marker at 1 - 0.6**n
+    import numpy as np
+    from matplotlib.colors import to_rgba
+    colors = np.tile(to_rgba("C0"), (len(n), 1))
+    colors[:, 3] = 1 - 0.6 ** n
+    fig, ax = plt.subplots(figsize=(10, 6))
+    # s=20 matches the marker size DataFrame.plot.scatter uses
+    ax.scatter(np.asarray(x, dtype="float64"), np.asarray(y, dtype="float64"), c=colors, s=20)
+    plt.title("Delivery Days vs Review Score")
+    plt.xlabel("Delivery Days")
+    plt.ylabel("Review Score")
+    plt.tight_layout()
+    file6 = f"{CHARTS_DIR}/delivery_vs_review_scatter.png"
+    plt.savefig(file6)
+    plt.close()
+
+
+def _render_delivery_vs_review_scatter_aggregated(df6):
+    x_col = "delivery_days" if "delivery_days" in df6.columns else df6.columns[0]
+    y_col = "review_score" if "review_score" in df6.columns else df6.columns[-2]
+    _draw_delivery_vs_review_counts(df6[x_col], df6[y_col], df6["n"].to_numpy(dtype="float64"))
+    return (int(df6["n"].sum()), "Scatter Plot", "Delivery time vs review score", len(df6))
+
+
+# query key -> (SQL rewrite, renderer)
+AGGREGATED_RENDERERS = {
+    "Q5": (_aggregate_review_scores_sql, _render_review_scores_histogram_aggregated),
+    "Q6": (_aggregate_delivery_vs_review_sql, _render_delivery_vs_review_scatter_aggregated),
+}
+
+
+def _init_render_worker():
+    use_pyplot().switch_backend("Agg")
+
+
+def _fetch_timed(key, fetch, query):
+    """fetch(query), recording latency and row count under ``key``."""
+    start = time.perf_counter()
+    df = fetch(query)
+    metrics.observe_query(key, time.perf_counter() - start, len(df))
+    return df
+
+
+def _timed_render(render, data):
+    # Runs in the render worker; the timing is sent back with the result
+    start = time.perf_counter()
+    info = render(data)
+    return info, time.perf_counter() - start
+
+
+# Chart cache: charts/manifest.json maps each query key to the content hash of
+# the chart it produced. The hash covers the query result and the renderer
+# (its source, so any change to the plotting code or parameters counts) plus the
+# matplotlib version. When the hash and the PNG on disk both match, the chart
+# is reused without rendering.
+CHART_MANIFEST_PATH = os.path.join(CHARTS_DIR, "manifest.json")
+
+# Output file per query key, for checking that a reused chart still exists
+CHART_FILES = {
+    "Q1": "customers_state_pie.png",
+    "Q2": "top_products_bar.png",
+    "Q3": "monthly_revenue_line.png",
+    "Q4": "top_sellers_barh.png",
+    "Q5": "review_scores_histogram.png",
+    "Q6": "delivery_vs_review_scatter.png",
+}
+
+
+def chart_content_hash(render, df):
+    """Hash of the chart `render` would draw from `df`, or None if the data is not hashable."""
+    try:
+        source = inspect.getsource(render)
+    except (OSError, TypeError):
+        source = render.__qualname__
+    h = hashlib.sha256()
+    import matplotlib
+    import pandas as pd
+    h.update(source.encode("utf-8"))
+    h.update(matplotlib.__version__.encode("utf-8"))
+    h.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    except TypeError:  # unhashable cell values (lists, dicts)
+        return None
+    return h.hexdigest()
+
+
+def _load_chart_manifest():
+    try:
+        with open(CHART_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_chart_manifest(manifest):
+    tmp_path = CHART_MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, CHART_MANIFEST_PATH)
+
+
+def _chart_file_matches(entry):
+    """True if the PNG recorded in a manifest entry is still the one we wrote."""
+    try:
+        st = os.stat(entry["file"])
+    except (OSError, KeyError):
+        return False
+    return st.st_size == entry.get("size") and st.st_mtime_ns == entry.get("mtime_ns")
+
+
+def _create_charts_parallel(jobs, load, max_workers=None, reuse=None):
+    """Fetch chart queries on a thread pool and render each one in a worker
+    process as soon as its data arrives. Returns (info, render seconds) per
+    job in report order. reuse(key, render, data) may return a cached info
+    tuple instead, in which case nothing is rendered and seconds is None."""
+    from db import POOL_MAX_CONN
+    workers = min(len(jobs), max_workers or len(jobs), POOL_MAX_CONN)
+    # Fork is much cheaper than re-importing pandas/matplotlib in every worker.
+    # The warm-up submit forks all workers before any fetch thread is started.
+    # A process that already runs other threads (e.g. a job of scheduler.py)
+    # must not fork: a lock held by one of them would stay locked in the child.
+    forkable = "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+    start_method = "fork" if forkable else "spawn"
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                             initializer=_init_render_worker) as renderers, \
+            ThreadPoolExecutor(max_workers=workers) as fetchers:
+        renderers.submit(int).result()
+        fetches = {fetchers.submit(load, key): (key, render) for key, render in jobs}
+        renders, reused = {}, {}
+        for done in as_completed(fetches):
+            key, render = fetches[done]
+            data = done.result()
+            info = reuse(key, render, data) if reuse else None
+            if info is not None:
+                reused[key] = (info, None)
+            else:
+                renders[key] = renderers.submit(_timed_render, render, data)
+        return [reused[key] if key in reused else renders[key].result() for key, _ in jobs]
+
+
+def create_charts(parallel=False, max_workers=None, use_cache=False, incremental=False,
+                  streaming=False, chunk_size=None, aggregated=False, use_rollups=False,
+                  reuse_charts=True, date_range=None):
+    """Generate the Assignment 2 charts (Q1..Q6) into CHARTS_DIR.
+
+    parallel=True fetches the queries concurrently and renders in a process
+    pool, since matplotlib is not thread-safe. Chart files and the console
+    report are identical to the sequential path. use_cache=True reads query
+    results through the on-disk result cache. incremental=True serves Q3 from
+    the persisted monthly aggregates, folding in only orders added since the
+    last run. streaming=True builds the Q5/Q6 charts in this process from
+    server-side cursor chunks of chunk_size rows (default db.STREAM_CHUNK_SIZE)
+    with compact dtypes.
+    aggregated=True bins Q5/Q6 in SQL so only a few hundred rows are
+    transferred; the report then also shows the transferred row counts.
+    use_rollups=True reads from the materialized views in rollups.py.
+    reuse_charts=True skips rendering a chart whose content hash matches the
+    one recorded in CHART_MANIFEST_PATH; streamed charts are always rendered.
+    date_range=(since, until) limits the queries that read orders to orders
+    purchased in that range (see restrict_to_date_range); it cannot be combined
+    with incremental or use_rollups, which serve precomputed full-history totals.
+    """
+    if date_range and (incremental or use_rollups):
+        raise ValueError("a date range cannot be combined with incremental or rollup queries")
+    from db import COMPACT_DTYPES, STREAM_CHUNK_SIZE, get_cached_dataframe, get_dataframe, iter_dataframe_chunks
+    from incremental import INCREMENTAL_QUERIES, incremental_dataframe
+    use_pyplot()
+    queries = load_assignment2_queries(use_rollups=use_rollups)
+    jobs = [(key, render) for key, render in CHART_RENDERERS if queries.get(key)]
+    if aggregated:
+        for idx, (key, render) in enumerate(jobs):
+            if key in AGGREGATED_RENDERERS:
+                rewrite, render = AGGREGATED_RENDERERS[key]
+                queries[key] = rewrite(queries[key])
+                jobs[idx] = (key, render)
+    queries = {key: restrict_to_date_range(sql, date_range) for key, sql in queries.items()}
+    fetch = get_cached_dataframe if use_cache else get_dataframe
+
+    def load(key):
+        if incremental and key in INCREMENTAL_QUERIES:
+            return _fetch_timed(key, incremental_dataframe, key)
+        return _fetch_timed(key, fetch, queries[key])
+
+    manifest = _load_chart_manifest()
+    digests = {}
+
+    def reuse(key, render, df):
+        # Hashed before rendering: some renderers modify their DataFrame
+        digests[key] = digest = chart_content_hash(render, df)
+        entry = manifest.get(key)
+        if (reuse_charts and digest and entry and entry["hash"] == digest
+                and entry["info"] is not None and _chart_file_matches(entry)):
+            return tuple(entry["info"])
+        return None
+
+    def render_or_reuse(key, render):
+        df = load(key)
+        info = reuse(key, render, df)
+        return (info, None) if info is not None else _timed_render(render, df)
+
+    streamed = [key for key, _ in jobs
+                if streaming and not aggregated and key in STREAMED_RENDERERS]
+    pooled_jobs = [(key, render) for key, render in jobs if key not in streamed]
+    if parallel and pooled_jobs:
+        rendered = _create_charts_parallel(pooled_jobs, load, max_workers, reuse)
+    else:
+        rendered = [render_or_reuse(key, render) for key, render in pooled_jobs]
+    infos, reused = {}, set()
+    now = time.time()
+    for (key, _), (info, seconds) in zip(pooled_jobs, rendered):
+        infos[key] = info
+        if seconds is None:
+            reused.add(key)
+            manifest[key].update(reused=True, last_run=now)
+            continue
+        metrics.observe_render(key, seconds)
+        path = os.path.join(CHARTS_DIR, CHART_FILES[key])
+        if info is None or digests.get(key) is None or not os.path.exists(path):
+            manifest.pop(key, None)
+            continue
+        st = os.stat(path)
+        manifest[key] = {"file": path, "hash": digests[key], "info": list(info), "size": st.st_size,
+                         "mtime_ns": st.st_mtime_ns, "rendered": now, "last_run": now, "reused": False}
+    for key in streamed:
+        # Fetching and rendering are interleaved, so the whole pass is timed as the query
+        start = time.perf_counter()
+        chunks = iter_dataframe_chunks(queries[key], chunk_size or STREAM_CHUNK_SIZE, COMPACT_DTYPES)
+        infos[key] = STREAMED_RENDERERS[key](chunks)
+        metrics.observe_query(key, time.perf_counter() - start, infos[key][0] if infos[key] else 0)
+        manifest.pop(key, None)  # the PNG was overwritten without a content hash
+    _save_chart_manifest(manifest)
+    charts_info = [(key, infos[key]) for key, _ in jobs]
 
     # Console report
-    for rows, gtype, desc in charts_info:
-        print(f"Generated {gtype}: {rows} rows → {desc}")
+    for key, info in charts_info:
+        if info is None:
+            continue
+        rows, gtype, desc = info[:3]
+        transferred = f" ({info[3]} transferred)" if len(info) > 3 else ""
+        action = "Reused" if key in reused else "Generated"
+        print(f"{action} {gtype}: {rows} rows{transferred} → {desc}")
+    if reused:
+        print(f"Chart cache: {len(reused)} of {len(jobs)} charts unchanged, not re-rendered")
 
-def seed_reviews_if_empty(max_inserts=20):
+def seed_reviews_if_empty(max_inserts=20, seed=None):
     """Insert synthetic reviews for delivered orders if reviews table is empty."""
+    from db import pooled_connection
+    from seeding import REVIEW_SEED_PROBE_SQL, bulk_seed_reviews
     try:
-        df_count = get_dataframe("SELECT COUNT(*) AS cnt FROM reviews;")
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(REVIEW_SEED_PROBE_SQL)
+                if cur.fetchone()[0]:
+                    return
     except Exception:
         return
-    if int(df_count.loc[0, "cnt"]) > 0:
-        return
-    # Select some delivered orders without a review
-    q_orders = """
-        SELECT o.order_id
-        FROM orders o
-        LEFT JOIN reviews r ON r.order_id = o.order_id
-        WHERE o.order_status = 'delivered' AND r.order_id IS NULL
-        LIMIT %s; \
-    """
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        with conn.cursor() as cur:
-            cur.execute(q_orders, (max_inserts,))
-            order_ids = [row[0] for row in cur.fetchall()]
-        conn.commit()
-    if not order_ids:
-        return
-    insert_sql = """
-        INSERT INTO reviews (review_id, order_id, review_score, review_comment_title, review_comment_message, review_creation_date, review_answer_timestamp)
-        VALUES (gen_random_uuid(), %s, %s, %s, %s, NOW(), NOW()); \
-    """
-    import random
-    titles = ["Great", "Ok", "Bad", "Awesome", "Average", "Late delivery", "As expected"]
-    messages = [
-        "Product met expectations.",
-        "Delivery was on time.",
-        "Item arrived late but works.",
-        "Excellent quality!",
-        "Could be better.",
-        "Not satisfied with packaging.",
-        "Good value for money."
-    ]
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        with conn.cursor() as cur:
-            for oid in order_ids:
-                score = random.randint(1, 5)
-                cur.execute(insert_sql, (oid, score, random.choice(titles), random.choice(messages)))
-        conn.commit()
-    print(f"Seeded {len(order_ids)} synthetic reviews to enable histogram.")
+    stats = bulk_seed_reviews(max_inserts, seed=seed, only_missing=True, verbose=False)
+    if stats["rows"]:
+        print(f"Seeded {stats['rows']} synthetic reviews to enable histogram.")
 
 
 # Part 2: Time Slider (Plotly)
+# The figure is built from per-year slices aggregated up front: the x axis is
+# the 12 months of a year and each animation frame only carries that year's 12
+# values as float32 (plotly >= 6 writes them as base64 typed arrays). A frame's
+# size does not depend on the number of months, and the axes stay fixed.
+
+MONTH_LABELS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+SLIDER_OUTPUT = os.path.join(CHARTS_DIR, "time_slider.html")
+# How a saved HTML slider loads plotly.js: from the CDN (small file, needs
+# network), inlined (offline, ~4.5 MB larger), or as plotly.min.js next to it
+SLIDER_PLOTLYJS = {"cdn": "cdn", "inline": True, "directory": "directory"}
+
+
+def _slider_slices(df, value_col):
+    """{year: float32 array of the 12 monthly values, NaN where a month has no data}."""
+    import numpy as np
+    import pandas as pd
+    monthly = pd.DataFrame({
+        "year": df["month"].dt.year,
+        "month": df["month"].dt.month,
+        "value": pd.to_numeric(df[value_col], errors="coerce"),
+    }).groupby(["year", "month"])["value"].sum()
+    slices = {}
+    for year, values in monthly.groupby(level="year"):
+        y = np.full(12, np.nan, dtype="float32")
+        y[values.index.get_level_values("month").to_numpy() - 1] = values.to_numpy(dtype="float32")
+        slices[int(year)] = y
+    return slices
+
+
+def build_time_slider_figure(df, title="Orders Over Time (Interactive)"):
+    """Bar chart of df's second column per month with one animation frame per year."""
+    import numpy as np
+    import plotly.graph_objects as go
+    value_col = df.columns[1]
+    slices = _slider_slices(df, value_col)
+    years = sorted(slices)
+    y_max = max((float(np.nanmax(y)) for y in slices.values() if not np.isnan(y).all()), default=0.0)
+
+    frames = [go.Frame(data=[go.Bar(y=slices[year])], name=str(year)) for year in years]
+    fig = go.Figure(
+        data=[go.Bar(x=MONTH_LABELS, y=slices[years[0]] if years else [], name=value_col)],
+        frames=frames,
+    )
+    animate = {"mode": "immediate", "frame": {"duration": 500, "redraw": False}, "transition": {"duration": 300}}
+    fig.update_layout(
+        title=title,
+        xaxis={"title": "month", "categoryorder": "array", "categoryarray": MONTH_LABELS},
+        yaxis={"title": value_col, "range": [0, y_max * 1.05 or 1]},
+        updatemenus=[{"type": "buttons", "showactive": False, "x": 0.1, "y": 0, "xanchor": "right", "yanchor": "top",
+                      "buttons": [{"label": "▶", "method": "animate", "args": [None, {**animate, "fromcurrent": True}]},
+                                  {"label": "◼", "method": "animate", "args": [[None], animate]}]}],
+        sliders=[{"active": 0, "x": 0.1, "len": 0.9, "currentvalue": {"prefix": "year="},
+                  "steps": [{"label": str(year), "method": "animate", "args": [[str(year)], animate]}
+                            for year in years]}],
+    )
+    return fig
 
-def time_slider_chart():
-    queries = load_assignment2_queries()
+
+def save_time_slider(fig, path, plotlyjs="cdn"):
+    """Write the figure as self-contained HTML, or as plotly JSON when path ends in .json."""
+    if path.endswith(".json"):
+        fig.write_json(path)
+    else:
+        fig.write_html(path, include_plotlyjs=SLIDER_PLOTLYJS[plotlyjs], full_html=True, auto_play=False)
+    return os.path.getsize(path)
+
+
+def time_slider_chart(use_cache=False, incremental=False, use_rollups=False, show=False,
+                      output=None, plotlyjs="cdn", date_range=None):
+    """Build the orders-per-month time slider (Q7). With output set, it is
+    saved there (see save_time_slider); otherwise show=True opens it with
+    fig.show(), which starts a browser.
+    date_range limits it to orders purchased in that range, as in create_charts."""
+    if date_range and (incremental or use_rollups):
+        raise ValueError("a date range cannot be combined with incremental or rollup queries")
+    import pandas as pd
+    from db import get_cached_dataframe, get_dataframe
+    from incremental import incremental_dataframe
+    queries = load_assignment2_queries(use_rollups=use_rollups)
     q = queries.get("Q7")
     if not q:
         # Fallback if Q7 not present
@@ -249,22 +754,36 @@ def time_slider_chart():
             "SELECT DATE_TRUNC('month', order_purchase_timestamp) AS month, "
             "COUNT(*) AS total_orders FROM orders GROUP BY month ORDER BY month;"
         )
-    df = get_dataframe(q)
+    if incremental:
+        df = _fetch_timed("Q7", incremental_dataframe, "Q7")
+    else:
+        q = restrict_to_date_range(q, date_range)
+        df = _fetch_timed("Q7", get_cached_dataframe if use_cache else get_dataframe, q)
     # Ensure we have a time column named month
     if "month" not in df.columns:
         # Use first datetime-like column if exists
         df.rename(columns={df.columns[0]: "month"}, inplace=True)
     df["month"] = pd.to_datetime(df["month"])
-    df["year"] = df["month"].dt.year
 
-    fig = px.bar(df, x="month", y=df.columns[1],
-                 animation_frame="year",
-                 title="Orders Over Time (Interactive)")
-    fig.show()
+    fig = build_time_slider_figure(df)
+    if output:
+        start = time.perf_counter()
+        size = save_time_slider(fig, output, plotlyjs)
+        metrics.observe_render("Q7", time.perf_counter() - start)
+        where = "" if output.endswith(".json") else f", plotly.js {plotlyjs}"
+        print(f"Saved time slider: {len(df)} months in {len(fig.frames)} yearly frames → "
+              f"{output} ({size / 1024:.1f} KB{where})")
+    elif show:
+        fig.show()
+    return fig
 
 
 # Part 3: Export to Excel
 def export_to_excel(dataframes_dict, filename):
+    import pandas as pd
+    from openpyxl import load_workbook
+    from openpyxl.formatting.rule import ColorScaleRule
+    start = time.perf_counter()
     filepath = os.path.join(EXPORTS_DIR, filename)
     with pd.ExcelWriter(filepath, engine="openpyxl") as writer:
         for sheet_name, df in dataframes_dict.items():
@@ -300,23 +819,286 @@ def export_to_excel(dataframes_dict, filename):
         total_rows += max(ws.max_row - 1, 0)
 
     wb.save(filepath)
+    metrics.observe_excel(filename, time.perf_counter() - start)
     print(f"Created file {filename}, {len(dataframes_dict)} sheets, {total_rows} rows")
 
+
+EXCEL_MAX_DATA_ROWS = 1048575  # Excel's row limit minus the header row
+
+
+def _numeric_rule():
+    from openpyxl.formatting.rule import ColorScaleRule
+    return ColorScaleRule(
+        start_type="min", start_color="FFAA0000",
+        mid_type="percentile", mid_value=50, mid_color="FFFFFF00",
+        end_type="max", end_color="FF00AA00"
+    )
+
+
+def _excel_value(value, isna):
+    # NULL floats/timestamps arrive as NaN/NaT; write them as empty cells like to_excel does.
+    # isna is pandas.isna, passed in to keep the per-cell import lookup out of this loop.
+    try:
+        return None if isna(value) else value
+    except (TypeError, ValueError):
+        return value
+
+
+def _finish_streamed_sheet(ws, columns, numeric_cols, rows):
+    from openpyxl.utils import get_column_letter
+    last_col = get_column_letter(max(len(columns), 1))
+    ws.auto_filter.ref = f"A1:{last_col}{rows + 1}"
+    if rows:
+        for idx in numeric_cols:
+            col_letter = get_column_letter(idx + 1)
+            ws.conditional_formatting.add(f"{col_letter}2:{col_letter}{rows + 1}", _numeric_rule())
+
+
+def _peak_memory_mb():
+    """Peak resident set size of this process, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def export_to_excel_streaming(queries_dict, filename, chunk_size=None):
+    """Export {sheet name: SQL} to Excel without materializing whole tables.
+
+    Rows are read in server-side cursor chunks and appended to a write-only
+    workbook. Numeric columns (for the color scale) are taken from the first
+    chunk's dtypes, so there is no second pass over the cells. Sheets longer
+    than Excel's row limit continue on "<name> (2)", "<name> (3)", ...
+
+    Reports the process peak RSS; where the resource module is missing
+    (Windows) the peak of Python allocations is traced instead, which makes
+    the export noticeably slower.
+    """
+    import pandas as pd
+    from openpyxl import Workbook
+    from db import STREAM_CHUNK_SIZE, iter_dataframe_chunks
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    start = time.perf_counter()
+    filepath = os.path.join(EXPORTS_DIR, filename)
+    if resource is None:
+        tracemalloc.start()
+    wb = Workbook(write_only=True)
+    total_rows = 0
+    sheet_count = 0
+    for sheet_name, query in queries_dict.items():
+        sheet_start = time.perf_counter()
+        sheet_rows = total_rows
+        ws = None
+        part = 1
+        rows = 0
+        columns = []
+        numeric_cols = []
+        for chunk in iter_dataframe_chunks(query, chunk_size):
+            if ws is None:
+                columns = list(chunk.columns)
+                numeric_cols = [idx for idx, col in enumerate(columns)
+                                if pd.api.types.is_numeric_dtype(chunk[col])
+                                and not pd.api.types.is_bool_dtype(chunk[col])]
+                ws = wb.create_sheet(sheet_name)
+                ws.freeze_panes = "B2"
+                ws.append(columns)
+                sheet_count += 1
+            for record in chunk.itertuples(index=False, name=None):
+                if rows == EXCEL_MAX_DATA_ROWS:
+                    _finish_streamed_sheet(ws, columns, numeric_cols, rows)
+                    total_rows += rows
+                    part += 1
+                    rows = 0
+                    ws = wb.create_sheet(f"{sheet_name} ({part})")
+                    ws.freeze_panes = "B2"
+                    ws.append(columns)
+                    sheet_count += 1
+                ws.append([_excel_value(value, pd.isna) for value in record])
+                rows += 1
+        if ws is not None:
+            _finish_streamed_sheet(ws, columns, numeric_cols, rows)
+            total_rows += rows
+        # Rows are fetched and written in one pass, so the time includes the appends
+        metrics.observe_query(f"stream_export:{sheet_name}", time.perf_counter() - sheet_start, total_rows - sheet_rows)
+
+    wb.save(filepath)
+    metrics.observe_excel(filename, time.perf_counter() - start)
+    if resource is None:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    else:
+        peak_mb = _peak_memory_mb()
+    print(f"Created file {filename}, {sheet_count} sheets, {total_rows} rows "
+          f"(streamed, peak memory {peak_mb:.1f} MB)")
+
 # Main
-if __name__ == "__main__":
-    print("=== Generating Charts ===")
+# Command line: python main.py [seed|charts|slider|export|all] [options]
+STAGES = ["seed", "charts", "slider", "export"]
+STAGE_TITLES = {
+    "seed": "Seeding Reviews",
+    "charts": "Generating Charts",
+    "slider": "Building Interactive Time Slider",
+    "export": "Exporting Data to Excel",
+}
+# Libraries each stage imports on first use; timed separately from the stage's work
+STAGE_MODULES = {
+    "seed": ["db", "seeding"],
+    "charts": ["numpy", "pandas", "db", "incremental", "partitioning"],
+    "slider": ["numpy", "pandas", "db", "incremental", "partitioning", "plotly.graph_objects"],
+    "export": ["pandas", "db", "partitioning", "openpyxl", "openpyxl.formatting.rule", "openpyxl.utils"],
+}
+
+
+def _import_stage(stage):
+    if stage == "charts":
+        use_pyplot()
+    for name in STAGE_MODULES.get(stage, []):
+        __import__(name)
+
+
+def run_seed(args):
+    if args.seed_reviews:
+        from seeding import bulk_seed_reviews, print_seed_report
+        # Bulk synthetic reviews for performance testing (see seeding.py)
+        print_seed_report(bulk_seed_reviews(args.seed_reviews, seed=args.seed))
+        return
     # Seed reviews if empty so histogram is non-empty for defense
-    seed_reviews_if_empty()
-    create_charts()
+    seed_reviews_if_empty(seed=args.seed)
+
+
+def run_charts(args):
+    create_charts(parallel=args.parallel, use_cache=args.cache, incremental=args.incremental,
+                  streaming=args.streaming, aggregated=args.aggregated, use_rollups=args.rollups,
+                  reuse_charts=not args.force_render, date_range=args.date_range)
+
 
-    print("\n=== Showing Interactive Time Slider ===")
-    time_slider_chart()
+def run_slider(args):
+    time_slider_chart(use_cache=args.cache, incremental=args.incremental, use_rollups=args.rollups,
+                      show=args.show, output=args.slider_output, plotlyjs=args.plotlyjs,
+                      date_range=args.date_range)
 
-    print("\n=== Exporting Data to Excel ===")
+
+def export_sql(table, date_range=None, limit=None):
+    """SELECT * of an exported table, limited to date_range by restrict_to_date_range."""
+    sql = f"SELECT * FROM {table}"
+    sql += f" LIMIT {limit};" if limit else ";"
+    return restrict_to_date_range(sql, date_range)
+
+
+def run_export(args):
+    from db import get_dataframe
     # Example export: export some useful tables
     dfs = {
-        "Payments": get_dataframe("SELECT * FROM payments LIMIT 100;"),
-        "Orders": get_dataframe("SELECT * FROM orders LIMIT 100;"),
-        "Reviews": get_dataframe("SELECT * FROM reviews LIMIT 100;"),
+        "Payments": _fetch_timed("export:Payments", get_dataframe, export_sql("payments", args.date_range, 100)),
+        "Orders": _fetch_timed("export:Orders", get_dataframe, export_sql("orders", args.date_range, 100)),
+        "Reviews": _fetch_timed("export:Reviews", get_dataframe, export_sql("reviews", args.date_range, 100)),
     }
     export_to_excel(dfs, "report.xlsx")
+
+    if args.stream_export:
+        # Full tables, streamed in chunks into a write-only workbook
+        export_to_excel_streaming({
+            "Payments": export_sql("payments", args.date_range),
+            "Orders": export_sql("orders", args.date_range),
+            "Reviews": export_sql("reviews", args.date_range),
+        }, "report_full.xlsx")
+
+
+STAGE_RUNNERS = {"seed": run_seed, "charts": run_charts, "slider": run_slider, "export": run_export}
+
+
+def print_stage_timings(timings):
+    """timings: [(stage, import seconds, run seconds)]"""
+    print("\n=== Stage timings ===")
+    print(f"{'stage':<10} {'import s':>9} {'run s':>9}")
+    for stage, imported, ran in timings:
+        ran_text = f"{ran:9.3f}" if ran is not None else f"{'-':>9}"
+        print(f"{stage:<10} {imported:9.3f} {ran_text}")
+    total = sum(imported + (ran or 0) for _, imported, ran in timings)
+    print(f"{'total':<10} {total:19.3f}")
+
+
+def _month_count(text):
+    months = int(text)
+    if months < 1:
+        raise argparse.ArgumentTypeError("must be at least 1 (1 = the current month)")
+    return months
+
+
+def add_report_arguments(parser):
+    """Options of the report stages; shared with the job scheduler in scheduler.py."""
+    parser.add_argument("--parallel", action="store_true", help="fetch concurrently, render in a process pool")
+    parser.add_argument("--cache", action="store_true", help="read query results through the on-disk cache")
+    parser.add_argument("--incremental", action="store_true", help="Q3/Q7 from persisted monthly aggregates")
+    parser.add_argument("--rollups", action="store_true", help="read from the materialized views in rollups.py")
+    parser.add_argument("--streaming", action="store_true", help="build Q5/Q6 from server-side cursor chunks")
+    parser.add_argument("--aggregated", action="store_true", help="bin Q5/Q6 in SQL")
+    parser.add_argument("--force-render", action="store_true", help="redraw charts even if unchanged")
+    parser.add_argument("--show", action="store_true",
+                        help="open the time slider in a browser instead of saving it")
+    parser.add_argument("--no-show", action="store_true", help=argparse.SUPPRESS)  # the default now; kept for old cron lines
+    parser.add_argument("--slider-out", nargs="?", const=SLIDER_OUTPUT,
+                        help=f"save the time slider as HTML (or .json) to this path (default {SLIDER_OUTPUT})")
+    parser.add_argument("--plotlyjs", choices=sorted(SLIDER_PLOTLYJS), default="cdn",
+                        help="how the saved HTML loads plotly.js (default: cdn)")
+    parser.add_argument("--stream-export", action="store_true", help="also export full tables to report_full.xlsx")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--since", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                       help="only orders purchased on or after this date (charts, slider, export)")
+    start.add_argument("--last-months", type=_month_count, metavar="N",
+                       help="only orders purchased in the current and previous N-1 months")
+    parser.add_argument("--until", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="only orders purchased before this date")
+
+
+def parse_report_args(parser, argv=None):
+    """parse_args plus the derived args.date_range."""
+    args = parser.parse_args(argv)
+    # The slider is saved unless --show asks for a browser, so `all` is safe under cron
+    args.slider_output = args.slider_out or (None if args.show else SLIDER_OUTPUT)
+    args.date_range = date_range_from_args(args.since, args.until, args.last_months)
+    if args.date_range and (args.incremental or args.rollups):
+        parser.error("--since/--until/--last-months cannot be combined with --incremental or --rollups")
+    return args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UrbanCart report: seed reviews, charts, time slider, Excel export.")
+    parser.add_argument("stage", nargs="?", default="all", choices=STAGES + ["all"],
+                        help="stage to run (default: all, in the order seed, charts, slider, export)")
+    add_report_arguments(parser)
+    parser.add_argument("--seed-reviews", type=int, metavar="N",
+                        help="seed stage: COPY N synthetic reviews even if reviews is not empty")
+    parser.add_argument("--seed", type=int, help="random seed for the synthetic reviews")
+    parser.add_argument("--metrics-file", help="write pipeline metrics to this file (Prometheus text format)")
+    parser.add_argument("--pushgateway", help="push pipeline metrics to this Pushgateway (host:port)")
+    parser.add_argument("--metrics-port", type=int, help="serve pipeline metrics on this port for a while")
+    args = parse_report_args(parser, argv)
+
+    run_start = time.perf_counter()
+    timings = [("startup", BASE_IMPORT_SECONDS, None)]
+    stages = STAGES if args.stage == "all" else [args.stage]
+    if args.date_range:
+        print("Orders purchased from {} until {}".format(*describe_date_range(args.date_range)))
+    for idx, stage in enumerate(stages):
+        if idx:
+            print()
+        print(f"=== {STAGE_TITLES[stage]} ===")
+        start = time.perf_counter()
+        _import_stage(stage)
+        imported = time.perf_counter() - start
+        STAGE_RUNNERS[stage](args)
+        timings.append((stage, imported, time.perf_counter() - start - imported))
+
+    from db import cache_summary, close_pool, pool_summary
+    print(pool_summary())
+    if args.cache:
+        print(cache_summary())
+    close_pool()
+    print_stage_timings(timings)
+
+    metrics.mark_run_finished(time.perf_counter() - run_start)
+    metrics.publish(textfile=args.metrics_file, pushgateway=args.pushgateway, port=args.metrics_port)
+
+
+if __name__ == "__main__":
+    main()
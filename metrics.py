@@ -0,0 +1,129 @@
+import time
+
+# Prometheus instrumentation of the report pipeline (main.py). The metrics live
+# in their own registry, so a batch run publishes only pipeline metrics. A run
+# is short-lived, so publish() supports three ways out: a text file in the
+# exposition format (node_exporter textfile collector), a push to a
+# Pushgateway, or a temporary HTTP endpoint kept up long enough to be scraped.
+# The long-running job scheduler (scheduler.py) adds its queue and job metrics
+# and serves the registry with serve(). Without prometheus_client installed
+# every observe_* call is a no-op.
+
+try:
+    from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, push_to_gateway,
+                                   start_http_server, write_to_textfile)
+except ImportError:  # optional dependency
+    CollectorRegistry = None
+
+METRICS_JOB = "urbancart_report"
+# Keep the temporary endpoint up for at least one 15s scrape interval
+METRICS_LINGER_SECONDS = 30
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+REGISTRY = CollectorRegistry() if CollectorRegistry else None
+
+if REGISTRY is not None:
+    QUERY_SECONDS = Histogram("urbancart_report_query_seconds", "Query latency per report query",
+                              ["query"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    QUERY_ROWS = Histogram("urbancart_report_query_rows", "Rows fetched per report query",
+                           ["query"], buckets=ROW_BUCKETS, registry=REGISTRY)
+    CHART_RENDER_SECONDS = Histogram("urbancart_report_chart_render_seconds", "Chart render and save time",
+                                     ["chart"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    EXCEL_WRITE_SECONDS = Histogram("urbancart_report_excel_write_seconds", "Excel workbook write time",
+                                    ["workbook"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    DB_CONNECT_SECONDS = Histogram("urbancart_db_connect_seconds", "Time to open a database connection",
+                                   buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    RUN_SECONDS = Gauge("urbancart_report_run_seconds", "Wall-clock duration of the last report run",
+                        registry=REGISTRY)
+    LAST_SUCCESS = Gauge("urbancart_report_last_success_timestamp_seconds",
+                         "Unix time the last report run finished", registry=REGISTRY)
+    # Report job scheduler (scheduler.py)
+    JOB_QUEUE_DEPTH = Gauge("urbancart_scheduler_queue_depth", "Report jobs waiting for a worker",
+                            registry=REGISTRY)
+    JOB_WAIT_SECONDS = Histogram("urbancart_scheduler_job_wait_seconds", "Time a job spent in the queue",
+                                 ["job"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    JOB_RUN_SECONDS = Histogram("urbancart_scheduler_job_seconds", "Run time per report job",
+                                ["job", "outcome"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    JOB_COALESCED = Counter("urbancart_scheduler_job_coalesced_total",
+                            "Triggers folded into a queued, running or already pending run", ["job"],
+                            registry=REGISTRY)
+
+
+def observe_query(key, seconds, rows):
+    if REGISTRY is not None:
+        QUERY_SECONDS.labels(query=key).observe(seconds)
+        QUERY_ROWS.labels(query=key).observe(rows)
+
+
+def observe_render(chart, seconds):
+    if REGISTRY is not None:
+        CHART_RENDER_SECONDS.labels(chart=chart).observe(seconds)
+
+
+def observe_excel(workbook, seconds):
+    if REGISTRY is not None:
+        EXCEL_WRITE_SECONDS.labels(workbook=workbook).observe(seconds)
+
+
+def observe_connect(seconds):
+    if REGISTRY is not None:
+        DB_CONNECT_SECONDS.observe(seconds)
+
+
+def mark_run_finished(seconds):
+    if REGISTRY is not None:
+        RUN_SECONDS.set(seconds)
+        LAST_SUCCESS.set(time.time())
+
+
+def set_queue_depth(depth):
+    if REGISTRY is not None:
+        JOB_QUEUE_DEPTH.set(depth)
+
+
+def observe_job(job, wait_seconds, seconds, outcome):
+    if REGISTRY is not None:
+        JOB_WAIT_SECONDS.labels(job=job).observe(wait_seconds)
+        JOB_RUN_SECONDS.labels(job=job, outcome=outcome).observe(seconds)
+
+
+def observe_coalesced(job):
+    if REGISTRY is not None:
+        JOB_COALESCED.labels(job=job).inc()
+
+
+def serve(port):
+    """Serve the metrics on this port until the process exits (long-running jobs)."""
+    if REGISTRY is None:
+        print("prometheus_client is not installed; metrics are not served.")
+        return
+    start_http_server(port, registry=REGISTRY)
+    print(f"Serving metrics on :{port}/metrics")
+
+
+def publish(textfile=None, pushgateway=None, port=None, linger=METRICS_LINGER_SECONDS):
+    """Publish the pipeline metrics at the end of a batch run.
+
+    textfile: path to write in the Prometheus text format (written atomically)
+    pushgateway: host:port of a Pushgateway; pushed under job METRICS_JOB
+    port: serve /metrics on this port for ``linger`` seconds, then return
+    """
+    if not (textfile or pushgateway or port):
+        return
+    if REGISTRY is None:
+        print("prometheus_client is not installed; metrics were not published.")
+        return
+    if textfile:
+        write_to_textfile(textfile, REGISTRY)
+        print(f"Metrics written to {textfile}")
+    if pushgateway:
+        push_to_gateway(pushgateway, job=METRICS_JOB, registry=REGISTRY)
+        print(f"Metrics pushed to {pushgateway} (job {METRICS_JOB})")
+    if port:
+        server, thread = start_http_server(port, registry=REGISTRY)
+        print(f"Serving metrics on :{port}/metrics for {linger}s...")
+        time.sleep(linger)
+        server.shutdown()
+        thread.join()
@@ -0,0 +1,351 @@
+import argparse
+import time
+from datetime import date, datetime
+
+from db import DB_CONFIG, pooled_connection
+
+# Monthly range partitioning of orders on order_purchase_timestamp. A query
+# with a constant range on that column (see main.py --since/--until/--last-months)
+# is pruned to the months it touches, so report runs over a recent window cost
+# the same however much history autoRefreshScript.py keeps appending.
+#
+# migrate builds a partitioned copy of orders (one partition per month from the
+# oldest order to PARTITION_MONTHS_AHEAD months ahead, plus a default partition
+# for anything outside that range) in one transaction and swaps it in by
+# renaming; the old table is kept as orders_unpartitioned. Partitioned tables
+# need the partition key in their primary key, so the key becomes
+# (order_id, order_purchase_timestamp) and order_purchase_timestamp NOT NULL.
+# Foreign keys that reference orders (order_id) cannot be carried over and are
+# dropped. The rollups in rollups.py that read orders are recreated on the new
+# table in the same transaction. Run extend (e.g. daily) to keep partitions
+# ahead of the inserts; rows that already landed in the default partition are
+# moved into their new month partition.
+
+PARTITIONED_TABLE = "orders"
+PARTITION_KEY = "order_purchase_timestamp"
+BACKUP_TABLE = "orders_unpartitioned"
+DEFAULT_PARTITION = "orders_default"
+PARTITION_MONTHS_AHEAD = 3
+
+# Indexes the report delta scans rely on (incremental.py, the business
+# exporter): (name, table, column). `python partitioning.py indexes` creates
+# them once; readers never run DDL. On a plain table they are built
+# CONCURRENTLY so inserts keep going; a partitioned table cannot build
+# CONCURRENTLY and gets a plain CREATE INDEX (migrate recreates the orders one).
+REPORT_INDEXES = [
+    ("idx_orders_purchase_ts", "orders", "order_purchase_timestamp"),
+    ("idx_reviews_creation_date", "reviews", "review_creation_date"),
+]
+
+IS_PARTITIONED_SQL = """
+    SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s));
+"""
+
+# Partitions of a table with their bounds, estimated rows and size
+PARTITIONS_SQL = """
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint, pg_total_relation_size(c.oid)
+    FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(%s)
+    ORDER BY c.relname;
+"""
+
+# Views and materialized views that read the table
+DEPENDENT_VIEWS_SQL = """
+    SELECT DISTINCT v.relname, v.relkind
+    FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+    WHERE d.refobjid = to_regclass(%s) AND v.oid <> d.refobjid;
+"""
+
+# Foreign keys of other tables that point at the table
+REFERENCING_FKS_SQL = """
+    SELECT conrelid::regclass::text, conname
+    FROM pg_constraint
+    WHERE contype = 'f' AND confrelid = to_regclass(%s);
+"""
+
+# Indexes of the table: (name, definition, is primary key); the secondary ones
+# are recreated on the partitioned table
+INDEXES_SQL = """
+    SELECT i.relname, pg_get_indexdef(x.indexrelid), x.indisprimary
+    FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE x.indrelid = to_regclass(%s);
+"""
+
+# User triggers of the table (e.g. the scheduler's NOTIFY trigger): (name,
+# definition). LIKE does not copy triggers, so they are recreated on the
+# partitioned table
+TRIGGERS_SQL = """
+    SELECT tgname, pg_get_triggerdef(oid)
+    FROM pg_trigger
+    WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal;
+"""
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month, table=PARTITIONED_TABLE):
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def month_range(first, last):
+    """Month starts from first to last, both included."""
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def is_partitioned(cur, table=PARTITIONED_TABLE):
+    cur.execute(IS_PARTITIONED_SQL, (table,))
+    return cur.fetchone()[0]
+
+
+def _create_partition(cur, month, table=PARTITIONED_TABLE, default=DEFAULT_PARTITION):
+    """Create the partition for `month`, moving its rows out of the default partition.
+
+    A partition cannot be attached while the default partition holds rows in
+    its range, so those rows are copied into the new table first and deleted
+    from the default partition in the same transaction.
+    """
+    name = partition_name(month, table)
+    start, end = month, add_months(month, 1)
+    cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+    """, (start, end))
+    moved = cur.rowcount
+    cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);", (start, end))
+    return moved
+
+
+def ensure_partitions(months_ahead=PARTITION_MONTHS_AHEAD, table=PARTITIONED_TABLE):
+    """Create the missing monthly partitions up to `months_ahead` months from now,
+    plus any month that has rows waiting in the default partition.
+
+    Returns [(partition, rows moved from the default partition)].
+    """
+    created = []
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if not is_partitioned(cur, table):
+                raise RuntimeError(f"{table} is not partitioned; run `python partitioning.py migrate` first")
+            cur.execute(PARTITIONS_SQL, (table,))
+            existing = {row[0] for row in cur.fetchall()}
+            cur.execute(f"SELECT DISTINCT DATE_TRUNC('month', {PARTITION_KEY})::date FROM {DEFAULT_PARTITION} "
+                        f"WHERE {PARTITION_KEY} IS NOT NULL;")
+            waiting = {row[0] for row in cur.fetchall()}
+            this_month = month_start(date.today())
+            wanted = set(month_range(this_month, add_months(this_month, months_ahead))) | waiting
+            for month in sorted(wanted):
+                if partition_name(month, table) not in existing:
+                    created.append((partition_name(month, table), _create_partition(cur, month, table)))
+    return created
+
+
+def migrate_to_partitions(months_ahead=PARTITION_MONTHS_AHEAD, table=PARTITIONED_TABLE, verbose=True):
+    """Swap `table` for a copy range-partitioned by month of PARTITION_KEY.
+
+    Runs in a single transaction: writers block on the table until it commits,
+    and any error leaves the original table untouched. Returns the stats of
+    the run (rows copied, partitions, seconds).
+    """
+    from rollups import ROLLUP_VIEWS
+
+    start = time.perf_counter()
+    staging = f"{table}_partitioned"
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if is_partitioned(cur, table):
+                raise RuntimeError(f"{table} is already partitioned")
+            cur.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE;")
+            cur.execute(f"SELECT COUNT(*) - COUNT({PARTITION_KEY}), MIN({PARTITION_KEY}), "
+                        f"MAX({PARTITION_KEY}) FROM {table};")
+            missing_keys, oldest, newest = cur.fetchone()
+            if missing_keys:
+                raise RuntimeError(f"{missing_keys} rows of {table} have no {PARTITION_KEY}; "
+                                   f"set or delete them before partitioning")
+
+            cur.execute(DEPENDENT_VIEWS_SQL, (table,))
+            views = [name for name, _ in cur.fetchall()]
+            foreign = [name for name in views if name not in ROLLUP_VIEWS]
+            if foreign:
+                raise RuntimeError(f"views {', '.join(foreign)} read {table}; drop them before partitioning")
+            cur.execute(REFERENCING_FKS_SQL, (table,))
+            foreign_keys = cur.fetchall()
+            cur.execute(INDEXES_SQL, (table,))
+            indexes = [(name, definition) for name, definition, primary in cur.fetchall() if not primary]
+            cur.execute(TRIGGERS_SQL, (table,))
+            triggers = cur.fetchall()
+
+            # Partitioned copy, one partition per month plus the default partition
+            cur.execute(f"""
+                CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                                        PRIMARY KEY (order_id, {PARTITION_KEY}))
+                PARTITION BY RANGE ({PARTITION_KEY});
+            """)
+            today = month_start(date.today())
+            first = month_start(oldest or today)
+            last = max(month_start(newest or today), today)
+            months = list(month_range(first, add_months(last, months_ahead)))
+            for month in months:
+                cur.execute(f"CREATE TABLE {partition_name(month, table)} PARTITION OF {staging} "
+                            f"FOR VALUES FROM (%s) TO (%s);", (month, add_months(month, 1)))
+            cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {staging} DEFAULT;")
+            cur.execute(f"INSERT INTO {staging} SELECT * FROM {table};")
+            rows = cur.rowcount
+            copied = time.perf_counter()
+
+            # Swap: dependants of the old table are dropped and rebuilt on the new one
+            for name in views:
+                cur.execute(f"DROP MATERIALIZED VIEW {name};")
+            for referencing, name in foreign_keys:
+                cur.execute(f"ALTER TABLE {referencing} DROP CONSTRAINT {name};")
+            cur.execute(f"ALTER TABLE {table} RENAME TO {BACKUP_TABLE};")
+            cur.execute(f"ALTER TABLE {staging} RENAME TO {table};")
+            cur.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {BACKUP_TABLE}_pkey;")
+            cur.execute(f"ALTER INDEX {staging}_pkey RENAME TO {table}_pkey;")
+            for name, definition in indexes:
+                cur.execute(f"ALTER INDEX {name} RENAME TO {name}_unpartitioned;")
+                # The definition was read before the rename, so it names the new table
+                cur.execute(definition + ";")
+            for name, definition in triggers:
+                # Dropped from the backup so inserts into it don't fire it too
+                cur.execute(f"DROP TRIGGER {name} ON {BACKUP_TABLE};")
+                cur.execute(definition + ";")
+            for name in views:
+                definition, key_cols = ROLLUP_VIEWS[name]
+                cur.execute(f"CREATE MATERIALIZED VIEW {name} AS {definition};")
+                cur.execute(f"CREATE UNIQUE INDEX {name}_key ON {name} ({', '.join(key_cols)});")
+            cur.execute(f"ANALYZE {table};")
+
+    stats = {"rows": rows, "partitions": len(months), "first": months[0], "last": months[-1],
+             "copy_seconds": copied - start, "seconds": time.perf_counter() - start,
+             "dropped_foreign_keys": [f"{ref}.{name}" for ref, name in foreign_keys],
+             "indexes": [name for name, _ in indexes], "triggers": [name for name, _ in triggers],
+             "views": views}
+    if verbose:
+        print(f"Partitioned {table}: {rows} rows into {len(months)} monthly partitions "
+              f"({months[0]:%Y-%m} to {months[-1]:%Y-%m}) + {DEFAULT_PARTITION} "
+              f"in {stats['seconds']:.2f}s (copy {stats['copy_seconds']:.2f}s)")
+        print(f"  old table kept as {BACKUP_TABLE}; recreated indexes: {', '.join(stats['indexes']) or 'none'}")
+        if triggers:
+            print(f"  recreated triggers: {', '.join(stats['triggers'])}")
+        if foreign_keys:
+            print(f"  dropped foreign keys referencing {table}: {', '.join(stats['dropped_foreign_keys'])}")
+        if views:
+            print(f"  recreated rollups: {', '.join(views)}")
+        print(f"  note: indexes on {table} can no longer be built CONCURRENTLY; index_advisor.py --create "
+              "builds them with a plain CREATE INDEX, which blocks writes while it runs")
+    return stats
+
+
+def create_report_indexes(indexes=REPORT_INDEXES):
+    """Create the missing REPORT_INDEXES; returns the names built. An INVALID
+    index left by a failed concurrent build is dropped and built again."""
+    built = []
+    with pooled_connection() as conn:
+        conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+        try:
+            with conn.cursor() as cur:
+                for name, table, column in indexes:
+                    cur.execute("SELECT x.indisvalid FROM pg_index x WHERE x.indexrelid = to_regclass(%s);",
+                                (name,))
+                    row = cur.fetchone()
+                    if row and row[0]:
+                        continue
+                    concurrently = "" if is_partitioned(cur, table) else "CONCURRENTLY "
+                    if row:
+                        cur.execute(f"DROP INDEX {concurrently}{name};")
+                    cur.execute(f"CREATE INDEX {concurrently}{name} ON {table} ({column});")
+                    built.append(name)
+        finally:
+            conn.autocommit = False
+    return built
+
+
+def partition_status(table=PARTITIONED_TABLE):
+    """[(partition, bound, estimated rows, bytes)], or None if `table` is not partitioned."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if not is_partitioned(cur, table):
+                return None
+            cur.execute(PARTITIONS_SQL, (table,))
+            return cur.fetchall()
+
+
+def scanned_partitions(query, params=None):
+    """Names of the partitions a query's plan reads (plan-time pruning only)."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+    names = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            names.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return sorted(name for name in names if name.startswith(f"{PARTITIONED_TABLE}_"))
+
+
+def print_partition_status(table=PARTITIONED_TABLE):
+    partitions = partition_status(table)
+    if partitions is None:
+        print(f"{table} is not partitioned.")
+        return
+    print(f"{'partition':<22}{'rows (est.)':>12}{'MB':>9}  bound")
+    for name, bound, rows, size in partitions:
+        print(f"{name:<22}{max(rows, 0):>12}{size / 1024 / 1024:>9.2f}  {bound}")
+    print(f"{len(partitions)} partitions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monthly range partitioning of orders.")
+    parser.add_argument("command", nargs="?", default="status", choices=["migrate", "extend", "status", "explain", "indexes"],
+                        help="migrate: partition orders; extend: add upcoming months; "
+                             "status: list partitions; explain: partitions read by a date range; "
+                             "indexes: create the indexes the report delta scans use")
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--since", type=date.fromisoformat, help="explain: range start (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="explain: range end, exclusive")
+    parser.add_argument("--dbname", help=f"target database (default {DB_CONFIG['dbname']})")
+    args = parser.parse_args()
+
+    if args.dbname:
+        DB_CONFIG["dbname"] = args.dbname
+    if args.command == "migrate":
+        migrate_to_partitions(args.months_ahead)
+    elif args.command == "extend":
+        created = ensure_partitions(args.months_ahead)
+        for name, moved in created:
+            print(f"Created {name}" + (f" ({moved} rows moved from {DEFAULT_PARTITION})" if moved else ""))
+        print(f"{len(created)} partitions created")
+    elif args.command == "indexes":
+        built = create_report_indexes()
+        print(f"Created {', '.join(built)}" if built else "Report indexes already exist")
+    elif args.command == "explain":
+        since = datetime.combine(args.since or date.min, datetime.min.time())
+        until = datetime.combine(args.until or date.max, datetime.min.time())
+        names = scanned_partitions(f"SELECT COUNT(*) FROM {PARTITIONED_TABLE} "
+                                   f"WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s",
+                                   (since, until))
+        print(f"{len(names)} partitions read: {', '.join(names)}")
+    else:
+        print_partition_status()
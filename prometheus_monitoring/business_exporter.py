@@ -0,0 +1,179 @@
+from prometheus_client import start_http_server, Gauge, Counter, Histogram
+from datetime import datetime, timedelta
+import argparse, os, time
+import psycopg2
+
+# Business KPIs from the UrbanCart database: orders and revenue per minute,
+# review score distribution and how long new orders take to show up. Every
+# poll only reads rows newer than a high-water mark on the timestamp column
+# (order_purchase_timestamp for orders, review_creation_date for reviews),
+# so a 15s scrape interval does not put a full scan on the database. The
+# exporter only reads: the indexes on those columns are created once with
+# `python partitioning.py indexes`, so it also runs under a read-only role.
+DB_DSN = os.environ.get("URBANCART_DSN", "dbname=Urbancart user=postgres password=0000 host=localhost port=5432")
+EXPORTER_PORT = 8012
+POLL_INTERVAL_SECONDS = 15
+# Each poll re-reads this much before the mark, so rows committed late with an
+# older timestamp (concurrent writers) are still counted; ids already counted
+# inside the window are skipped.
+WATERMARK_LOOKBACK = timedelta(seconds=60)
+RATE_WINDOW = timedelta(minutes=1)
+# Reviews are often written with a creation date in the past (e.g. seeding.py
+# dates them a day after delivery), behind the watermark. The distribution is
+# therefore recounted in full this often, which picks those rows up.
+REVIEW_RECOUNT_SECONDS = 300
+
+orders_total = Counter('urbancart_orders_total', 'Orders seen since the exporter started')
+revenue_total = Counter('urbancart_revenue_total', 'Item revenue of the orders seen since the exporter started')
+orders_per_minute = Gauge('urbancart_orders_per_minute', 'Orders purchased in the last minute')
+revenue_per_minute = Gauge('urbancart_revenue_per_minute', 'Item revenue of the orders purchased in the last minute')
+review_scores = Gauge('urbancart_review_score_count', 'Reviews per review score', ['score'])
+insert_lag = Histogram('urbancart_order_insert_lag_seconds',
+                       'Time from order_purchase_timestamp until the exporter saw the order (includes up to one poll interval)',
+                       buckets=(1, 2.5, 5, 10, 15, 30, 60, 120, 300, 600))
+newest_order_age = Gauge('urbancart_newest_order_age_seconds', 'Age of the newest order_purchase_timestamp')
+poll_duration = Gauge('urbancart_exporter_poll_seconds', 'Duration of the last poll')
+poll_errors = Counter('urbancart_exporter_poll_errors_total', 'Failed polls')
+
+ORDERS_DELTA_SQL = """
+    SELECT o.order_id, o.order_purchase_timestamp, COALESCE(SUM(oi.price), 0) AS revenue,
+           EXTRACT(EPOCH FROM (LOCALTIMESTAMP - o.order_purchase_timestamp)) AS lag_seconds
+    FROM orders o
+        LEFT JOIN order_items oi ON o.order_id = oi.order_id
+    WHERE o.order_purchase_timestamp > %s
+    GROUP BY o.order_id, o.order_purchase_timestamp;
+"""
+
+REVIEWS_DELTA_SQL = """
+    SELECT review_id || ':' || order_id, review_creation_date, CAST(review_score AS INTEGER)
+    FROM reviews
+    WHERE review_creation_date > %s AND review_score IS NOT NULL;
+"""
+
+
+class Watermark:
+    """High-water mark on a timestamp column plus the ids already counted
+    inside the lookback window. Rows are (id, timestamp, ...)."""
+
+    def __init__(self, mark=None, lookback=WATERMARK_LOOKBACK):
+        self.mark = mark
+        self.lookback = lookback
+        self.seen = set()
+
+    def since(self):
+        return self.mark - self.lookback if self.mark else datetime.min
+
+    def fresh(self, rows):
+        """Rows not counted before; advances the mark. `rows` must cover the whole window."""
+        new = [row for row in rows if row[0] not in self.seen]
+        if rows:
+            newest = max(row[1] for row in rows)
+            self.mark = max(self.mark, newest) if self.mark else newest
+            window_start = self.mark - self.lookback
+            self.seen = {row[0] for row in rows if row[1] > window_start}
+        return new
+
+
+_recent = []  # (order_purchase_timestamp, revenue) of orders inside RATE_WINDOW
+_reviews_counted_at = [0.0]  # time.monotonic() of the last full review count
+
+
+def count_reviews(cur, reviews_wm):
+    """Set the score distribution from a full count and move the reviews mark
+    to the newest review, with the ids inside the lookback window as seen."""
+    cur.execute("""
+        SELECT CAST(review_score AS INTEGER), COUNT(*), MAX(review_creation_date)
+        FROM reviews WHERE review_score IS NOT NULL GROUP BY 1;
+    """)
+    rows = cur.fetchall()
+    for score, count, _ in rows:
+        review_scores.labels(score=str(score)).set(count)
+    reviews_wm.mark = max((row[2] for row in rows if row[2]), default=None)
+    reviews_wm.seen = set()
+    if reviews_wm.mark:
+        cur.execute(REVIEWS_DELTA_SQL, (reviews_wm.since(),))
+        reviews_wm.fresh(cur.fetchall())
+    _reviews_counted_at[0] = time.monotonic()
+
+
+def start_watermarks(cur):
+    """Build the baseline: marks at the current maxima, the review distribution
+    counted once, the ids inside the lookback window marked as seen, and the
+    orders of the last RATE_WINDOW loaded so the per-minute rates are right
+    from the first poll."""
+    cur.execute("SELECT MAX(order_purchase_timestamp), LOCALTIMESTAMP FROM orders;")
+    mark, db_now = cur.fetchone()
+    orders_wm = Watermark(mark)
+    if orders_wm.mark:
+        cur.execute(ORDERS_DELTA_SQL, (min(orders_wm.since(), db_now - RATE_WINDOW),))
+        rows = cur.fetchall()
+        orders_wm.fresh([row for row in rows if row[1] > orders_wm.since()])
+        _recent[:] = [(purchased_at, float(revenue)) for _, purchased_at, revenue, _ in rows
+                      if purchased_at > db_now - RATE_WINDOW]
+
+    reviews_wm = Watermark()
+    count_reviews(cur, reviews_wm)
+    return orders_wm, reviews_wm
+
+
+def poll(cur, orders_wm, reviews_wm):
+    """Fold the rows added since the last poll into the metrics."""
+    cur.execute("SELECT LOCALTIMESTAMP;")
+    db_now = cur.fetchone()[0]
+
+    cur.execute(ORDERS_DELTA_SQL, (orders_wm.since(),))
+    new_orders = orders_wm.fresh(cur.fetchall())
+    for _, purchased_at, revenue, lag_seconds in new_orders:
+        orders_total.inc()
+        revenue_total.inc(float(revenue))
+        insert_lag.observe(max(float(lag_seconds), 0))
+        if purchased_at > db_now - RATE_WINDOW:
+            _recent.append((purchased_at, float(revenue)))
+
+    _recent[:] = [entry for entry in _recent if entry[0] > db_now - RATE_WINDOW]
+    orders_per_minute.set(len(_recent))
+    revenue_per_minute.set(sum(revenue for _, revenue in _recent))
+    if orders_wm.mark:
+        newest_order_age.set(max((db_now - orders_wm.mark).total_seconds(), 0))
+
+    if time.monotonic() - _reviews_counted_at[0] >= REVIEW_RECOUNT_SECONDS:
+        count_reviews(cur, reviews_wm)
+        return len(new_orders), 0
+    cur.execute(REVIEWS_DELTA_SQL, (reviews_wm.since(),))
+    new_reviews = reviews_wm.fresh(cur.fetchall())
+    for _, _, score in new_reviews:
+        review_scores.labels(score=str(score)).inc()
+    return len(new_orders), len(new_reviews)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UrbanCart business metrics exporter for Prometheus.")
+    parser.add_argument("--dsn", default=DB_DSN, help="libpq connection string (or set URBANCART_DSN)")
+    parser.add_argument("--port", type=int, default=EXPORTER_PORT)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    print(f"Starting business exporter on port {args.port}...")
+    start_http_server(args.port)
+    conn = None
+    while True:
+        poll_start = time.monotonic()
+        try:
+            if conn is None or conn.closed:
+                conn = psycopg2.connect(args.dsn)
+                conn.autocommit = True
+                # After a reconnect counting resumes from the current maxima
+                with conn.cursor() as cur:
+                    orders_wm, reviews_wm = start_watermarks(cur)
+                print(f"Watermarks: orders {orders_wm.mark}, reviews {reviews_wm.mark}")
+            with conn.cursor() as cur:
+                orders, reviews = poll(cur, orders_wm, reviews_wm)
+            print(f"[{time.strftime('%H:%M:%S')}] {orders} new orders, {reviews} new reviews")
+        except psycopg2.Error as e:
+            poll_errors.inc()
+            print(f"Poll failed: {str(e).strip()}")
+            if conn is not None:
+                conn.close()
+        elapsed = time.monotonic() - poll_start
+        poll_duration.set(elapsed)
+        time.sleep(max(args.interval - elapsed, 0))
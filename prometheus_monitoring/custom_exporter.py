@@ -1,54 +1,276 @@
-from prometheus_client import start_http_server, Gauge
-import requests, time
+from prometheus_client import start_http_server, Gauge, Counter, Histogram, CollectorRegistry, REGISTRY, \
+    CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from requests.adapters import HTTPAdapter
+import argparse, random, requests, threading, time
 
 API_KEY = "9236930e832a0e0c577adb449dfea0f3"
+API_URL = "http://api.openweathermap.org/data/2.5/weather"
 CITIES = ["Astana", "Almaty", "London"]
 
+# Fetch engine: all cities are fetched concurrently (at most FETCH_CONCURRENCY
+# requests in flight) over one keep-alive session. Timeouts, 429 and 5xx are
+# retried with jittered exponential backoff; other 4xx answers are not. A cycle
+# waits at most CYCLE_DEADLINE_SECONDS: a city that is still being fetched is
+# collected by a later cycle and not requested again until it finishes, so one
+# slow upstream cannot stall the other cities.
+EXPORTER_PORT = 8010
+FETCH_INTERVAL_SECONDS = 20
+CYCLE_DEADLINE_SECONDS = 15
+FETCH_CONCURRENCY = 16
+FETCH_TIMEOUT_SECONDS = (3.05, 10)  # (connect, read)
+FETCH_RETRIES = 2
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8
+# Snapshot mode: a city missing from this many seconds of cycles is dropped
+STALE_CITY_SECONDS = 120
+
+# Weather metrics per city: (name, help, value from the API payload)
+WEATHER_METRICS = [
+    ('weather_temperature_celsius', 'Current temperature in Celsius', lambda d: d['main']['temp']),
+    ('weather_humidity_percent', 'Current humidity in percent', lambda d: d['main']['humidity']),
+    ('weather_pressure_hpa', 'Atmospheric pressure in hPa', lambda d: d['main']['pressure']),
+    ('weather_wind_speed_mps', 'Wind speed in m/s', lambda d: d['wind']['speed']),
+    ('weather_clouds_percent', 'Cloudiness percent', lambda d: d['clouds']['all']),
+    ('weather_visibility_m', 'Visibility in meters', lambda d: d.get('visibility', 0)),
+    ('weather_feels_like_celsius', 'Feels like temperature', lambda d: d['main']['feels_like']),
+    ('weather_sunrise_unix', 'Sunrise time (UNIX)', lambda d: d['sys']['sunrise']),
+    ('weather_sunset_unix', 'Sunset time (UNIX)', lambda d: d['sys']['sunset']),
+    ('weather_temp_difference', 'Difference between temp and feels_like',
+     lambda d: d['main']['temp'] - d['main']['feels_like']),
+]
+
+# Exceptions a payload that lacks a field (or has a non-numeric one) raises in
+# weather_values()
+INVALID_PAYLOAD_ERRORS = (KeyError, TypeError, ValueError, AttributeError)
+
+
+def weather_values(data):
+    """Values of WEATHER_METRICS for one payload, in order, as floats."""
+    return tuple(float(value(data)) for _, _, value in WEATHER_METRICS)
+
+
 # Define metrics with label
-temperature = Gauge('weather_temperature_celsius', 'Current temperature in Celsius', ['city'])
-humidity = Gauge('weather_humidity_percent', 'Current humidity in percent', ['city'])
-pressure = Gauge('weather_pressure_hpa', 'Atmospheric pressure in hPa', ['city'])
-wind_speed = Gauge('weather_wind_speed_mps', 'Wind speed in m/s', ['city'])
-clouds = Gauge('weather_clouds_percent', 'Cloudiness percent', ['city'])
-visibility = Gauge('weather_visibility_m', 'Visibility in meters', ['city'])
-feels_like = Gauge('weather_feels_like_celsius', 'Feels like temperature', ['city'])
-sunrise = Gauge('weather_sunrise_unix', 'Sunrise time (UNIX)', ['city'])
-sunset = Gauge('weather_sunset_unix', 'Sunset time (UNIX)', ['city'])
-temp_diff = Gauge('weather_temp_difference', 'Difference between temp and feels_like', ['city'])
-
-def fetch_weather(city):
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={API_KEY}&units=metric"
-    print(f"Fetching data for {city} ...")
-    r = requests.get(url)
-    if r.status_code != 200:
-        print(f"Error fetching {city}: {r.status_code} {r.text}")
-        return
-
-    data = r.json()
-    if 'main' not in data:
-        print(f"Invalid data for {city}: {data}")
-        return
-
-    print(f"{city} temp: {data['main']['temp']} °C")
-    temperature.labels(city=city).set(data['main']['temp'])
-    humidity.labels(city=city).set(data['main']['humidity'])
-    pressure.labels(city=city).set(data['main']['pressure'])
-    wind_speed.labels(city=city).set(data['wind']['speed'])
-    clouds.labels(city=city).set(data['clouds']['all'])
-    visibility.labels(city=city).set(data.get('visibility', 0))
-    feels_like.labels(city=city).set(data['main']['feels_like'])
-    sunrise.labels(city=city).set(data['sys']['sunrise'])
-    sunset.labels(city=city).set(data['sys']['sunset'])
-    temp_diff.labels(city=city).set(data['main']['temp'] - data['main']['feels_like'])
+city_gauges = [(Gauge(name, doc, ['city']), value) for name, doc, value in WEATHER_METRICS]
+
+# Exporter self-metrics
+fetch_duration = Histogram('weather_fetch_duration_seconds', 'Time to fetch one city, retries included',
+                           buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+fetch_errors = Counter('weather_fetch_errors_total', 'Failed fetch attempts', ['reason'])
+fetch_last_success = Gauge('weather_fetch_last_success_unixtime', 'Last successful fetch per city', ['city'])
+cycle_duration = Gauge('weather_fetch_cycle_seconds', 'Duration of the last fetch cycle over all cities')
+
+
+def make_session(concurrency=FETCH_CONCURRENCY):
+    """Keep-alive session whose connection pool fits `concurrency` requests in flight."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: uniform in [0, min(max, base * 2**attempt)]."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def fetch_weather(city, session, api_url=API_URL, timeout=None, retries=FETCH_RETRIES):
+    """Return the API payload for one city, or None once all attempts failed."""
+    timeout = timeout or FETCH_TIMEOUT_SECONDS
+    params = {"q": city, "appid": API_KEY, "units": "metric"}
+    start = time.perf_counter()
+    try:
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(backoff_delay(attempt - 1))
+            try:
+                r = session.get(api_url, params=params, timeout=timeout)
+            except requests.Timeout:
+                fetch_errors.labels(reason="timeout").inc()
+                continue
+            except requests.RequestException as e:
+                fetch_errors.labels(reason="connection").inc()
+                print(f"Error fetching {city}: {e.__class__.__name__}")
+                continue
+
+            if r.status_code == 429 or r.status_code >= 500:
+                fetch_errors.labels(reason=f"http_{r.status_code}").inc()
+                continue
+            if r.status_code != 200:
+                fetch_errors.labels(reason=f"http_{r.status_code}").inc()
+                print(f"Error fetching {city}: {r.status_code} {r.text[:200]}")
+                return None
+
+            try:
+                data = r.json()
+                # Every metric must be readable, or the city would be half updated
+                weather_values(data)
+            except INVALID_PAYLOAD_ERRORS:
+                fetch_errors.labels(reason="invalid").inc()
+                print(f"Invalid data for {city}: {r.text[:200]}")
+                return None
+            return data
+
+        print(f"Giving up on {city} after {retries + 1} attempts")
+        return None
+    finally:
+        fetch_duration.observe(time.perf_counter() - start)
+
+
+def update_city_metrics(city, data):
+    values = weather_values(data)  # all read before any gauge is set
+    for (gauge, _), value in zip(city_gauges, values):
+        gauge.labels(city=city).set(value)
+    # Snapshot mode unregisters this gauge and reports the snapshot time instead
+    fetch_last_success.labels(city=city).set(time.time())
+
+
+class SnapshotCollector(Collector):
+    """Serves the city metrics of the last complete cycle.
+
+    Each cycle builds a new {city: (values, fetched_at)} dict and swaps it in
+    with a single assignment, so a scrape never sees a half-updated city. The
+    exposition text is rendered once per cycle into `payload`; cities not
+    refreshed for `stale_after` seconds, or no longer configured, are dropped.
+    A city whose payload can't be read keeps its previous values until then.
+    """
+
+    def __init__(self, stale_after=STALE_CITY_SECONDS):
+        self.stale_after = stale_after
+        self._cities = {}
+        self._registry = CollectorRegistry()
+        self._registry.register(self)
+        self.payload = generate_latest(self._registry)
+
+    def update(self, results, cities=None):
+        now = time.time()
+        keep = set(cities) if cities is not None else None
+        snapshot = {city: entry for city, entry in self._cities.items()
+                    if now - entry[1] <= self.stale_after and (keep is None or city in keep)}
+        for city, data in results.items():
+            if keep is not None and city not in keep:
+                continue
+            try:
+                snapshot[city] = (weather_values(data), now)
+            except INVALID_PAYLOAD_ERRORS:
+                fetch_errors.labels(reason="invalid").inc()
+                print(f"Invalid data for {city}, keeping its last snapshot: {str(data)[:200]}")
+        self._cities = snapshot
+        self.payload = generate_latest(self._registry)
+        return len(snapshot)
+
+    def collect(self):
+        cities = self._cities  # read once; update() replaces the dict, never mutates it
+        for idx, (name, doc, _) in enumerate(WEATHER_METRICS):
+            family = GaugeMetricFamily(name, doc, labels=['city'])
+            for city in sorted(cities):
+                family.add_metric([city], cities[city][0][idx])
+            yield family
+        last_success = GaugeMetricFamily('weather_fetch_last_success_unixtime',
+                                         'Last successful fetch per city', labels=['city'])
+        for city in sorted(cities):
+            last_success.add_metric([city], cities[city][1])
+        yield last_success
+
+
+def start_snapshot_server(port, collector):
+    """Serve collector.payload plus the exporter self-metrics on /metrics.
+
+    The per-city gauges are unregistered from the default registry, so its
+    output (process and fetch self-metrics) does not grow with the city count.
+    """
+    for gauge, _ in city_gauges:
+        REGISTRY.unregister(gauge)
+    REGISTRY.unregister(fetch_last_success)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = collector.payload + generate_latest(REGISTRY)
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_pending = {}  # Future -> city for fetches still running (from this or an earlier cycle)
+
+
+def fetch_all(cities, session, executor, api_url=API_URL, deadline=CYCLE_DEADLINE_SECONDS):
+    """Fetch the cities concurrently and return {city: payload} for the fetches
+    that succeeded within `deadline` seconds, including late ones from earlier
+    cycles for cities that are still in `cities`."""
+    busy = set(_pending.values())
+    for city in cities:
+        if city not in busy:
+            _pending[executor.submit(fetch_weather, city, session, api_url)] = city
+    done, _ = wait(list(_pending), timeout=deadline)
+    results = {}
+    wanted = set(cities)
+    for future in done:
+        city = _pending.pop(future)
+        data = future.result()
+        if data is not None and city in wanted:
+            results[city] = data
+    return results
+
+
+def run_cycle(cities, session, executor, api_url=API_URL, deadline=CYCLE_DEADLINE_SECONDS, collector=None):
+    start = time.perf_counter()
+    results = fetch_all(cities, session, executor, api_url, deadline)
+    if collector is not None:
+        collector.update(results, cities)
+    else:
+        for city, data in results.items():
+            update_city_metrics(city, data)
+    elapsed = time.perf_counter() - start
+    cycle_duration.set(elapsed)
+    late = f", {len(_pending)} still in flight" if _pending else ""
+    print(f"Cycle complete: {len(results)}/{len(cities)} cities in {elapsed:.2f}s{late}")
+    return results
+
+
+def load_cities(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
 
 if __name__ == "__main__":
-    print("Starting exporter on port 8010...")
-    start_http_server(8010)
-    while True:
-        for city in CITIES:
-            fetch_weather(city)
-        print("Cycle complete. Sleeping 20s...\n")
-        time.sleep(20)
+    parser = argparse.ArgumentParser(description="Weather exporter for Prometheus.")
+    parser.add_argument("--port", type=int, default=EXPORTER_PORT)
+    parser.add_argument("--cities-file", help="one city per line (default: CITIES)")
+    parser.add_argument("--api-url", default=API_URL, help="weather endpoint, e.g. a local stub server")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY)
+    parser.add_argument("--interval", type=float, default=FETCH_INTERVAL_SECONDS)
+    parser.add_argument("--snapshot", action="store_true", help="serve per-cycle snapshots instead of live gauges")
+    args = parser.parse_args()
+
+    cities = load_cities(args.cities_file) if args.cities_file else CITIES
+    print(f"Starting exporter on port {args.port} for {len(cities)} cities...")
+    collector = None
+    if args.snapshot:
+        collector = SnapshotCollector()
+        start_snapshot_server(args.port, collector)
+    else:
+        start_http_server(args.port)
+    session = make_session(args.concurrency)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        while True:
+            cycle_start = time.monotonic()
+            run_cycle(cities, session, executor, args.api_url, collector=collector)
+            time.sleep(max(args.interval - (time.monotonic() - cycle_start), 0))
 
 
 
@@ -59,4 +281,4 @@ if __name__ == "__main__":
 # docker run --rm -it alpine sh -c "while true; do cat /dev/zero > /dev/null; done"
 # Access to Dashboard : localhost:3000
 # Prometheus URL (localhost:9090)
-# http://localhost:9090/targets
\ No newline at end of file
+# http://localhost:9090/targets
@@ -0,0 +1,147 @@
+import statistics
+import sys
+import time
+
+from db import get_dataframe, pooled_connection
+
+# Materialized views behind the report and dashboard queries. Each has a unique
+# index so it can be refreshed with REFRESH MATERIALIZED VIEW CONCURRENTLY,
+# which keeps the view readable while it is rebuilt.
+# name -> (defining query, unique index columns)
+ROLLUP_VIEWS = {
+    "mv_customers_by_state": ("""
+        SELECT customer_state, COUNT(*) AS num_customers
+        FROM customers
+        GROUP BY customer_state
+    """, ["customer_state"]),
+    "mv_category_revenue": ("""
+        SELECT p.product_category_name, SUM(oi.price) AS total_revenue
+        FROM order_items oi
+                 JOIN products p ON oi.product_id = p.product_id
+        GROUP BY p.product_category_name
+    """, ["product_category_name"]),
+    "mv_seller_revenue": ("""
+        SELECT s.seller_id, SUM(oi.price) AS total_revenue
+        FROM order_items oi
+                 RIGHT JOIN sellers s ON oi.seller_id = s.seller_id
+        GROUP BY s.seller_id
+    """, ["seller_id"]),
+    "mv_monthly_revenue": ("""
+        SELECT DATE_TRUNC('month', o.order_purchase_timestamp) AS month,
+               SUM(oi.price) AS monthly_revenue
+        FROM orders o
+            LEFT JOIN order_items oi ON o.order_id = oi.order_id
+        GROUP BY month
+    """, ["month"]),
+    "mv_monthly_orders": ("""
+        SELECT DATE_TRUNC('month', o.order_purchase_timestamp) AS month,
+               COUNT(o.order_id) AS total_orders,
+               COUNT(DISTINCT o.customer_id) AS unique_customers
+        FROM orders o
+        GROUP BY month
+    """, ["month"]),
+    "mv_review_scores": ("""
+        SELECT CAST(review_score AS INTEGER) AS review_score, COUNT(*) AS n
+        FROM reviews
+        WHERE review_score IS NOT NULL
+        GROUP BY 1
+    """, ["review_score"]),
+    "mv_delivery_vs_review": ("""
+        SELECT EXTRACT(DAY FROM (o.order_delivered_customer_date - o.order_purchase_timestamp)) AS delivery_days,
+               CAST(r.review_score AS INTEGER) AS review_score,
+               COUNT(*) AS n
+        FROM orders o
+                 JOIN reviews r ON o.order_id = r.order_id
+        WHERE o.order_delivered_customer_date IS NOT NULL
+          AND r.review_score IS NOT NULL
+        GROUP BY 1, 2
+    """, ["delivery_days", "review_score"]),
+}
+
+# Assignment 2 queries rewritten to read from the rollups. Results have the
+# same columns and rows as the originals; Q5/Q6 expand the per-value counts
+# back into one row per review with generate_series.
+ROLLUP_QUERIES = {
+    "Q1": "SELECT customer_state, num_customers FROM mv_customers_by_state "
+          "ORDER BY num_customers DESC LIMIT 10;",
+    "Q2": "SELECT product_category_name, total_revenue FROM mv_category_revenue "
+          "ORDER BY total_revenue DESC LIMIT 8;",
+    "Q3": "SELECT month, monthly_revenue FROM mv_monthly_revenue ORDER BY month;",
+    "Q4": "SELECT seller_id, total_revenue FROM mv_seller_revenue "
+          "ORDER BY total_revenue DESC LIMIT 10;",
+    "Q5": "SELECT review_score FROM mv_review_scores, generate_series(1, n);",
+    "Q6": "SELECT delivery_days, review_score FROM mv_delivery_vs_review, generate_series(1, n);",
+    "Q7": "SELECT month, total_orders, unique_customers FROM mv_monthly_orders ORDER BY month;",
+}
+
+ROLLUP_REFRESH_INTERVAL_SECONDS = 300
+
+
+def create_rollups():
+    """Create any missing rollup views (populated) and their unique indexes."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            for name, (definition, key_cols) in ROLLUP_VIEWS.items():
+                cur.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {definition};")
+                cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({', '.join(key_cols)});")
+    print(f"Rollups ready: {len(ROLLUP_VIEWS)} materialized views")
+
+
+def refresh_rollups(concurrently=True, names=None):
+    """Refresh the given rollups (all by default) and return {name: seconds}."""
+    timings = {}
+    mode = "CONCURRENTLY " if concurrently else ""
+    for name in names or ROLLUP_VIEWS:
+        start = time.perf_counter()
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"REFRESH MATERIALIZED VIEW {mode}{name};")
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def rollup_refresh_loop(interval_seconds=ROLLUP_REFRESH_INTERVAL_SECONDS):
+    """Refresh every rollup on a fixed schedule until interrupted."""
+    print(f"Refreshing rollups every {interval_seconds} seconds. Press Ctrl+C to stop.")
+    while True:
+        timings = refresh_rollups()
+        print(f"[{time.strftime('%H:%M:%S')}] Refreshed {len(timings)} rollups "
+              f"in {sum(timings.values()):.2f}s")
+        time.sleep(interval_seconds)
+
+
+def _median_latency(query, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        get_dataframe(query)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def report_rollup_savings(raw_queries, repeats=3):
+    """Time each raw query against its rollup rewrite and print the latency saved."""
+    print(f"{'Query':<6}{'raw ms':>10}{'rollup ms':>12}{'saved ms':>11}")
+    for key in sorted(raw_queries):
+        if key not in ROLLUP_QUERIES:
+            continue
+        raw = _median_latency(raw_queries[key], repeats)
+        rolled = _median_latency(ROLLUP_QUERIES[key], repeats)
+        print(f"{key:<6}{raw * 1000:>10.1f}{rolled * 1000:>12.1f}{(raw - rolled) * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    # python rollups.py [create|refresh|loop|report]
+    command = sys.argv[1] if len(sys.argv) > 1 else "create"
+    if command == "create":
+        create_rollups()
+    elif command == "refresh":
+        for view, seconds in refresh_rollups().items():
+            print(f"Refreshed {view} in {seconds * 1000:.1f} ms")
+    elif command == "loop":
+        rollup_refresh_loop()
+    elif command == "report":
+        from main import load_assignment2_queries
+        report_rollup_savings(load_assignment2_queries())
+    else:
+        sys.exit(f"Unknown command {command!r}; expected create, refresh, loop or report")
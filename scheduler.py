@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+import metrics
+from db import DB_CONFIG, close_pool, execute_non_query, pool_summary
+
+# Long-running report job runner. Each stage (charts, slider, export, rollup
+# refresh) is a job with its own interval, run by an asyncio loop on a small
+# thread pool (psycopg2, matplotlib and openpyxl all block). Runs coalesce: a
+# job is queued at most once and never runs concurrently with itself, so
+# triggers that arrive while it is queued or running fold into one later run.
+#
+# By default jobs are data-driven: a statement-level trigger on orders sends
+# NOTIFY on ORDERS_CHANNEL after every INSERT, the scheduler LISTENs on a
+# dedicated connection, and a job only runs again once new orders landed and
+# at least its interval has passed since its last start. With --poll (or while
+# the LISTEN connection is down) jobs simply run every interval. Queue depth
+# and per-job wait and run times are printed every STATUS_INTERVAL_SECONDS and
+# exported through metrics.py (--metrics-port).
+
+ORDERS_CHANNEL = "urbancart_orders"
+SCHEDULER_WORKERS = 2
+TICK_SECONDS = 1
+STATUS_INTERVAL_SECONDS = 60
+LISTEN_RETRY_SECONDS = 5
+
+# job -> seconds between runs (the minimum spacing when driven by inserts)
+JOB_INTERVALS = {"rollups": 300, "charts": 60, "slider": 60, "export": 300}
+
+# Statement-level, so a batch insert sends one notification with its row count.
+# CREATE OR REPLACE TRIGGER needs PostgreSQL 14 or later.
+NOTIFY_TRIGGER_NAME = "orders_notify_insert"
+NOTIFY_TRIGGER_SQL = f"""
+    CREATE OR REPLACE FUNCTION urbancart_notify_orders() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{ORDERS_CHANNEL}', (SELECT COUNT(*) FROM new_orders)::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE TRIGGER {NOTIFY_TRIGGER_NAME}
+        AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_orders
+        FOR EACH STATEMENT EXECUTE FUNCTION urbancart_notify_orders();
+"""
+
+
+class Job:
+    """A report stage on the scheduler plus its run statistics."""
+
+    def __init__(self, name, run, interval):
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.dirty = True  # new orders since the last run started (every job runs once at startup)
+        self.queued = False
+        self.running = False
+        self.enqueued_at = None
+        self.last_start = None
+        self.stats = {"runs": 0, "failures": 0, "coalesced": 0, "last_wait": None, "last_seconds": None,
+                      "total_seconds": 0.0, "max_seconds": 0.0}
+
+    def due(self, now, data_driven):
+        if self.queued or self.running:
+            return False
+        if self.last_start is not None and now - self.last_start < self.interval:
+            return False
+        return self.dirty or not data_driven
+
+
+class ReportScheduler:
+    """Runs Jobs on their intervals, or when orders are inserted, in a thread pool."""
+
+    def __init__(self, jobs, workers=SCHEDULER_WORKERS, listen=True):
+        self.jobs = jobs
+        self.workers = workers
+        self.listen = listen
+        self.listening = False
+        self.notifications = 0
+        self.inserted_orders = 0
+        self.queue = None
+        self._wake = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-job")
+
+    # Triggers
+
+    def orders_inserted(self, rows):
+        """Mark every job dirty; a job that is already dirty, queued or running
+        coalesces the notification into the run it already has."""
+        self.notifications += 1
+        self.inserted_orders += rows
+        for job in self.jobs:
+            if job.dirty or job.queued:
+                job.stats["coalesced"] += 1
+                metrics.observe_coalesced(job.name)
+            job.dirty = True
+        self._wake.set()
+
+    def _enqueue_due(self):
+        now = time.monotonic()
+        data_driven = self.listen and self.listening
+        for job in self.jobs:
+            if job.due(now, data_driven):
+                job.queued = True
+                job.enqueued_at = now
+                self.queue.put_nowait(job)
+        metrics.set_queue_depth(self.queue.qsize())
+
+    async def _ticker(self):
+        while True:
+            self._enqueue_due()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=TICK_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # Workers
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            metrics.set_queue_depth(self.queue.qsize())
+            start = time.monotonic()
+            job.queued, job.running, job.dirty = False, True, False
+            job.last_start = start
+            wait = start - job.enqueued_at
+            outcome = "ok"
+            try:
+                await loop.run_in_executor(self._executor, job.run)
+            except Exception as e:
+                outcome = "error"
+                job.stats["failures"] += 1
+                print(f"Job {job.name} failed: {e.__class__.__name__}: {str(e).strip()}")
+            finally:
+                job.running = False
+            seconds = time.monotonic() - start
+            job.stats["runs"] += 1
+            job.stats["last_wait"], job.stats["last_seconds"] = wait, seconds
+            job.stats["total_seconds"] += seconds
+            job.stats["max_seconds"] = max(job.stats["max_seconds"], seconds)
+            metrics.observe_job(job.name, wait, seconds, outcome)
+            print(f"[{time.strftime('%H:%M:%S')}] {job.name}: {outcome} in {seconds:.2f}s "
+                  f"(queued {wait:.2f}s, {self.queue.qsize()} waiting)")
+            self._wake.set()
+
+    # LISTEN connection
+
+    def _connect_listener(self):
+        conn = psycopg2.connect(**DB_CONFIG)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # Checked on every (re)connect: replacing orders (partitioning.py
+            # migrate, a restore) drops the trigger and nothing would be notified
+            if not notify_trigger_installed(cur):
+                print(f"Trigger {NOTIFY_TRIGGER_NAME} missing on orders; reinstalling it")
+                cur.execute(NOTIFY_TRIGGER_SQL)
+            cur.execute(f"LISTEN {ORDERS_CHANNEL};")
+        return conn
+
+    async def _listener(self):
+        loop = asyncio.get_running_loop()
+        connections = 0
+        while True:
+            lost = asyncio.Event()
+            try:
+                conn = await loop.run_in_executor(None, self._connect_listener)
+            except psycopg2.Error as e:
+                print(f"LISTEN failed ({str(e).strip()}); running jobs on their intervals")
+                await asyncio.sleep(LISTEN_RETRY_SECONDS)
+                continue
+
+            def on_readable():
+                try:
+                    conn.poll()
+                except psycopg2.Error:
+                    lost.set()
+                    return
+                for note in conn.notifies:
+                    self.orders_inserted(int(note.payload or 0))
+                conn.notifies.clear()
+
+            loop.add_reader(conn.fileno(), on_readable)
+            if connections:
+                # Orders inserted while we were not listening were missed
+                for job in self.jobs:
+                    job.dirty = True
+            connections += 1
+            self.listening = True
+            print(f"Listening on {ORDERS_CHANNEL}")
+            try:
+                await lost.wait()
+            finally:
+                loop.remove_reader(conn.fileno())
+                self.listening = False
+                conn.close()
+            print(f"LISTEN connection lost; retrying in {LISTEN_RETRY_SECONDS}s")
+            await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+    # Reporting
+
+    def print_status(self):
+        print(f"\n=== Scheduler: {self.queue.qsize()} queued, {sum(job.running for job in self.jobs)} running, "
+              f"{self.notifications} notifications ({self.inserted_orders} orders) ===")
+        print(f"{'job':<9}{'interval':>9}{'runs':>6}{'fail':>6}{'coalesced':>10}{'last s':>9}{'avg s':>8}"
+              f"{'max s':>8}{'wait s':>8}")
+        for job in self.jobs:
+            st = job.stats
+            last = f"{st['last_seconds']:9.2f}" if st["last_seconds"] is not None else f"{'-':>9}"
+            avg = f"{st['total_seconds'] / st['runs']:8.2f}" if st["runs"] else f"{'-':>8}"
+            wait = f"{st['last_wait']:8.2f}" if st["last_wait"] is not None else f"{'-':>8}"
+            print(f"{job.name:<9}{job.interval:>9g}{st['runs']:>6}{st['failures']:>6}{st['coalesced']:>10}"
+                  f"{last}{avg}{st['max_seconds']:8.2f}{wait}")
+
+    async def _status_loop(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL_SECONDS)
+            self.print_status()
+
+    async def run(self, duration=None):
+        """Run until cancelled, or for `duration` seconds; a job that is running then is finished first."""
+        self.queue = asyncio.Queue()
+        self._wake = asyncio.Event()
+        tasks = [asyncio.create_task(self._ticker()), asyncio.create_task(self._status_loop())]
+        tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.listen:
+            tasks.append(asyncio.create_task(self._listener()))
+        try:
+            await asyncio.sleep(duration) if duration else await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._executor.shutdown(wait=True)
+
+
+def install_notify_trigger():
+    """Create (or replace) the trigger that sends NOTIFY ORDERS_CHANNEL on inserts into orders."""
+    execute_non_query(NOTIFY_TRIGGER_SQL)
+
+
+def notify_trigger_installed(cur):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = to_regclass('orders') AND tgname = %s);",
+                (NOTIFY_TRIGGER_NAME,))
+    return cur.fetchone()[0]
+
+
+def build_jobs(args):
+    """Jobs for args.jobs, using the report options of main.py."""
+    import main
+    from rollups import create_rollups, refresh_rollups
+
+    def refresh():
+        timings = refresh_rollups()
+        print(f"Refreshed {len(timings)} rollups in {sum(timings.values()):.2f}s")
+
+    runners = {"rollups": refresh, "charts": lambda: main.run_charts(args),
+               "slider": lambda: main.run_slider(args), "export": lambda: main.run_export(args)}
+    if "rollups" in args.jobs:
+        create_rollups()
+    return [Job(name, runners[name], args.intervals[name]) for name in JOB_INTERVALS if name in args.jobs]
+
+
+def _job_interval(text):
+    name, _, seconds = text.partition("=")
+    if name not in JOB_INTERVALS or not seconds:
+        raise argparse.ArgumentTypeError(f"expected JOB=SECONDS with JOB one of {', '.join(JOB_INTERVALS)}")
+    return name, float(seconds)
+
+
+if __name__ == "__main__":
+    from main import SLIDER_OUTPUT, add_report_arguments, parse_report_args
+
+    parser = argparse.ArgumentParser(description="Run the report stages on a schedule and when orders arrive.")
+    parser.add_argument("--jobs", default=",".join(JOB_INTERVALS),
+                        help=f"comma-separated jobs to run (default: {','.join(JOB_INTERVALS)})")
+    parser.add_argument("--interval", type=_job_interval, action="append", default=[], metavar="JOB=SECONDS",
+                        help="override a job's interval, e.g. --interval charts=30 (repeatable)")
+    parser.add_argument("--poll", action="store_true", help="run every interval instead of on inserts")
+    parser.add_argument("--workers", type=int, default=SCHEDULER_WORKERS, help="jobs that can run at once")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--dbname", help=f"target database (default {DB_CONFIG['dbname']})")
+    add_report_arguments(parser)
+    parser.add_argument("--metrics-port", type=int, help="serve scheduler and report metrics on this port")
+    args = parse_report_args(parser)
+    args.jobs = [name.strip() for name in args.jobs.split(",") if name.strip()]
+    unknown = set(args.jobs) - set(JOB_INTERVALS)
+    if unknown:
+        parser.error(f"unknown jobs: {', '.join(sorted(unknown))}")
+    args.intervals = {**JOB_INTERVALS, **dict(args.interval)}
+    # Never open a browser from the scheduler
+    args.show, args.slider_output = False, args.slider_out or SLIDER_OUTPUT
+
+    if args.dbname:
+        DB_CONFIG["dbname"] = args.dbname
+    if not args.poll:
+        install_notify_trigger()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    scheduler = ReportScheduler(build_jobs(args), args.workers, listen=not args.poll)
+    mode = "every interval" if args.poll else f"on inserts (NOTIFY {ORDERS_CHANNEL}), at most once per interval"
+    print(f"Scheduling {', '.join(job.name for job in scheduler.jobs)} {mode}. Press Ctrl+C to stop.")
+    try:
+        asyncio.run(scheduler.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    scheduler.print_status()
+    print(pool_summary())
+    close_pool()
@@ -0,0 +1,222 @@
+import argparse
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from db import DB_CONFIG, pooled_connection, pool_summary
+
+# Bulk review seeding for demos and performance tests. Reviews are generated
+# in NumPy, chunk by chunk, and loaded with COPY, so millions of rows take
+# seconds instead of one INSERT round trip each. Scores depend on how late the
+# order was delivered (blending from ON_TIME_SCORE_P to LATE_SCORE_P over
+# LATE_FULL_DAYS), and a review is created shortly after the delivery date, so
+# the delivery-vs-review chart shows a realistic pattern. The same seed on the
+# same orders gives the same reviews.
+
+# Probe used by main.seed_reviews_if_empty (also part of the index advisor workload)
+REVIEW_SEED_PROBE_SQL = "SELECT EXISTS (SELECT 1 FROM reviews);"
+
+# Delivered orders as (order_id, delivered at, days late); LIMIT NULL means no limit
+_ORDER_COLUMNS = """
+    SELECT o.order_id,
+           COALESCE(o.order_delivered_customer_date, o.order_estimated_delivery_date, o.order_purchase_timestamp),
+           EXTRACT(EPOCH FROM (o.order_delivered_customer_date - o.order_estimated_delivery_date))::float8 / 86400
+    FROM orders o
+"""
+REVIEW_SEED_ORDERS_SQL = _ORDER_COLUMNS + """
+    LEFT JOIN reviews r ON r.order_id = o.order_id
+    WHERE o.order_status = 'delivered' AND r.order_id IS NULL
+    LIMIT %s;
+"""
+DELIVERED_ORDERS_SQL = _ORDER_COLUMNS + """
+    WHERE o.order_status = 'delivered'
+    LIMIT %s;
+"""
+
+REVIEW_COPY_SQL = """
+    COPY reviews (review_id, order_id, review_score, review_comment_title, review_comment_message,
+                  review_creation_date, review_answer_timestamp)
+    FROM STDIN
+"""
+
+SEED_CHUNK_ROWS = 200000
+
+# P(score = 1..5) for orders delivered on time and for orders LATE_FULL_DAYS or more late
+ON_TIME_SCORE_P = [0.09, 0.03, 0.08, 0.20, 0.60]
+LATE_SCORE_P = [0.46, 0.10, 0.15, 0.12, 0.17]
+LATE_FULL_DAYS = 10
+# P(review has a comment) per score: unhappy customers write more
+COMMENT_P = [0.75, 0.70, 0.55, 0.35, 0.30]
+# The survey is created 1 + Poisson(mean) days after delivery and answered
+# an exponential number of hours later
+CREATION_DELAY_MEAN_DAYS = 0.5
+ANSWER_DELAY_MEAN_HOURS = 60
+
+# (titles, messages) for scores 1-2, 3 and 4-5
+REVIEW_TEXTS = {
+    "negative": (["Bad", "Late delivery"],
+                 ["Item arrived late but works.", "Not satisfied with packaging.", "Could be better."]),
+    "neutral": (["Ok", "Average"],
+                ["Could be better.", "Product met expectations."]),
+    "positive": (["Great", "Awesome", "As expected"],
+                 ["Excellent quality!", "Delivery was on time.", "Good value for money.",
+                  "Product met expectations."]),
+}
+SCORE_SENTIMENT = {1: "negative", 2: "negative", 3: "neutral", 4: "positive", 5: "positive"}
+
+
+def load_seed_orders(limit=None, only_missing=False):
+    """(order ids, delivered-at datetime64 array, days-late float array) of delivered orders."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(REVIEW_SEED_ORDERS_SQL if only_missing else DELIVERED_ORDERS_SQL, (limit,))
+            rows = cur.fetchall()
+    order_ids = np.array([row[0] for row in rows], dtype=object)
+    delivered_at = np.array([row[1] for row in rows], dtype="datetime64[us]")
+    days_late = np.array([row[2] for row in rows], dtype="float64")  # NULL -> NaN
+    return order_ids, delivered_at, days_late
+
+
+def score_probabilities(days_late):
+    """Per-row cumulative P(score <= 1..5), shape (n, 5)."""
+    weight = np.clip(np.nan_to_num(days_late) / LATE_FULL_DAYS, 0, 1)[:, None]
+    return np.cumsum(ON_TIME_SCORE_P) * (1 - weight) + np.cumsum(LATE_SCORE_P) * weight
+
+
+def generate_reviews(rng, order_ids, delivered_at, days_late):
+    """DataFrame of one synthetic review per given order, in reviews column order."""
+    n = len(order_ids)
+    cumulative = score_probabilities(days_late)
+    scores = 1 + (rng.random(n)[:, None] > cumulative[:, :4]).sum(axis=1)
+
+    created = (delivered_at.astype("datetime64[D]") + 1
+               + rng.poisson(CREATION_DELAY_MEAN_DAYS, n).astype("timedelta64[D]"))
+    answer_delay = (rng.exponential(ANSWER_DELAY_MEAN_HOURS * 3600, n)).astype("timedelta64[s]")
+    answered = created.astype("datetime64[s]") + answer_delay
+
+    titles = np.full(n, None, dtype=object)
+    messages = np.full(n, None, dtype=object)
+    has_comment = rng.random(n) < np.take(COMMENT_P, scores - 1)
+    for sentiment, (title_options, message_options) in REVIEW_TEXTS.items():
+        sel = has_comment & np.isin(scores, [s for s, name in SCORE_SENTIMENT.items() if name == sentiment])
+        count = int(sel.sum())
+        titles[sel] = np.array(title_options, dtype=object)[rng.integers(0, len(title_options), count)]
+        messages[sel] = np.array(message_options, dtype=object)[rng.integers(0, len(message_options), count)]
+
+    hex_ids = rng.bytes(16 * n).hex()
+    review_ids = [hex_ids[i:i + 32] for i in range(0, 32 * n, 32)]
+    return pd.DataFrame({
+        "review_id": review_ids,
+        "order_id": order_ids,
+        "review_score": scores,
+        "review_comment_title": titles,
+        "review_comment_message": messages,
+        "review_creation_date": created.astype("datetime64[s]"),
+        "review_answer_timestamp": answered,
+    })
+
+
+def copy_text(frame):
+    """Tab-separated COPY text of a generate_reviews() frame (faster than to_csv)."""
+    columns = [
+        frame["review_id"].tolist(),
+        frame["order_id"].tolist(),
+        frame["review_score"].to_numpy().astype(str).tolist(),
+        frame["review_comment_title"].fillna("\\N").tolist(),
+        frame["review_comment_message"].fillna("\\N").tolist(),
+        _copy_timestamps(frame["review_creation_date"].to_numpy()),
+        _copy_timestamps(frame["review_answer_timestamp"].to_numpy()),
+    ]
+    return "\n".join(map("\t".join, zip(*columns))) + "\n"
+
+
+def _copy_timestamps(values):
+    # An order with no timestamp at all has NaT dates; COPY needs \N, not "NaT"
+    return np.where(np.isnat(values), "\\N", np.datetime_as_string(values, unit="s")).tolist()
+
+
+def bulk_seed_reviews(count=None, seed=None, only_missing=False, chunk_rows=SEED_CHUNK_ROWS, verbose=True):
+    """Generate `count` reviews (default: one per selected order) and COPY them into reviews.
+
+    only_missing=True only reviews delivered orders that have no review yet, at
+    most one each. Otherwise reviews are spread over all delivered orders,
+    repeating orders once `count` exceeds their number. Returns the stats of
+    the run: rows, generate/copy seconds, bytes sent and the score shares.
+    """
+    start = time.perf_counter()
+    order_ids, delivered_at, days_late = load_seed_orders(count if only_missing else None, only_missing)
+    n_orders = len(order_ids)
+    count = n_orders if count is None or only_missing else count
+    stats = {"rows": 0, "orders": n_orders, "load_seconds": time.perf_counter() - start,
+             "generate_seconds": 0.0, "copy_seconds": 0.0, "bytes": 0, "score_counts": [0] * 5}
+    if not n_orders or not count:
+        return stats
+
+    rng = np.random.default_rng(seed)
+    # Each order at most once until all have been used
+    order_pick = rng.permutation(n_orders) if count <= n_orders else None
+
+    def make_chunk(offset):
+        t0 = time.perf_counter()
+        n = min(chunk_rows, count - offset)
+        pick = order_pick[offset:offset + n] if order_pick is not None else rng.integers(0, n_orders, n)
+        frame = generate_reviews(rng, order_ids[pick], delivered_at[pick], days_late[pick])
+        score_counts = np.bincount(frame["review_score"], minlength=6)[1:]
+        return n, score_counts, copy_text(frame), time.perf_counter() - t0
+
+    # The next chunk is generated on a worker thread while the current one is
+    # sent; chunks are still generated in order, so the seed stays reproducible
+    offsets = range(0, count, chunk_rows)
+    with pooled_connection() as conn, ThreadPoolExecutor(max_workers=1) as producer:
+        with conn.cursor() as cur:
+            pending = producer.submit(make_chunk, 0)
+            for idx in range(len(offsets)):
+                n, score_counts, text, generate_seconds = pending.result()
+                if idx + 1 < len(offsets):
+                    pending = producer.submit(make_chunk, offsets[idx + 1])
+                t0 = time.perf_counter()
+                cur.copy_expert(REVIEW_COPY_SQL, io.StringIO(text))
+                stats["copy_seconds"] += time.perf_counter() - t0
+                stats["generate_seconds"] += generate_seconds
+                stats["bytes"] += len(text)
+                stats["rows"] += n
+                stats["score_counts"] = [a + int(b) for a, b in zip(stats["score_counts"], score_counts)]
+                if verbose and count > chunk_rows:
+                    print(f"  {stats['rows']}/{count} reviews")
+            t0 = time.perf_counter()
+            cur.execute("ANALYZE reviews;")
+    stats["copy_seconds"] += time.perf_counter() - t0
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def print_seed_report(stats):
+    if not stats["rows"]:
+        print("No delivered orders to review; nothing seeded.")
+        return
+    seconds = stats["seconds"]
+    shares = " ".join(f"{score}:{count / stats['rows']:.0%}" for score, count in enumerate(stats["score_counts"], 1))
+    print(f"Seeded {stats['rows']} reviews over {stats['orders']} delivered orders in {seconds:.2f}s "
+          f"({stats['rows'] / seconds:,.0f} rows/s, {stats['bytes'] / 1024 / 1024:.1f} MB copied)")
+    print(f"  load orders {stats['load_seconds']:.2f}s, generate {stats['generate_seconds']:.2f}s "
+          f"(overlaps COPY), COPY + ANALYZE {stats['copy_seconds']:.2f}s")
+    print(f"  scores {shares}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load synthetic reviews with COPY.")
+    parser.add_argument("--count", type=int, help="reviews to insert (default: one per delivered order)")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible data")
+    parser.add_argument("--only-missing", action="store_true", help="only orders without a review, one each")
+    parser.add_argument("--chunk-rows", type=int, default=SEED_CHUNK_ROWS)
+    parser.add_argument("--dbname", help=f"target database (default {DB_CONFIG['dbname']})")
+    args = parser.parse_args()
+
+    if args.dbname:
+        DB_CONFIG["dbname"] = args.dbname
+    print(f"Seeding reviews into {DB_CONFIG['dbname']}...")
+    print_seed_report(bulk_seed_reviews(args.count, args.seed, args.only_missing, args.chunk_rows))
+    print(pool_summary())